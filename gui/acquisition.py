@@ -0,0 +1,244 @@
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from protocol import ProtocolDecoder, PROTOCOL_V2, ENCODING_FLOAT, FIELD_MASK_ALL
+from telemetry_buffer import TELEMETRY_DTYPE, REPORT_FIELDS
+
+# 共享記憶體檔頭: 累計寫入筆數 (序號) 與接收端統計
+HEADER_DTYPE = np.dtype(
+    [
+        ("write_count", "<u8"),
+        ("resyncs", "<u8"),
+        ("lost", "<u8"),
+        ("crc_errors", "<u8"),
+        ("version", "<u8"),
+        ("status", "<i8"),
+    ]
+)
+HEADER_SIZE = 64
+# 擷取行程開啟序列埠的狀態 (檔頭 status)
+STATUS_OPENING = 0
+STATUS_OPEN = 1
+STATUS_FAILED = -1
+# 等待擷取行程開啟序列埠的時間 (s), 包含啟動行程與匯入模組
+OPEN_TIMEOUT = 10.0
+# 共享環形緩衝區預設容量 (筆), 100 Hz 回報約 10 分鐘, 1 kHz 約 1 分鐘
+RING_CAPACITY = 1 << 16
+# 單次讀取序列埠的最大位元組數
+READ_CHUNK = 65536
+
+
+class SharedRing:
+    """放在共享記憶體中的單一寫入者環形緩衝區
+
+    寫入端先寫資料再更新 write_count; 讀取端以自己的序號比對 write_count,
+    落後超過 capacity 的部分視為 overrun 並回報遺失筆數。
+    """
+
+    def __init__(self, capacity=RING_CAPACITY, name=None, readonly=False):
+        self.capacity = int(capacity)
+        size = HEADER_SIZE + self.capacity * TELEMETRY_DTYPE.itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.shm.buf)
+        self.records = np.ndarray(
+            self.capacity, dtype=TELEMETRY_DTYPE, buffer=self.shm.buf, offset=HEADER_SIZE
+        )
+        if name is None:
+            self.header[...] = 0
+        if readonly:
+            self.records.flags.writeable = False
+
+    def write(self, records):
+        n = len(records)
+        count = int(self.header["write_count"])
+        if n > self.capacity:
+            records = records[-self.capacity :]
+            count += n - self.capacity
+            n = self.capacity
+        idx = (count + np.arange(n)) % self.capacity
+        self.records[idx] = records
+        self.header["write_count"] = count + n
+
+    def read(self, since):
+        """讀取序號 since 之後的資料, 回傳 (資料副本, 下一個序號, 遺失筆數)"""
+        end = int(self.header["write_count"])
+        lost = max(0, end - since - self.capacity)
+        start = since + lost
+        data = self.records[(start + np.arange(end - start)) % self.capacity]
+        # 複製期間被寫入端覆寫的部分也算遺失
+        overwritten = max(0, int(self.header["write_count"]) - self.capacity - start)
+        if overwritten:
+            overwritten = min(overwritten, len(data))
+            data = data[overwritten:]
+            lost += overwritten
+        return data, end, lost
+
+    def close(self):
+        # 先釋放 numpy 視圖, 否則 mmap 無法關閉
+        self.header = self.records = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def _acquire(port, baudrate, simulated, shm_name, capacity, start_time, protocol, batch, session, commands, stop):
+    """擷取行程: 讀序列埠、解碼並寫入共享記憶體, 同時寫出 GUI 送來的命令
+
+    協定協商只在這裡進行 (解碼器在本行程); 開啟結果寫入檔頭 status 讓 GUI 行程得知。
+    """
+    ring = SharedRing(capacity, name=shm_name)
+    try:
+        if simulated:
+            from simulator import SimulatedSerial
+
+            ser = SimulatedSerial()
+        else:
+            import serial
+
+            ser = serial.Serial(port, baudrate, timeout=0.01)
+    except (OSError, ValueError):
+        # serial.SerialException 是 OSError 的子類別
+        ring.header["status"] = STATUS_FAILED
+        ring.close()
+        return
+    ring.header["status"] = STATUS_OPEN
+    encoding, field_mask, down_sample = session
+    decoder = ProtocolDecoder(
+        protocol, batch, encoding=encoding, field_mask=field_mask, down_sample=down_sample
+    )
+    time_counter = start_time
+    try:
+        # 連線後先協商協定版本
+        ser.write(decoder.hello())
+        while not stop.is_set():
+            while True:
+                try:
+                    ser.write(commands.get_nowait())
+                except queue.Empty:
+                    break
+            chunk = ser.read(min(max(ser.in_waiting, 1), READ_CHUNK))
+            reports = decoder.feed(chunk)
+            hello = decoder.retry_hello()
+            if hello is not None:
+                # 裝置重置期間遺失了 proto_cfg_t
+                ser.write(hello)
+            n = len(reports)
+            if n == 0:
+                continue
+            records = np.empty(n, dtype=TELEMETRY_DTYPE)
+            records["time"] = time_counter + np.cumsum(reports["dt"])
+            records["host_time"] = time.time()
+            for name in REPORT_FIELDS:
+                records[name] = reports[name]
+            time_counter = records["time"][-1]
+            ring.write(records)
+            ring.header["resyncs"] = decoder.resyncs
+            ring.header["lost"] = decoder.lost
+            ring.header["crc_errors"] = decoder.crc_errors
+            ring.header["version"] = decoder.version or 0
+    finally:
+        ser.close()
+        ring.close()
+
+
+class AcquisitionProcess:
+    """在獨立行程中接收與解碼, GUI 行程只從共享記憶體取資料
+
+    介面與 serial.Serial 的 write() / close() / is_open 相容, 可直接交給
+    TransmitWorker; 命令經由佇列送到擷取行程寫出。poll() 取回新的 TELEMETRY_DTYPE 資料。
+    建構時等待擷取行程開啟序列埠, 失敗時引發 OSError。協定由擷取行程自行協商, 不需要送 proto_cfg_t。
+    """
+
+    def __init__(
+        self,
+        port,
+        baudrate=921600,
+        simulated=False,
+        capacity=RING_CAPACITY,
+        start_time=0.0,
+        protocol=PROTOCOL_V2,
+        batch=1,
+        encoding=ENCODING_FLOAT,
+        field_mask=FIELD_MASK_ALL,
+        down_sample=0,
+    ):
+        self.port = port
+        self.ring = SharedRing(capacity, readonly=True)
+        self.overruns = 0  # GUI 來不及讀取而遺失的筆數
+        self._next = 0
+        # spawn: 不繼承 Tk / matplotlib 的狀態
+        ctx = mp.get_context("spawn")
+        self._commands = ctx.Queue()
+        self._stop = ctx.Event()
+        self.process = ctx.Process(
+            target=_acquire,
+            args=(
+                port,
+                baudrate,
+                simulated,
+                self.ring.name,
+                capacity,
+                start_time,
+                protocol,
+                batch,
+                (encoding, field_mask, down_sample),
+                self._commands,
+                self._stop,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+        self._closed = False
+        self._wait_open(OPEN_TIMEOUT)
+
+    def _wait_open(self, timeout):
+        deadline = time.monotonic() + timeout
+        while self.ring.header["status"] == STATUS_OPENING:
+            if not self.process.is_alive() or time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+        if self.ring.header["status"] != STATUS_OPEN:
+            self.close()
+            raise OSError(f"acquisition process could not open {self.port}")
+
+    @property
+    def is_open(self):
+        return not self._closed and self.process.is_alive()
+
+    def write(self, data):
+        self._commands.put(bytes(data))
+        return len(data)
+
+    def poll(self):
+        """回傳上次呼叫後新增的資料"""
+        records, self._next, lost = self.ring.read(self._next)
+        self.overruns += lost
+        return records
+
+    @property
+    def resyncs(self):
+        return int(self.ring.header["resyncs"])
+
+    @property
+    def lost(self):
+        return int(self.ring.header["lost"])
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.close()
+        self.ring.unlink()
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import tkinter as tk
+
+from serial_tx import TransmitWorker
+
+# 沒有檔案描述子可等待時 (Windows COM 埠、模擬器) 的輪詢間隔 (秒)
+POLL_INTERVAL = 0.002
+# Tk 事件處理間隔 (秒)
+TK_INTERVAL = 1 / 240
+
+
+async def _readable(fd):
+    """等待檔案描述子可讀"""
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    loop.add_reader(fd, lambda: fut.done() or fut.set_result(None))
+    try:
+        await fut
+    finally:
+        loop.remove_reader(fd)
+
+
+async def read(ser, max_size, poll_interval=POLL_INTERVAL):
+    """讀取協程: 等到有資料後一次讀出 (最多 max_size), 不阻塞事件迴圈
+
+    POSIX 上的 serial.Serial 以 add_reader 等待, 沒有 fileno() 的物件改為輪詢 in_waiting。
+    """
+    fileno = getattr(ser, "fileno", None) if os.name == "posix" else None
+    while ser.is_open:
+        n = ser.in_waiting
+        if n:
+            return ser.read(min(n, max_size))
+        if fileno is not None:
+            await _readable(fileno())
+        else:
+            await asyncio.sleep(poll_interval)
+    return b""
+
+
+class AsyncTransmitter(TransmitWorker):
+    """TransmitWorker 的 asyncio 版本, 由 run() 協程寫出封包
+
+    合併規則與統計和 TransmitWorker 相同。submit() 可從任何執行緒呼叫
+    (例如軌跡串流), 以 call_soon_threadsafe 喚醒寫入協程。
+    """
+
+    def __init__(self, maxsize=64, history=1000):
+        self.loop = None
+        self._wake = None
+        super().__init__(maxsize, history)
+
+    def start(self):
+        # 不建立執行緒, 寫入協程由 run() 在事件迴圈中執行
+        pass
+
+    def _notify(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._wake.set)
+
+    def submit(self, data, key=None):
+        ok = super().submit(data, key)
+        if ok:
+            self._notify()
+        return ok
+
+    async def run(self):
+        """寫入協程"""
+        self.loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while self.is_running:
+            # 先清除再檢查, 避免遺漏 submit() 的喚醒
+            self._wake.clear()
+            with self._cond:
+                item = self._pop() if self._pending else None
+            if item is None:
+                await self._wake.wait()
+                continue
+            data, submit_time, ser = item
+            self._write(ser, data, submit_time)
+
+    def stop(self):
+        super().stop()
+        self._notify()
+
+
+async def run_tk(root, interval=TK_INTERVAL):
+    """以協程驅動 Tk 事件處理, 取代 root.mainloop(); 視窗關閉後返回
+
+    沒有 mainloop 時只有本執行緒能呼叫 Tk (包含 root.after), 其他執行緒要以
+    loop.call_soon_threadsafe() 把畫面更新交給事件迴圈。
+    """
+    while True:
+        try:
+            root.update()
+        except tk.TclError:
+            return
+        await asyncio.sleep(interval)
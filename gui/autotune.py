@@ -0,0 +1,161 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from protocol import VELOCITY_MODE, POSITION_MODE
+from simulator import FirmwareSimulator, PlantModel, DEFAULT_VEL_PID, DEFAULT_POS_PID
+
+# 評分項目 (全部越小越好)
+OBJECTIVES = ("rise_time", "overshoot", "settling_time", "iae")
+
+# 預設的步階測試
+POSITION_STEP = 100.0  # mm
+VELOCITY_STEP = 100.0  # mm/s
+STEP_DURATION = 1.5  # s
+
+
+def step_metrics(t, y, target, y0=0.0, band=0.02):
+    """計算步階響應指標
+
+    rise_time: 10%→90% 時間, overshoot: 超越量 (%), settling_time: 最後一次離開
+    ±band 誤差帶的時間, iae: 誤差絕對值積分, steady_state_error: 最後 10% 的平均誤差。
+    沒有達到 90% 或最後仍未收斂時對應指標為 inf。
+    """
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    span = target - y0
+    if span == 0 or len(y) < 2:
+        return dict.fromkeys(OBJECTIVES + ("steady_state_error",), 0.0)
+    yn = (y - y0) / span
+    dt = np.diff(t, prepend=t[0])
+
+    above_10 = np.flatnonzero(yn >= 0.1)
+    above_90 = np.flatnonzero(yn >= 0.9)
+    if len(above_90):
+        rise_time = t[above_90[0]] - t[above_10[0]]
+    else:
+        rise_time = np.inf
+
+    overshoot = max(0.0, float(np.nanmax(yn)) - 1.0) * 100
+
+    outside = np.flatnonzero(np.abs(yn - 1) > band)
+    if len(outside) == 0:
+        settling_time = 0.0
+    elif outside[-1] == len(yn) - 1:
+        settling_time = np.inf
+    else:
+        settling_time = t[outside[-1] + 1] - t[0]
+
+    error = target - y
+    tail = error[-max(len(error) // 10, 1) :]
+    return {
+        "rise_time": float(rise_time),
+        "overshoot": overshoot,
+        "settling_time": float(settling_time),
+        "iae": float(np.sum(np.abs(error) * dt)),
+        "steady_state_error": float(np.mean(tail)),
+    }
+
+
+def simulate_step(pid_type, gains, other_pid, plant=None, duration=STEP_DURATION):
+    """以模擬器跑一次步階, 回傳 (t, y, target)
+
+    pid_type 為 "position" 時調整位置環 (速度環固定為 other_pid), 反之亦然。
+    """
+    gains = {"Kp": gains[0], "Ki": gains[1], "Kd": gains[2]}
+    if pid_type == "position":
+        sim = FirmwareSimulator(plant, vel_pid=other_pid, pos_pid=gains, down_sample=1)
+        sim.set_target(0, POSITION_STEP, POSITION_MODE)
+        target, field = POSITION_STEP, "pos"
+    else:
+        sim = FirmwareSimulator(plant, vel_pid=gains, pos_pid=other_pid, down_sample=1)
+        sim.set_target(VELOCITY_STEP, 0, VELOCITY_MODE)
+        target, field = VELOCITY_STEP, "vel"
+    reports = sim.run(duration=duration)
+    t = np.arange(1, len(reports) + 1) / 1000.0
+    return t, reports[field], target
+
+
+def _evaluate_chunk(args):
+    """在子行程中評估一批候選參數, 回傳 (n, len(OBJECTIVES)) 分數"""
+    pid_type, candidates, other_pid, plant, duration = args
+    scores = np.empty((len(candidates), len(OBJECTIVES)))
+    for k, gains in enumerate(candidates):
+        t, y, target = simulate_step(pid_type, gains, other_pid, plant, duration)
+        if not np.all(np.isfinite(y)):
+            scores[k] = np.inf
+            continue
+        metrics = step_metrics(t, y, target)
+        scores[k] = [metrics[name] for name in OBJECTIVES]
+    return scores
+
+
+def candidate_grid(kp_range, ki_range, kd_range, n=(15, 12, 12)):
+    """在對數間距的 (Kp, Ki, Kd) 網格上產生候選參數, 範圍下限為 0 時包含 0"""
+    axes = []
+    for (lo, hi), count in zip((kp_range, ki_range, kd_range), n):
+        if lo <= 0:
+            axes.append(np.concatenate([[0.0], np.geomspace(hi / 100, hi, count - 1)]))
+        else:
+            axes.append(np.geomspace(lo, hi, count))
+    grid = np.meshgrid(*axes, indexing="ij")
+    return np.stack([g.ravel() for g in grid], axis=1)
+
+
+def pareto_front(scores):
+    """回傳非支配解的索引 (全部目標越小越好, 含 inf 的解排除)"""
+    finite = np.flatnonzero(np.all(np.isfinite(scores), axis=1))
+    s = scores[finite]
+    dominated = np.zeros(len(s), dtype=bool)
+    # 分塊比較, 避免一次建立 n*n*m 的陣列
+    block = 256
+    for start in range(0, len(s), block):
+        part = s[start : start + block, None, :]
+        better_eq = np.all(s[None, :, :] <= part, axis=2)
+        strictly = np.any(s[None, :, :] < part, axis=2)
+        dominated[start : start + block] = np.any(better_eq & strictly, axis=1)
+    return finite[~dominated]
+
+
+def tune(
+    pid_type,
+    candidates,
+    other_pid=None,
+    plant=None,
+    duration=STEP_DURATION,
+    workers=None,
+):
+    """以行程池評估所有候選參數
+
+    回傳 {"gains": (n, 3), "scores": (n, len(OBJECTIVES)), "front": Pareto 索引}
+    """
+    if other_pid is None:
+        other_pid = DEFAULT_VEL_PID if pid_type == "position" else DEFAULT_POS_PID
+    plant = plant or PlantModel()
+    candidates = np.asarray(candidates, dtype=float)
+    workers = workers or os.cpu_count() or 1
+    # 每個行程多分幾塊, 讓負載較平均
+    chunks = np.array_split(candidates, max(1, min(len(candidates), workers * 4)))
+    jobs = [(pid_type, chunk, other_pid, plant, duration) for chunk in chunks]
+    if workers == 1:
+        results = [_evaluate_chunk(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_evaluate_chunk, jobs))
+    scores = np.concatenate(results)
+    return {"gains": candidates, "scores": scores, "front": pareto_front(scores)}
+
+
+def select_gains(result, weights=None):
+    """從 Pareto 前緣以正規化加權和挑一組參數, 回傳 {"Kp", "Ki", "Kd"}"""
+    front = result["front"]
+    if len(front) == 0:
+        raise ValueError("no stable candidate")
+    scores = result["scores"][front]
+    lo = scores.min(axis=0)
+    span = np.maximum(scores.max(axis=0) - lo, 1e-12)
+    weights = np.ones(len(OBJECTIVES)) if weights is None else np.asarray(weights)
+    best = front[np.argmin(((scores - lo) / span) @ weights)]
+    kp, ki, kd = result["gains"][best]
+    return {"Kp": float(kp), "Ki": float(ki), "Kd": float(kd)}
@@ -0,0 +1,399 @@
+import argparse
+import datetime
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+# 無視窗環境: matplotlib 用 Agg, Qt 用 offscreen 平台 (需在匯入前設定)
+os.environ.setdefault("MPLBACKEND", "Agg")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+# 缺少中文字型只影響外觀, 不影響計時
+warnings.filterwarnings("ignore", message="Glyph .* missing")
+logging.getLogger("matplotlib.font_manager").setLevel(logging.ERROR)
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import gui_01_v4
+from chart_renderer import BlitRenderer
+from lod import MinMaxPyramid
+from port_monitor import LinkMonitor
+from protocol import (
+    ProtocolDecoder,
+    PROTOCOL_V1,
+    PROTOCOL_V2,
+    ENCODING_FLOAT,
+    ENCODING_INT16,
+    FIELD_MASK_ALL,
+    DEFAULT_FIELD_MASK,
+    POSITION_MODE,
+)
+from simulator import FirmwareSimulator
+from step_analysis import StepAnalyzer
+from telemetry_buffer import TelemetryBuffer, TELEMETRY_DTYPE
+
+# gui_01_v4 的繪圖與資料處理模組延後到 load_modules 才匯入
+gui_01_v4.load_modules()
+
+# 合成串流: (協定版本, 批次, 編碼, 欄位, 每幾個 1 ms 迴圈回報一次)
+STREAMS = {
+    "v1": (PROTOCOL_V1, 1, ENCODING_FLOAT, FIELD_MASK_ALL, 10),
+    "v2-float": (PROTOCOL_V2, 8, ENCODING_FLOAT, FIELD_MASK_ALL, 1),
+    "v2-int16": (PROTOCOL_V2, 8, ENCODING_INT16, DEFAULT_FIELD_MASK, 1),
+}
+# 繪圖方式: v1 pyqtgraph setData, v2 每幀清除重畫, v3 set_data + 完整 draw, v4 LOD + blit
+RENDER_STYLES = ("v1", "v2", "v3", "v4")
+# 模擬的序列埠單次讀取大小 (bytes)
+READ_SIZE = 4096
+# 每幀之間新增的樣本數 (1 kHz 回報, REFRESH_INTERVAL 20 ms)
+FRAME_SAMPLES = 20
+# 比較結果時各指標的方向: True 為越大越好
+METRICS = {
+    "packets_per_s": True,
+    "cpu_us_per_packet": False,
+    "memory_growth_bytes": False,
+    "frame_ms_p50": False,
+    "frame_ms_p99": False,
+}
+# 記憶體增長在此以下 (bytes) 視為雜訊, 不比較
+MEMORY_SLACK = 1 << 16
+
+
+def synthetic_stream(name, duration):
+    """以韌體模擬器產生 duration 秒的位元組串, 設定點每秒在 50 / 150 mm 之間切換"""
+    version, batch, encoding, field_mask, down_sample = STREAMS[name]
+    sim = FirmwareSimulator(down_sample=down_sample)
+    sim.set_protocol(version, batch, encoding, field_mask, down_sample)
+    data = bytearray()
+    for k in range(int(duration)):
+        sim.set_target(0, 150.0 if k % 2 else 50.0, POSITION_MODE)
+        data += sim.frames(duration=1.0)
+    return bytes(data)
+
+
+class _HeadlessRoot:
+    """取代 tk.Tk, after() 只計算排程的畫面數"""
+
+    def __init__(self):
+        self.scheduled = 0
+
+    def after(self, ms, func=None, *args):
+        self.scheduled += 1
+
+
+def headless_gui(name, history=gui_01_v4.HISTORY_SIZE):
+    """不建立 Tk 視窗的 PIDControlGUI, 只設定接收路徑 (store_reports / ingest) 用到的屬性"""
+    version, batch, encoding, field_mask, down_sample = STREAMS[name]
+    gui = gui_01_v4.PIDControlGUI.__new__(gui_01_v4.PIDControlGUI)
+    gui.root = _HeadlessRoot()
+    gui.telemetry = TelemetryBuffer(history)
+    gui.decoder = ProtocolDecoder(
+        version, batch, encoding=encoding, field_mask=field_mask, down_sample=down_sample
+    )
+    gui.decoder.hello()
+    gui.step_analyzer = StepAnalyzer("position")
+    gui.recorder = None
+    gui.bode_active = False
+    gui.tracer = None
+    gui.link = LinkMonitor()
+    gui.resume_pending = False
+    gui.time_counter = 0.0
+    gui.last_update_time = 0.0
+    gui.chart_pending = False
+    gui.fps_cnt = 0
+    gui.last_print_fps = math.inf  # 不輸出每秒統計
+    return gui
+
+
+def _receive(gui, data):
+    """與 receiver_loop 相同: 讀取、解碼、寫入緩衝區、ingest; 排程的畫面視為立即完成"""
+    packets = 0
+    for start in range(0, len(data), READ_SIZE):
+        reports = gui.decoder.feed(data[start : start + READ_SIZE])
+        if not len(reports):
+            continue
+        gui.ingest(gui.store_reports(reports), gui.decoder.resyncs, gui.decoder.lost)
+        gui.chart_pending = False
+        packets += len(reports)
+    return packets
+
+
+def bench_receive(name, duration):
+    data = synthetic_stream(name, duration)
+    # 第一次執行包含 numba 編譯, 不計時
+    _receive(headless_gui(name), data[: len(data) // 10])
+
+    gui = headless_gui(name)
+    wall, cpu = time.perf_counter(), time.process_time()
+    packets = _receive(gui, data)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    # 記憶體另跑一次 (tracemalloc 會拖慢計時)
+    gui = headless_gui(name)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    _receive(gui, data)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "stream": name,
+        "bytes": len(data),
+        "packets": packets,
+        "lost": gui.decoder.lost,
+        "packets_per_s": packets / wall,
+        "mb_per_s": len(data) / wall / 1e6,
+        "cpu_us_per_packet": cpu / packets * 1e6,
+        "memory_growth_bytes": after - before,
+        "memory_peak_bytes": peak - before,
+    }
+
+
+class _MatplotlibStyle:
+    """gui_01_v2 / v3 / v4 的繪圖方式, 圖表配置與 gui_01_v4.setup_charts 相同"""
+
+    def __init__(self, style, buffer):
+        self.style = style
+        self.buffer = buffer
+        self.fig = Figure(figsize=(12, 10), dpi=100, facecolor="white")
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.pos_ax = self.fig.add_subplot(2, 1, 1)
+        self.vel_ax = self.fig.add_subplot(2, 1, 2)
+        self._decorate()
+        self.lines = {}
+        if style != "v2":
+            self._plot(([], []), ([], []), ([], []), ([], []))
+        if style == "v4":
+            self.lod = MinMaxPyramid(buffer, gui_01_v4.PLOT_FIELDS)
+            self.renderer = BlitRenderer(self.canvas)
+            for line in self.lines.values():
+                self.renderer.add_line(line)
+        self.canvas.draw()
+
+    def _decorate(self):
+        for ax, title, ylabel in (
+            (self.pos_ax, "即時位置監控", "位置 (mm)"),
+            (self.vel_ax, "即時速度監控", "速度 (mm/s)"),
+        ):
+            ax.set_title(title, fontsize=16, fontweight="600", color="#2c3e50")
+            ax.set_ylabel(ylabel, color="#34495e")
+            ax.grid(True, color="#bdc3c7", linewidth=0.8)
+        self.vel_ax.set_xlabel("時間", color="#34495e")
+
+    def _plot(self, pos, target_pos, vel, target_vel):
+        for key, ax, xy, color, style in (
+            ("pos", self.pos_ax, pos, "#2E5BBA", "-"),
+            ("target_pos", self.pos_ax, target_pos, "#D73027", "--"),
+            ("vel", self.vel_ax, vel, "#1A9641", "-"),
+            ("target_vel", self.vel_ax, target_vel, "#F57C00", "--"),
+        ):
+            (self.lines[key],) = ax.plot(*xy, color=color, linewidth=2.5, linestyle=style, label=key)
+        self.pos_ax.legend(loc="upper right", frameon=True, fancybox=True, shadow=True)
+        self.vel_ax.legend(loc="upper right", frameon=True, fancybox=True, shadow=True)
+
+    def render(self):
+        if self.style == "v4":
+            self.lod.update()
+            for field, line in self.lines.items():
+                line.set_data(*self.lod.query(field, max_points=gui_01_v4.PLOT_POINTS))
+            self.renderer.update()
+            return
+        data = self.buffer.view()
+        t = data["time"]
+        if self.style == "v2":
+            self.pos_ax.clear()
+            self.vel_ax.clear()
+            self._decorate()
+            self._plot(*[(t, data[field]) for field in ("pos", "target_pos", "vel", "target_vel")])
+        else:
+            for field, line in self.lines.items():
+                line.set_data(t, data[field])
+            for ax in (self.pos_ax, self.vel_ax):
+                ax.relim()
+                ax.autoscale_view()
+        self.canvas.draw()
+
+    def close(self):
+        pass
+
+
+class _PyqtgraphStyle:
+    """gui_01_v1 的繪圖方式: PlotWidget.setData, 以 grab() 強制完成一次繪製"""
+
+    _app = None
+
+    def __init__(self, buffer):
+        from PyQt5.QtWidgets import QApplication, QVBoxLayout, QWidget
+        import pyqtgraph as pg
+
+        if _PyqtgraphStyle._app is None:
+            _PyqtgraphStyle._app = QApplication.instance() or QApplication(sys.argv[:1])
+        self.buffer = buffer
+        self.widget = QWidget()
+        layout = QVBoxLayout()
+        self.curves = {}
+        for title, fields, colors in (
+            ("即時位置監控", ("pos", "target_pos"), ("#2E5BBA", "#D73027")),
+            ("即時速度監控", ("vel", "target_vel"), ("#1A9641", "#F57C00")),
+        ):
+            plot = pg.PlotWidget(title=title)
+            for field, color in zip(fields, colors):
+                dash = [8, 4] if field.startswith("target") else None
+                self.curves[field] = plot.plot(pen=pg.mkPen(color=color, width=2.5, dash=dash))
+            layout.addWidget(plot)
+        self.widget.setLayout(layout)
+        self.widget.resize(1200, 1000)
+        self.widget.show()
+
+    def render(self):
+        data = self.buffer.view()
+        for field, curve in self.curves.items():
+            curve.setData(data["time"], data[field])
+        self.widget.grab()
+
+    def close(self):
+        self.widget.close()
+
+
+def _telemetry(n, start=0):
+    """1 kHz 的合成遙測 (正弦位置與速度, 方波設定點)"""
+    records = np.zeros(n, dtype=TELEMETRY_DTYPE)
+    t = (start + np.arange(n)) * 1e-3
+    records["time"] = t
+    records["pos"] = 100 + 50 * np.sin(t)
+    records["target_pos"] = np.where(np.floor(t) % 2, 150.0, 50.0)
+    records["vel"] = 50 * np.cos(t) + np.random.default_rng(start).normal(0, 2, n)
+    records["target_vel"] = 50 * np.cos(t)
+    return records
+
+
+def bench_render(style, points, frames):
+    buffer = TelemetryBuffer(points)
+    buffer.extend(_telemetry(points))
+    if style == "v1":
+        renderer = _PyqtgraphStyle(buffer)
+    else:
+        renderer = _MatplotlibStyle(style, buffer)
+    times = np.zeros(frames)
+    total = points
+    try:
+        # 第一幀包含建立快取與字型, 不計
+        renderer.render()
+        for k in range(frames):
+            buffer.extend(_telemetry(FRAME_SAMPLES, total))
+            total += FRAME_SAMPLES
+            start = time.perf_counter()
+            renderer.render()
+            times[k] = time.perf_counter() - start
+    finally:
+        renderer.close()
+    times *= 1000
+    return {
+        "style": style,
+        "points": points,
+        "frames": frames,
+        "frame_ms_p50": float(np.percentile(times, 50)),
+        "frame_ms_p99": float(np.percentile(times, 99)),
+        "frame_ms_max": float(times.max()),
+        "fps": float(1000 / times.mean()),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import matplotlib
+
+    return {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+    }
+
+
+def compare(baseline, results, tolerance):
+    """逐項比較兩次結果, 回傳變差超過 tolerance (比例) 的項目"""
+    regressions = []
+    for section, key in (("receive", "stream"), ("render", "style")):
+        old = {row[key]: row for row in baseline.get(section, [])}
+        for row in results.get(section, []):
+            previous = old.get(row[key])
+            if previous is None:
+                continue
+            for metric, higher_is_better in METRICS.items():
+                if metric not in row or not previous.get(metric):
+                    continue
+                if metric == "memory_growth_bytes" and max(row[metric], previous[metric]) < MEMORY_SLACK:
+                    continue
+                ratio = row[metric] / previous[metric]
+                worse = ratio < 1 - tolerance if higher_is_better else ratio > 1 + tolerance
+                print(f"{section:8}{row[key]:10}{metric:22}{previous[metric]:12.3f}{row[metric]:12.3f}{ratio:8.2f}x{'  <-- regression' if worse else ''}")
+                if worse:
+                    regressions.append((section, row[key], metric, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="接收/解碼/緩衝/繪圖效能基準")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="結果 JSON 檔")
+    parser.add_argument("--duration", type=float, default=30, help="每種串流模擬的秒數")
+    parser.add_argument("--streams", nargs="+", choices=list(STREAMS), default=list(STREAMS))
+    parser.add_argument("--styles", nargs="+", choices=RENDER_STYLES, default=list(RENDER_STYLES))
+    parser.add_argument("--points", type=int, default=gui_01_v4.HISTORY_SIZE, help="圖表上的樣本數")
+    parser.add_argument("--frames", type=int, default=100, help="每種繪圖方式量測的幀數")
+    parser.add_argument("--compare", help="與先前的結果 JSON 比較")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="視為退步的變化比例")
+    args = parser.parse_args()
+
+    results = {"environment": environment(), "receive": [], "render": []}
+    for name in args.streams:
+        row = bench_receive(name, args.duration)
+        results["receive"].append(row)
+        print(
+            f"receive {name:10}{row['packets_per_s']:12.0f} pkt/s {row['cpu_us_per_packet']:8.2f} us/pkt "
+            f"memory +{row['memory_growth_bytes'] / 1024:.0f} KiB"
+        )
+    for style in args.styles:
+        try:
+            row = bench_render(style, args.points, args.frames)
+        except ImportError as e:  # 沒有 PyQt5 / pyqtgraph 時略過 v1
+            print(f"render  {style:10}skipped: {e}")
+            continue
+        results["render"].append(row)
+        print(f"render  {style:10}{row['frame_ms_p50']:8.2f} / {row['frame_ms_p99']:8.2f} ms (p50 / p99) {row['fps']:8.1f} fps")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"saved {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import time
+
+import numpy as np
+
+
+class BlitRenderer:
+    """持久化 Line2D 的增量繪圖器
+
+    線條只更新資料 (set_data), 背景 (座標軸、格線、圖例) 快取後每幀只 blit 資料層;
+    只有資料超出目前座標範圍時才重新縮放並完整重繪一次。
+    """
+
+    def __init__(self, canvas, x_headroom=0.25, y_margin=0.1):
+        self.canvas = canvas
+        self.fig = canvas.figure
+        self.x_headroom = x_headroom  # x 軸超出時額外預留的比例, 避免捲動時每幀重繪
+        self.y_margin = y_margin
+        self.lines = []
+        self._background = None
+        self.fps = 0
+        self.full_redraws = 0
+        self._frame_cnt = 0
+        self._last_fps_time = time.time()
+        canvas.mpl_connect("draw_event", self._on_draw)
+
+    def add_line(self, line):
+        """登記要增量更新的線條"""
+        line.set_animated(True)
+        self.lines.append(line)
+        return line
+
+    def _on_draw(self, event=None):
+        # 完整重繪 (含視窗縮放) 後重新快取背景, 再把資料層畫上去
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for line in self.lines:
+            line.axes.draw_artist(line)
+
+    def _rescale(self):
+        """資料超出目前範圍時調整座標軸, 回傳是否有變更"""
+        changed = False
+        for ax in {line.axes for line in self.lines}:
+            xs = []
+            ys = []
+            for line in self.lines:
+                if line.axes is ax and line.get_visible():
+                    x, y = line.get_data()
+                    if len(x):
+                        xs.append(np.asarray(x))
+                        ys.append(np.asarray(y))
+            if not xs:
+                continue
+            x = np.concatenate(xs)
+            y = np.concatenate(ys)
+            x_min, x_max = np.nanmin(x), np.nanmax(x)
+            if np.isnan(y).all():
+                continue
+            y_min, y_max = np.nanmin(y), np.nanmax(y)
+
+            lo, hi = ax.get_xlim()
+            if x_min < lo or x_max > hi:
+                span = max(x_max - x_min, 1e-9)
+                ax.set_xlim(x_min, x_max + span * self.x_headroom)
+                changed = True
+
+            lo, hi = ax.get_ylim()
+            if y_min < lo or y_max > hi:
+                margin = max(y_max - y_min, 1.0) * self.y_margin
+                ax.set_ylim(y_min - margin, y_max + margin)
+                changed = True
+        return changed
+
+    def update(self):
+        """在線條資料更新後呼叫, 只重繪必要的部分"""
+        if self._rescale() or self._background is None:
+            self.full_redraws += 1
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_lines()
+            self.canvas.blit(self.fig.bbox)
+
+        self._frame_cnt += 1
+        now = time.time()
+        if now - self._last_fps_time >= 1:
+            self.fps = self._frame_cnt / (now - self._last_fps_time)
+            self._frame_cnt = 0
+            self._last_fps_time = now
@@ -0,0 +1,389 @@
+import sys
+import time
+import threading
+
+import numpy as np
+import pyqtgraph as pg
+import serial
+import serial.tools.list_ports as list_ports
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import (
+    QApplication,
+    QComboBox,
+    QGroupBox,
+    QHBoxLayout,
+    QLabel,
+    QLineEdit,
+    QListWidget,
+    QListWidgetItem,
+    QMainWindow,
+    QPushButton,
+    QVBoxLayout,
+    QWidget,
+)
+
+from telemetry_buffer import TelemetryBuffer
+from protocol import (
+    FrameDecoder,
+    REPORT_PERIOD,
+    VELOCITY_MODE,
+    POSITION_MODE,
+    pack_control,
+    pack_pid_config,
+)
+from serial_tx import TransmitWorker, TARGET_KEY, PID_KEY
+from simulator import SimulatedSerial
+
+# 每台裝置的遙測歷史容量 (100 Hz 約 10 分鐘)
+HISTORY_SIZE = 60_000
+# 圖表刷新間隔 (ms)
+REFRESH_MS = 33
+# 單次讀取序列埠的最大位元組數
+READ_CHUNK = 65536
+# 模擬裝置 (可同時開多台, 名稱為 Simulator 1..N)
+SIMULATOR_PORT = "Simulator"
+SIMULATOR_COUNT = 8
+# 控制面板中代表全部裝置的選項
+ALL_DEVICES = "全部裝置"
+# 圖表格的欄數
+GRID_COLUMNS = 2
+
+
+class DeviceChannel:
+    """單一裝置的接收管線: 序列埠、解碼器、遙測緩衝區、傳送執行緒與 PID/目標狀態"""
+
+    def __init__(self, name, ser, history_size=HISTORY_SIZE):
+        self.name = name
+        self.serial = ser
+        self.decoder = FrameDecoder()
+        self.telemetry = TelemetryBuffer(history_size)
+        self.transmitter = TransmitWorker()
+        self.transmitter.serial = ser
+        self.time_counter = 0
+        self.frames = 0
+        self.drawn_total = 0  # 上次繪圖時的 telemetry.total
+
+        self.mode = "position"
+        self.target = None
+        self.position_pid = {"Kp": 1.0, "Ki": 0.1, "Kd": 0.01}
+        self.velocity_pid = {"Kp": 0.8, "Ki": 0.05, "Kd": 0.005}
+
+        self.is_running = True
+        self.thread = threading.Thread(target=self.receiver_loop, daemon=True)
+        self.thread.start()
+
+    def receiver_loop(self):
+        while self.is_running:
+            try:
+                chunk = self.serial.read(min(max(self.serial.in_waiting, 1), READ_CHUNK))
+            except (serial.SerialException, OSError) as e:
+                print(f"{self.name}: {e}")
+                break
+            reports = self.decoder.feed(chunk)
+            n = len(reports)
+            if n == 0:
+                continue
+            time_values = self.time_counter + REPORT_PERIOD * np.arange(1, n + 1)
+            self.time_counter = time_values[-1]
+            self.telemetry.extend_reports(time_values, time.time(), reports)
+            self.frames += n
+
+    def changed(self):
+        """自上次繪圖後是否有新資料"""
+        return self.telemetry.total != self.drawn_total
+
+    def send_target(self, mode, value):
+        self.mode = mode
+        self.target = value
+        if mode == "position":
+            data = pack_control(0, value, POSITION_MODE)
+        else:
+            data = pack_control(value, 0, VELOCITY_MODE)
+        self.transmitter.submit(data, key=TARGET_KEY)
+
+    def send_pid(self, pid_type, gains):
+        pid = self.position_pid if pid_type == "position" else self.velocity_pid
+        pid.update(gains)
+        type_id = POSITION_MODE if pid_type == "position" else VELOCITY_MODE
+        self.transmitter.submit(
+            pack_pid_config(pid["Kp"], pid["Ki"], pid["Kd"], type_id), key=(PID_KEY, type_id)
+        )
+
+    def close(self):
+        self.is_running = False
+        self.transmitter.stop()
+        self.serial.close()
+        self.thread.join(timeout=1)
+
+
+class DevicePanel:
+    """一台裝置在圖表格中的位置/速度兩張圖"""
+
+    def __init__(self, layout, channel, row, col):
+        self.channel = channel
+        self.position_plot = layout.addPlot(row=2 * row, col=col, title=f"{channel.name} 位置")
+        self.velocity_plot = layout.addPlot(row=2 * row + 1, col=col, title=f"{channel.name} 速度")
+        self.velocity_plot.setXLink(self.position_plot)
+        self.position_curve = self.position_plot.plot(pen=pg.mkPen("#2E5BBA", width=1.5))
+        self.target_position_curve = self.position_plot.plot(
+            pen=pg.mkPen("#D73027", width=1.5, dash=[6, 3])
+        )
+        self.velocity_curve = self.velocity_plot.plot(pen=pg.mkPen("#1A9641", width=1.5))
+        self.target_velocity_curve = self.velocity_plot.plot(
+            pen=pg.mkPen("#F57C00", width=1.5, dash=[6, 3])
+        )
+        for plot in (self.position_plot, self.velocity_plot):
+            plot.setDownsampling(auto=True, mode="peak")
+            plot.setClipToView(True)
+            plot.showGrid(x=True, y=True)
+
+    def update(self):
+        channel = self.channel
+        channel.drawn_total = channel.telemetry.total
+        data = channel.telemetry.view()
+        time_data = data["time"]
+        self.position_curve.setData(time_data, data["pos"], skipFiniteCheck=True)
+        self.target_position_curve.setData(time_data, data["target_pos"])
+        self.velocity_curve.setData(time_data, data["vel"], skipFiniteCheck=True)
+        self.target_velocity_curve.setData(time_data, data["target_vel"])
+
+
+class MultiDeviceDashboard(QMainWindow):
+    """同時監控與控制多台線性滑軌控制器
+
+    每台裝置有獨立的接收執行緒、解碼器、遙測緩衝區與傳送執行緒; 所有圖表放在同一個
+    GraphicsLayoutWidget, 單一計時器每次只重繪有新資料的裝置。
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        super().__init__()
+        self.setWindowTitle("PID 多裝置監控")
+        self.setGeometry(100, 100, 1600, 1000)
+        self.history_size = history_size
+        self.channels = {}
+        self.panels = {}
+        self.frame_cnt = 0
+        self.redraw_cnt = 0
+        self.last_print_fps = time.time()
+
+        main_layout = QHBoxLayout()
+        main_layout.addWidget(self.create_control_panel(), 1)
+        self.chart_layout = pg.GraphicsLayoutWidget()
+        main_layout.addWidget(self.chart_layout, 4)
+        central_widget = QWidget()
+        central_widget.setLayout(main_layout)
+        self.setCentralWidget(central_widget)
+
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.update_charts)
+        self.timer.start(REFRESH_MS)
+
+    def create_control_panel(self):
+        panel = QWidget()
+        layout = QVBoxLayout()
+
+        title = QLabel("PID 多裝置監控")
+        title.setStyleSheet("font-size: 20px; font-weight: bold; color: #333333;")
+        layout.addWidget(title)
+
+        # 連線設定: 勾選要開啟的序列埠
+        connection_group = QGroupBox("連線設定")
+        connection_layout = QVBoxLayout()
+        self.port_list = QListWidget()
+        ports = [f"{SIMULATOR_PORT} {k + 1}" for k in range(SIMULATOR_COUNT)]
+        for port, desc, hwid in sorted(list_ports.comports()):
+            print(f"  {port}: {desc} [{hwid}]")
+            ports.append(f"{port} {desc}")
+        for port in ports:
+            item = QListWidgetItem(port)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Unchecked)
+            self.port_list.addItem(item)
+        connection_layout.addWidget(self.port_list)
+        connect_button = QPushButton("套用連線")
+        connect_button.clicked.connect(self.apply_connections)
+        connection_layout.addWidget(connect_button)
+        connection_group.setLayout(connection_layout)
+        layout.addWidget(connection_group)
+
+        # 控制對象
+        device_group = QGroupBox("控制對象")
+        device_layout = QVBoxLayout()
+        self.device_combo = QComboBox()
+        self.device_combo.addItem(ALL_DEVICES)
+        self.device_combo.currentTextChanged.connect(self.on_device_change)
+        device_layout.addWidget(self.device_combo)
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItems(["position", "velocity"])
+        device_layout.addWidget(self.mode_combo)
+        device_group.setLayout(device_layout)
+        layout.addWidget(device_group)
+
+        # 目標設定
+        target_group = QGroupBox("目標設定")
+        target_layout = QVBoxLayout()
+        self.target_entry = QLineEdit("50")
+        target_layout.addWidget(QLabel("目標 (mm 或 mm/s)"))
+        target_layout.addWidget(self.target_entry)
+        send_target_button = QPushButton("發送目標")
+        send_target_button.clicked.connect(self.send_target)
+        target_layout.addWidget(send_target_button)
+        target_group.setLayout(target_layout)
+        layout.addWidget(target_group)
+
+        # PID 參數 (依控制模式套用到位置或速度環)
+        pid_group = QGroupBox("PID 參數")
+        pid_layout = QVBoxLayout()
+        self.pid_entries = {}
+        for label in ("Kp", "Ki", "Kd"):
+            entry = QLineEdit()
+            pid_layout.addWidget(QLabel(label))
+            pid_layout.addWidget(entry)
+            self.pid_entries[label] = entry
+        pid_button = QPushButton("確認參數")
+        pid_button.clicked.connect(self.update_pid)
+        pid_layout.addWidget(pid_button)
+        pid_group.setLayout(pid_layout)
+        layout.addWidget(pid_group)
+        self.mode_combo.currentTextChanged.connect(self.load_pid_entries)
+        self.load_pid_entries()
+
+        self.info_label = QLabel("")
+        self.info_label.setWordWrap(True)
+        layout.addWidget(self.info_label)
+
+        layout.addStretch(1)
+        panel.setLayout(layout)
+        return panel
+
+    def open_port(self, name):
+        if name.startswith(SIMULATOR_PORT):
+            return SimulatedSerial()
+        return serial.Serial(name[: name.find(" ")], 921600)
+
+    def apply_connections(self):
+        """依勾選狀態開啟/關閉裝置, 已開啟的裝置不受影響"""
+        wanted = []
+        for k in range(self.port_list.count()):
+            item = self.port_list.item(k)
+            if item.checkState() == Qt.Checked:
+                wanted.append(item.text())
+
+        for name in list(self.channels):
+            if name not in wanted:
+                self.channels.pop(name).close()
+                print(f"close port: {name}")
+
+        for name in wanted:
+            if name in self.channels:
+                continue
+            try:
+                ser = self.open_port(name)
+            except serial.SerialException as e:
+                self.info_label.setText(f"無法開啟 {name}: {e}")
+                continue
+            self.channels[name] = DeviceChannel(name, ser, self.history_size)
+            print(f"open port: {name}")
+        self.rebuild_panels()
+
+    def rebuild_panels(self):
+        # 依目前裝置重新排列圖表格 (資料在各裝置的緩衝區, 不受影響)
+        self.chart_layout.clear()
+        self.panels = {}
+        for k, (name, channel) in enumerate(self.channels.items()):
+            panel = DevicePanel(self.chart_layout, channel, k // GRID_COLUMNS, k % GRID_COLUMNS)
+            channel.drawn_total = -1  # 新面板需要完整重繪一次
+            self.panels[name] = panel
+
+        current = self.device_combo.currentText()
+        self.device_combo.blockSignals(True)
+        self.device_combo.clear()
+        self.device_combo.addItems([ALL_DEVICES] + list(self.channels))
+        if current in self.channels:
+            self.device_combo.setCurrentText(current)
+        self.device_combo.blockSignals(False)
+
+    def selected_channels(self):
+        name = self.device_combo.currentText()
+        if name == ALL_DEVICES:
+            return list(self.channels.values())
+        return [self.channels[name]] if name in self.channels else []
+
+    def on_device_change(self, name):
+        channel = self.channels.get(name)
+        if channel is not None:
+            self.mode_combo.setCurrentText(channel.mode)
+            if channel.target is not None:
+                self.target_entry.setText(str(channel.target))
+        self.load_pid_entries()
+
+    def load_pid_entries(self, *args):
+        # 顯示目前對象 (全部裝置時為預設值) 的 PID 參數
+        channels = self.selected_channels()
+        if channels:
+            channel = channels[0]
+            pid = channel.position_pid if self.mode_combo.currentText() == "position" else channel.velocity_pid
+        elif self.mode_combo.currentText() == "position":
+            pid = {"Kp": 1.0, "Ki": 0.1, "Kd": 0.01}
+        else:
+            pid = {"Kp": 0.8, "Ki": 0.05, "Kd": 0.005}
+        for label, entry in self.pid_entries.items():
+            entry.setText(str(pid[label]))
+
+    def send_target(self):
+        mode = self.mode_combo.currentText()
+        value = float(self.target_entry.text())
+        channels = self.selected_channels()
+        for channel in channels:
+            channel.send_target(mode, value)
+        unit = "mm" if mode == "position" else "mm/s"
+        self.info_label.setText(f"目標 {value} {unit} 已送至 {len(channels)} 台裝置")
+
+    def update_pid(self):
+        pid_type = self.mode_combo.currentText()
+        gains = {label: float(entry.text()) for label, entry in self.pid_entries.items()}
+        channels = self.selected_channels()
+        for channel in channels:
+            channel.send_pid(pid_type, gains)
+        name = "位置" if pid_type == "position" else "速度"
+        self.info_label.setText(
+            f"{name}PID參數已更新 ({len(channels)} 台): Kp={gains['Kp']} Ki={gains['Ki']} Kd={gains['Kd']}"
+        )
+
+    def update_charts(self):
+        # 單次刷新只重繪有新資料的裝置
+        for panel in self.panels.values():
+            if panel.channel.changed():
+                panel.update()
+                self.redraw_cnt += 1
+
+        self.frame_cnt += 1
+        if time.time() - self.last_print_fps >= 1:
+            elapsed = time.time() - self.last_print_fps
+            self.last_print_fps = time.time()
+            pps = sum(channel.frames for channel in self.channels.values())
+            for channel in self.channels.values():
+                channel.frames = 0
+            print(
+                f"devices: {len(self.channels)}, pps: {pps / elapsed:.0f}, "
+                f"fps: {self.frame_cnt / elapsed:.1f}, redraws/s: {self.redraw_cnt / elapsed:.1f}"
+            )
+            self.frame_cnt = 0
+            self.redraw_cnt = 0
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        for channel in self.channels.values():
+            channel.close()
+        super().closeEvent(event)
+
+
+def main():
+    app = QApplication(sys.argv)
+    window = MultiDeviceDashboard()
+    window.show()
+    sys.exit(app.exec_())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import csv
+import os
+import threading
+
+import numpy as np
+
+from protocol import unpack_command
+from recorder import Replay, HEADER_SIZE, RECORD_DTYPE, to_telemetry, to_commands
+from telemetry_buffer import TelemetryBuffer, TELEMETRY_DTYPE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 沒有 pyarrow 時只能輸出 CSV
+    pa = pq = None
+
+# 副檔名對應的輸出格式
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+# 每次從來源讀取並寫出的筆數, 記憶體用量與 Parquet row group 大小都由此決定
+CHUNK_ROWS = 1 << 16
+
+# 命令事件: 送出的 control_t / pid_config_t / proto_cfg_t, 沒有的欄位為 NaN 或 -1
+EVENT_DTYPE = np.dtype(
+    [
+        ("time", "<f8"),
+        ("host_time", "<f8"),
+        ("kind", "U8"),
+        ("mode", "<i4"),
+        ("target_vel", "<f4"),  # 與封包相同的 float32
+        ("target_pos", "<f4"),
+        ("kp", "<f4"),
+        ("ki", "<f4"),
+        ("kd", "<f4"),
+        ("raw", "U64"),  # 封包內容 (hex)
+    ]
+)
+
+
+def output_format(path):
+    """依副檔名決定輸出格式"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"unsupported export format: {ext or path}")
+    return FORMATS[ext]
+
+
+def filetypes():
+    """存檔對話框的檔案類型, 第一項為預設; 沒有 pyarrow 時只提供 CSV"""
+    types = [("CSV", "*.csv")]
+    if pa is not None:
+        types += [("Parquet", "*.parquet"), ("Arrow", "*.arrow")]
+    return types
+
+
+def events_path(path):
+    """命令事件另存的檔名: <name>_events<ext>"""
+    base, ext = os.path.splitext(path)
+    return f"{base}_events{ext}"
+
+
+def to_events(commands):
+    """[(host_time, time, bytes)] 轉成 EVENT_DTYPE 陣列"""
+    out = np.zeros(len(commands), dtype=EVENT_DTYPE)
+    out[["target_vel", "target_pos", "kp", "ki", "kd"]] = (np.nan,) * 5
+    out["mode"] = -1
+    for k, (host_time, time_value, data) in enumerate(commands):
+        kind, fields = unpack_command(data)
+        row = out[k]
+        row["time"] = time_value
+        row["host_time"] = host_time
+        row["kind"] = kind
+        row["raw"] = data.hex()
+        for name in ("mode", "target_vel", "target_pos", "kp", "ki", "kd"):
+            if name in fields:
+                row[name] = fields[name]
+    return out
+
+
+def _chunks(source, chunk_rows):
+    """依序產生 (回報, 命令) 區塊, 每塊最多 chunk_rows 筆紀錄
+
+    source: 錄製檔路徑、Replay、TelemetryBuffer 或 TELEMETRY_DTYPE 陣列。
+    錄製檔以 memmap 分塊讀取, 記憶體用量與檔案大小無關。
+    """
+    if isinstance(source, str):
+        source = Replay(source)
+    if isinstance(source, Replay):
+        records = source.records
+        for start in range(0, len(records), chunk_rows):
+            chunk = records[start : start + chunk_rows]
+            yield to_telemetry(chunk), to_commands(chunk)
+        return
+    if isinstance(source, TelemetryBuffer):
+        # 接收執行緒會繼續覆寫環形緩衝區, 先複製一份 (最多 capacity 筆)
+        source = source.view().copy()
+    for start in range(0, len(source), chunk_rows):
+        yield source[start : start + chunk_rows], []
+
+
+def _source_rows(source):
+    if isinstance(source, str):
+        return max(os.path.getsize(source) - HEADER_SIZE, 0) // RECORD_DTYPE.itemsize
+    return len(source)
+
+
+class _CsvWriter:
+    def __init__(self, path, dtype):
+        self.names = dtype.names
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.names)
+
+    def write(self, rows):
+        # 整欄交給 numpy 轉成最短表示 (float32 不會多出 0.10000000149 這類位數), 比逐格格式化快很多
+        columns = [rows[name].astype(str).tolist() for name in self.names]
+        self._writer.writerows(zip(*columns))
+
+    def close(self):
+        self._file.close()
+
+
+class _ArrowWriter:
+    """Parquet (每塊一個 row group) 或 Arrow IPC 檔"""
+
+    def __init__(self, path, dtype, fmt):
+        if pa is None:
+            raise RuntimeError(f"{fmt} export requires pyarrow")
+        self.schema = pa.schema([(name, pa.from_numpy_dtype(dtype[name])) for name in dtype.names])
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self._writer = pa.ipc.new_file(path, self.schema)
+
+    def write(self, rows):
+        if len(rows):
+            columns = [pa.array(rows[name]) for name in self.schema.names]
+            self._writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def _open_writer(path, dtype, fmt):
+    if fmt == "csv":
+        return _CsvWriter(path, dtype)
+    return _ArrowWriter(path, dtype, fmt)
+
+
+def export(source, path, fmt=None, chunk_rows=CHUNK_ROWS, progress=None, stop=None):
+    """把遙測與命令事件分塊寫成 CSV / Parquet / Arrow, 回傳 (回報筆數, 事件筆數)
+
+    遙測寫到 path, 命令事件 (設定點、PID 參數、協定設定) 寫到 events_path(path), 沒有命令時不建立事件檔。
+    progress(已處理紀錄數, 總紀錄數) 每塊呼叫一次; stop 為 threading.Event, 設定後在下一塊前結束。
+    """
+    fmt = fmt or output_format(path)
+    total = _source_rows(source)
+    done = reports = events = 0
+    telemetry_writer = _open_writer(path, TELEMETRY_DTYPE, fmt)
+    event_writer = None
+    try:
+        for chunk, commands in _chunks(source, chunk_rows):
+            if stop is not None and stop.is_set():
+                break
+            telemetry_writer.write(chunk)
+            reports += len(chunk)
+            if commands:
+                if event_writer is None:
+                    event_writer = _open_writer(events_path(path), EVENT_DTYPE, fmt)
+                event_writer.write(to_events(commands))
+                events += len(commands)
+            done += len(chunk) + len(commands)
+            if progress is not None:
+                progress(done, total)
+    finally:
+        telemetry_writer.close()
+        if event_writer is not None:
+            event_writer.close()
+    return reports, events
+
+
+class Exporter:
+    """在背景執行緒執行 export(), 不阻塞 Tk 主迴圈
+
+    on_progress(已處理, 總數) 與 on_done(結果或例外) 在背景執行緒呼叫, GUI 端需以 root.after 轉回主執行緒。
+    """
+
+    def __init__(self, source, path, fmt=None, chunk_rows=CHUNK_ROWS, on_progress=None, on_done=None):
+        self.path = path
+        self.result = None
+        self.error = None
+        self._stop = threading.Event()
+        # 先檢查格式, 錯誤在呼叫端直接拋出
+        fmt = fmt or output_format(path)
+        self.thread = threading.Thread(
+            target=self._run, args=(source, fmt, chunk_rows, on_progress, on_done), daemon=True
+        )
+        self.thread.start()
+
+    @property
+    def is_running(self):
+        return self.thread.is_alive()
+
+    def _run(self, source, fmt, chunk_rows, on_progress, on_done):
+        try:
+            self.result = export(source, self.path, fmt, chunk_rows, on_progress, self._stop)
+        except Exception as e:  # 交給 on_done 回報, 背景執行緒不能直接拋出
+            self.error = e
+        if on_done is not None:
+            on_done(self.error or self.result)
+
+    def stop(self):
+        self._stop.set()
+        self.thread.join()
@@ -0,0 +1,164 @@
+import numpy as np
+
+# 每段長度 (秒) 與重疊比例, 頻率解析度約為 1 / SEGMENT_TIME
+SEGMENT_TIME = 4.0
+OVERLAP = 0.5
+# 低於此同調度的頻率點不用來計算穩定裕度
+COHERENCE_MIN = 0.6
+# 激勵能量低於最大值此比例的頻率點不採用 (多頻正弦的空頻與 Hann 窗洩漏到相鄰頻率的部分)
+EXCITATION_MIN = 0.3
+# 時間間隔超過 GAP_FACTOR 倍取樣週期 (遺失樣本) 時丟棄目前的段落
+GAP_FACTOR = 2.5
+
+
+class WelchEstimator:
+    """以 Welch 平均從串流遙測估計頻率響應
+
+    reference 為激勵 (設定點), output 為回授量, control 為控制器輸出。
+    每湊滿一段就加 Hann 窗做一次 FFT 並累加交叉頻譜, 不會重算整段歷史:
+    閉迴路 T = S_ry / S_rr, 開迴路 L = S_ry / S_re (e = r - y), 受控體 P = S_ry / S_ru。
+    取樣頻率由前幾筆資料的時間間隔決定。feed() 與 response() 可在不同執行緒呼叫。
+    """
+
+    def __init__(self, reference="target_vel", output="vel", control="output", segment_time=SEGMENT_TIME, overlap=OVERLAP):
+        self.fields = (reference, output, control)
+        self.segment_time = segment_time
+        self.overlap = overlap
+        self.fs = None
+        self.segments = 0
+        self._buf = None
+
+    def _allocate(self, times):
+        self.fs = 1.0 / float(np.median(np.diff(times)))
+        self.segment = max(int(round(self.segment_time * self.fs)), 16)
+        self.step = max(int(self.segment * (1 - self.overlap)), 1)
+        self.freq = np.fft.rfftfreq(self.segment, 1.0 / self.fs)
+        self.window = np.hanning(self.segment)
+        self._buf = np.zeros((len(self.fields), self.segment))
+        self._fill = 0
+        self._last_time = None
+        n = len(self.freq)
+        self.s_rr = np.zeros(n)
+        self.s_yy = np.zeros(n)
+        self.s_ry = np.zeros(n, dtype=complex)
+        self.s_ru = np.zeros(n, dtype=complex)
+        self.s_re = np.zeros(n, dtype=complex)
+
+    def feed(self, records):
+        """records: TELEMETRY_DTYPE 陣列, 回傳新完成的段數"""
+        if self._buf is None:
+            if len(records) < 2:
+                return 0
+            self._allocate(records["time"])
+        times = records["time"]
+        # 遺失樣本 (時間缺口) 後從新的段落開始
+        gap = GAP_FACTOR / self.fs
+        prev = times[0] if self._last_time is None else self._last_time
+        breaks = np.flatnonzero(np.diff(times, prepend=prev) > gap)
+        self._last_time = times[-1]
+        done = 0
+        start = 0
+        for stop in list(breaks) + [len(records)]:
+            if stop > start:
+                done += self._append(records[start:stop])
+            if stop < len(records):
+                self._fill = 0
+            start = stop
+        return done
+
+    def _append(self, records):
+        done = 0
+        pos = 0
+        while pos < len(records):
+            n = min(self.segment - self._fill, len(records) - pos)
+            for k, name in enumerate(self.fields):
+                self._buf[k, self._fill : self._fill + n] = records[name][pos : pos + n]
+            self._fill += n
+            pos += n
+            if self._fill == self.segment:
+                self._accumulate()
+                done += 1
+                # 保留重疊的部分
+                keep = self.segment - self.step
+                self._buf[:, :keep] = self._buf[:, self.step :]
+                self._fill = keep
+        return done
+
+    def _accumulate(self):
+        seg = self._buf - self._buf.mean(axis=1, keepdims=True)
+        r, y, u = np.fft.rfft(seg * self.window, axis=1)
+        e = r - y
+        rc = np.conj(r)
+        self.s_rr += (rc * r).real
+        self.s_yy += (np.conj(y) * y).real
+        self.s_ry += rc * y
+        self.s_ru += rc * u
+        self.s_re += rc * e
+        self.segments += 1
+
+    def response(self):
+        """回傳 {"freq", "closed", "open", "plant", "coherence", "excited"}, 還沒有完整段落時回傳 None"""
+        if not self.segments:
+            return None
+        # 從 DC 之後開始
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s_rr = self.s_rr[1:].copy()
+            s_ry = self.s_ry[1:].copy()
+            closed = s_ry / s_rr
+            return {
+                "freq": self.freq[1:],
+                "closed": closed,
+                "open": s_ry / self.s_re[1:],
+                "plant": s_ry / self.s_ru[1:],
+                "coherence": np.abs(s_ry) ** 2 / (s_rr * self.s_yy[1:]),
+                "excited": s_rr >= EXCITATION_MIN * s_rr.max(),
+            }
+
+    def reset(self):
+        self._buf = None
+        self.fs = None
+        self.segments = 0
+
+
+def _crossing(x, values, level):
+    """values 第一次由上往下穿過 level 的位置, 回傳 (x (對數內插), 區間索引, 區間內比例), 沒有時回傳 None"""
+    above = values >= level
+    idx = np.flatnonzero(above[:-1] & ~above[1:])
+    if not len(idx):
+        return None
+    i = idx[0]
+    frac = (values[i] - level) / (values[i] - values[i + 1])
+    return float(np.exp(np.log(x[i]) + frac * (np.log(x[i + 1]) - np.log(x[i])))), i, frac
+
+
+def margins(response, coherence_min=COHERENCE_MIN):
+    """由開迴路響應計算增益裕度 (dB)、相位裕度 (度) 與閉迴路 -3 dB 頻寬 (Hz)
+
+    只使用有激勵能量且同調度不低於 coherence_min 的頻率點; 找不到穿越點的項目為 None。
+    """
+    out = {"gain_margin": None, "phase_margin": None, "crossover": None, "bandwidth": None}
+    if response is None:
+        return out
+    valid = response["excited"] & (response["coherence"] >= coherence_min)
+    valid &= np.isfinite(response["open"]) & (response["freq"] > 0)
+    if valid.sum() < 2:
+        return out
+    freq = response["freq"][valid]
+    loop = response["open"][valid]
+    gain = np.abs(loop)
+    phase = np.degrees(np.unwrap(np.angle(loop)))
+
+    hit = _crossing(freq, gain, 1.0)
+    if hit is not None:
+        f, i, frac = hit
+        out["crossover"] = f
+        out["phase_margin"] = 180.0 + phase[i] + frac * (phase[i + 1] - phase[i])
+    hit = _crossing(freq, phase, -180.0)
+    if hit is not None:
+        f, i, frac = hit
+        g = gain[i] + frac * (gain[i + 1] - gain[i])
+        out["gain_margin"] = -20 * np.log10(g)
+    hit = _crossing(freq, np.abs(response["closed"][valid]), 1 / np.sqrt(2))
+    if hit is not None:
+        out["bandwidth"] = hit[0]
+    return out
@@ -1,28 +1,119 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-import numpy as np
+from tkinter import ttk, filedialog
+import os
 import time
 import threading
-import math
-import random
-import serial
-import serial.tools.list_ports as list_ports
-import struct
-
-# 設定matplotlib中文字體
-plt.rcParams["font.sans-serif"] = [
-    "Microsoft JhengHei",
-    "SimHei",
-    "DejaVu Sans",
-]  # 設定中文字體
-plt.rcParams["axes.unicode_minus"] = False  # 解決負號顯示問題
+import startup
+
+# 遙測歷史容量 (可設定到數百萬筆以保存整段測試), 1 kHz 回報約 10 秒
+HISTORY_SIZE = 10000
+# 每條線最多繪製的點數, 歷史較長時以 min/max 抽樣
+PLOT_POINTS = 2000
+# 圖表上的欄位 (建立抽樣索引用)
+PLOT_FIELDS = ("pos", "target_pos", "vel", "target_vel")
+# 圖表刷新間隔 (秒)
+REFRESH_INTERVAL = 0.02
+# 單次讀取序列埠的最大位元組數
+READ_CHUNK = 65536
+# 序列埠讀取逾時 (秒), 沒有資料時接收執行緒仍能檢查連線是否中斷
+READ_TIMEOUT = 0.05
+# v2 每個 frame 的樣本數與每幾個 1 ms 迴圈回報一次 (協定版本與編碼見 load_modules)
+PROTOCOL_BATCH = 8
+PROTOCOL_DOWN_SAMPLE = 1
+# 不接硬體時的模擬裝置
+SIMULATOR_PORT = "Simulator"
+# 接收模式: thread 在 GUI 行程內接收, process 在獨立行程接收並經共享記憶體交給 GUI,
+# asyncio 以協程在主執行緒接收/傳送/繪圖
+ACQUISITION_MODES = ("thread", "process", "asyncio")
+# process 模式下沒有新資料時的輪詢間隔 (秒)
+POLL_INTERVAL = 0.005
+# 回放速度選項
+REPLAY_SPEEDS = {"1x": 1.0, "10x": 10.0, "max": None}
+# 自動調參的 (Kp, Ki, Kd) 搜尋範圍
+AUTOTUNE_RANGES = {
+    "position": ((1, 60), (0, 1), (0, 30)),
+    "velocity": ((1, 30), (0, 1), (0, 5)),
+}
+# 軌跡預設參數
+TRAJ_RATE = 200  # Hz
+TRAJ_MAX_VEL = 100  # mm/s
+TRAJ_ACCEL = 500  # mm/s^2
+TRAJ_AMPLITUDE = 20  # mm
+# 頻率響應量測: 以速度設定點激勵, 週期與 Welch 分段長度相同 (頻率為 1 / 週期 的整數倍)
+BODE_PERIOD = 4.0  # s
+BODE_AMPLITUDE = 40  # mm/s
+BODE_REPEATS = 8
+BODE_REFRESH_MS = 500
+# 延遲診斷面板的刷新間隔
+LATENCY_REFRESH_MS = 500
+
+
+_modules_loaded = False
+
+
+def load_modules():
+    """匯入繪圖、資料處理與序列埠模組 (冷啟動約 1 秒)
+
+    模組層級只匯入 tkinter, 控制面板畫出後才在背景執行緒呼叫本函式, 之後各方法直接使用這些名稱。
+    """
+    global _modules_loaded, np, serial, Figure, FigureCanvasTkAgg
+    global TelemetryBuffer, TELEMETRY_DTYPE, BlitRenderer, ProtocolDecoder, VELOCITY_MODE, POSITION_MODE, pack_control, pack_pid_config
+    global TransmitWorker, TARGET_KEY, PID_KEY, PROTO_KEY, trajectory, SimulatedSerial, autotune
+    global TelemetryRecorder, Replay, MinMaxPyramid, StepAnalyzer, format_step, WelchEstimator, margins
+    global AcquisitionProcess, aio_link, identify, Exporter, export_filetypes, LatencyTracer, format_stats, PortWatcher, LinkMonitor, scan_ports
+    global PROTOCOL_VERSION, PROTOCOL_ENCODING, PROTOCOL_FIELD_MASK, BODE_FREQS
+    if _modules_loaded:
+        return
+    import matplotlib
+
+    # 設定matplotlib中文字體 (不匯入 pyplot)
+    matplotlib.rcParams["font.sans-serif"] = [
+        "Microsoft JhengHei",
+        "SimHei",
+        "DejaVu Sans",
+    ]  # 設定中文字體
+    matplotlib.rcParams["axes.unicode_minus"] = False  # 解決負號顯示問題
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from matplotlib.figure import Figure
+    import numpy as np
+    import serial
+    from telemetry_buffer import TelemetryBuffer, TELEMETRY_DTYPE
+    from chart_renderer import BlitRenderer
+    from protocol import (
+        ProtocolDecoder,
+        PROTOCOL_V2,
+        ENCODING_INT16,
+        DEFAULT_FIELD_MASK,
+        VELOCITY_MODE,
+        POSITION_MODE,
+        pack_control,
+        pack_pid_config,
+    )
+    from serial_tx import TransmitWorker, TARGET_KEY, PID_KEY, PROTO_KEY
+    import trajectory
+    from simulator import SimulatedSerial
+    import autotune
+    from recorder import TelemetryRecorder, Replay
+    from lod import MinMaxPyramid
+    from step_analysis import StepAnalyzer, format_step
+    from frequency_response import WelchEstimator, margins
+    from acquisition import AcquisitionProcess
+    import aio_link
+    import identify
+    from export import Exporter, filetypes as export_filetypes
+    from latency import LatencyTracer, format_stats
+    from port_monitor import PortWatcher, LinkMonitor, scan as scan_ports
+
+    # 連線時要求 v2 (舊韌體自動退回 v1), 以 int16 定點編碼、不送固定為 0 的 d
+    PROTOCOL_VERSION = PROTOCOL_V2
+    PROTOCOL_ENCODING = ENCODING_INT16
+    PROTOCOL_FIELD_MASK = DEFAULT_FIELD_MASK
+    BODE_FREQS = np.unique(np.round(np.geomspace(2, 160, 30))) / BODE_PERIOD  # 0.5 ~ 40 Hz
+    _modules_loaded = True
 
 
 class PIDControlGUI:
-    def __init__(self, root):
+    def __init__(self, root, history_size=HISTORY_SIZE, acquisition="thread", profile_startup=False):
         self.root = root
         self.root.title("PID控制系統")
         self.root.geometry("1200x900")
@@ -31,15 +122,39 @@ class PIDControlGUI:
         # 全域變數
         self.current_mode = "position"
         self.current_target = None
-        self.time_data = []
-        self.position_data = []
-        self.velocity_data = []
-        self.target_position_data = []
-        self.target_velocity_data = []
+        if acquisition not in ACQUISITION_MODES:
+            raise ValueError(f"unknown acquisition mode: {acquisition}")
+        self.acquisition = acquisition
+        self.history_size = history_size
+        self.profile_startup = profile_startup
+        # 緩衝區、解碼器與傳送執行緒需要 numpy, 在 finish_startup 建立
+        self.ready = False
+        self.transmitter = None
+        self.streamer = None
+        self.loop = None
+        self.receive_task = None
+        self.writer_task = None
+        self.recorder = None
+        self.record_start = 0.0
+        self.bode_estimator = None
+        self.bode_active = False
+        self.bode_window = None
+        self.replay = None
+        self.exporter = None
+        # 延遲追蹤只在診斷面板開啟時啟用, 關閉時為 None
+        self.tracer = None
+        self.latency_window = None
+        self.plant_model = None  # 由錄製檔辨識的受控體, 自動調參時取代預設模型
         self.time_counter = 0
         self.is_running = False
-        self.serial: serial.Serial = None # serial.Serial("COM4", 921600)
+        self.serial = None # serial.Serial("COM4", 921600)
+        # 斷線自動重新連線: 目前連線的序列埠名稱, 重新開啟後第一批資料到達時恢復設定
+        self.port_name = None
+        self.resume_pending = False
+        self.gap_start = 0.0
+        self.port_watcher = None
         self.last_update_time = time.time()
+        self.chart_pending = False
         self.fps_cnt = 0
         self.last_print_fps = time.time()
 
@@ -48,10 +163,88 @@ class PIDControlGUI:
         self.velocity_pid = {"Kp": 0.8, "Ki": 0.05, "Kd": 0.005}
 
         self.setup_ui()
-        self.setup_charts()
         self.update_display_mode()  # 移到這裡，確保所有UI元素都已創建
+        # 先畫出控制面板 (載入完成前停用), 圖表與其餘模組在背景載入
+        self.set_panel_state(False)
+        self.loading_label = tk.Label(
+            self.chart_area, text="載入中...", font=("Microsoft JhengHei", 16), bg="white", fg="#999999"
+        )
+        self.loading_label.pack(expand=True)
+        self.root.update()
+        startup.mark("first paint")
+        if acquisition == "asyncio":
+            import asyncio
+
+            # 先建立事件迴圈, 背景載入完成時 (可能早於 mainloop) 就能把 finish_startup 排入
+            self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.load_in_background, daemon=True).start()
+
+    def load_in_background(self):
+        load_modules()
+        startup.mark("modules")
+        # 列舉序列埠可能要數百毫秒 (Windows), 也放在背景
+        ports = scan_ports()
+        startup.mark("port scan")
+        self.call_in_ui(self.finish_startup, ports)
+
+    def finish_startup(self, ports):
+        self.telemetry = TelemetryBuffer(self.history_size)
+        self.lod = MinMaxPyramid(self.telemetry, PLOT_FIELDS)
+        self.step_analyzer = StepAnalyzer(self.current_mode)
+        self.decoder = ProtocolDecoder(
+            PROTOCOL_VERSION,
+            PROTOCOL_BATCH,
+            encoding=PROTOCOL_ENCODING,
+            field_mask=PROTOCOL_FIELD_MASK,
+            down_sample=PROTOCOL_DOWN_SAMPLE,
+        )
+        if self.acquisition == "asyncio":
+            self.transmitter = aio_link.AsyncTransmitter()
+            self.writer_task = self.loop.create_task(self.transmitter.run())
+        else:
+            self.transmitter = TransmitWorker()
+        self.streamer = trajectory.TrajectoryStreamer(self.transmitter)
+        self.link = LinkMonitor()
+
+        self.update_port_list(ports)
+        # 插拔時更新清單, 並喚醒等待重新連線的接收端
+        self.port_watcher = PortWatcher(self.on_ports_changed, ports)
+
+        self.loading_label.destroy()
+        self.setup_charts()
+        self.update_display_mode()  # 狀態列在 setup_charts 建立
+        self.set_panel_state(True)
         # self.start_simulation()
-        self.start_receiver()
+        if self.acquisition != "asyncio":
+            self.start_receiver()
+        self.ready = True
+        startup.mark("charts")
+        if self.profile_startup:
+            print(startup.report())
+
+    def update_port_list(self, ports):
+        values = ["Disconnect", SIMULATOR_PORT]
+        for port, desc, hwid in ports:
+            print(f"  {port}: {desc} [{hwid}]")
+            values.append(f"{port} {desc}")
+        self.com_combo.configure(values=values)
+
+    def on_ports_changed(self, ports):
+        # PortWatcher 執行緒: 更新下拉選單並立即重試重新連線
+        self.call_in_ui(self.update_port_list, ports)
+        self.link.notify()
+
+    def set_panel_state(self, enabled):
+        # 停用 / 啟用控制面板上所有可操作的元件
+        stack = [self.control_panel]
+        while stack:
+            widget = stack.pop()
+            stack.extend(widget.winfo_children())
+            if isinstance(widget, ttk.Widget):
+                # ttk 以狀態旗標控制, 保留 readonly
+                widget.state(["!disabled"] if enabled else ["disabled"])
+            elif isinstance(widget, (tk.Button, tk.Entry, tk.Radiobutton, tk.Checkbutton)):
+                widget.configure(state="normal" if enabled else "disabled")
 
     def setup_ui(self):
         # 主容器
@@ -95,14 +288,10 @@ class PIDControlGUI:
         )
         connection_title.pack(anchor="w", padx=15, pady=(15, 10))
 
-        ports_raw = list_ports.comports()
-        ports = ["Disconnect"]
-        for port, desc, hwid in sorted(ports_raw):
-            print(f"  {port}: {desc} [{hwid}]")
-            ports.append(f"{port} {desc}")
-
+        # 序列埠清單在背景列舉完成後 (finish_startup) 補上
+        ports = ["Disconnect", SIMULATOR_PORT]
         self.com_var = tk.StringVar(value=ports[0])
-        com_combo = ttk.Combobox(
+        self.com_combo = ttk.Combobox(
             connection_frame,
             textvariable=self.com_var,
             values=ports,
@@ -111,8 +300,53 @@ class PIDControlGUI:
         )
         # 設定顯示文字映射
         # com_combo.configure(values=["COM?", "COM?"])
-        com_combo.pack(fill="x", padx=15, pady=(0, 15))
-        com_combo.bind("<<ComboboxSelected>>", self.on_com_port_change)
+        self.com_combo.pack(fill="x", padx=15, pady=(0, 15))
+        self.com_combo.bind("<<ComboboxSelected>>", self.on_com_port_change)
+
+        # 錄製 / 回放
+        record_row = tk.Frame(connection_frame, bg="#f5f5f5")
+        record_row.pack(fill="x", padx=15, pady=(0, 15))
+
+        self.record_btn = tk.Button(
+            record_row,
+            text="開始錄製",
+            bg="#dc3545",
+            fg="white",
+            font=("Microsoft JhengHei", 12, "bold"),
+            command=self.toggle_recording,
+        )
+        self.record_btn.pack(side="left", fill="x", expand=True, padx=(0, 5))
+
+        self.replay_btn = tk.Button(
+            record_row,
+            text="回放",
+            bg="#6c757d",
+            fg="white",
+            font=("Microsoft JhengHei", 12, "bold"),
+            command=self.toggle_replay,
+        )
+        self.replay_btn.pack(side="left", fill="x", expand=True, padx=(0, 5))
+
+        self.replay_speed_var = tk.StringVar(value="1x")
+        replay_speed_combo = ttk.Combobox(
+            record_row,
+            textvariable=self.replay_speed_var,
+            values=list(REPLAY_SPEEDS),
+            state="readonly",
+            width=4,
+            font=("Microsoft JhengHei", 12),
+        )
+        replay_speed_combo.pack(side="left", padx=(0, 5))
+
+        self.export_btn = tk.Button(
+            record_row,
+            text="匯出",
+            bg="#6c757d",
+            fg="white",
+            font=("Microsoft JhengHei", 12, "bold"),
+            command=self.toggle_export,
+        )
+        self.export_btn.pack(side="left", fill="x", expand=True)
 
         # 控制模式區塊
         mode_frame = tk.Frame(self.control_panel, bg="#f5f5f5", relief="solid", bd=1)
@@ -186,6 +420,27 @@ class PIDControlGUI:
         )
         target_btn.pack(fill="x", padx=15, pady=(15, 5))
 
+        # 軌跡串流
+        self.traj_var = tk.StringVar(value="trapezoid")
+        traj_combo = ttk.Combobox(
+            self.target_pos_frame,
+            textvariable=self.traj_var,
+            values=["trapezoid", "s-curve", "sine sweep", "chirp"],
+            state="readonly",
+            font=("Microsoft JhengHei", 12),
+        )
+        traj_combo.pack(fill="x", padx=15, pady=(5, 5))
+
+        self.traj_btn = tk.Button(
+            self.target_pos_frame,
+            text="執行軌跡",
+            bg="#007bff",
+            fg="white",
+            font=("Microsoft JhengHei", 12, "bold"),
+            command=self.toggle_trajectory,
+        )
+        self.traj_btn.pack(fill="x", padx=15, pady=(0, 5))
+
         # 目標速度
         self.target_vel_frame = tk.Frame(target_frame, bg="#f5f5f5")
         self.target_vel_frame.pack(fill="x", padx=15, pady=(0, 0))
@@ -219,6 +474,27 @@ class PIDControlGUI:
         )
         target_btn.pack(fill="x", padx=15, pady=(15, 5))
 
+        # 頻率響應量測 (速度迴路)
+        self.bode_var = tk.StringVar(value="multisine")
+        bode_combo = ttk.Combobox(
+            self.target_vel_frame,
+            textvariable=self.bode_var,
+            values=["multisine", "chirp"],
+            state="readonly",
+            font=("Microsoft JhengHei", 12),
+        )
+        bode_combo.pack(fill="x", padx=15, pady=(5, 5))
+
+        self.bode_btn = tk.Button(
+            self.target_vel_frame,
+            text="頻率響應",
+            bg="#007bff",
+            fg="white",
+            font=("Microsoft JhengHei", 12, "bold"),
+            command=self.toggle_bode,
+        )
+        self.bode_btn.pack(fill="x", padx=15, pady=(0, 5))
+
         # 位置PID參數區塊
         self.position_pid_frame = tk.Frame(
             self.control_panel, bg="#f5f5f5", relief="solid", bd=1
@@ -252,7 +528,17 @@ class PIDControlGUI:
             font=("Microsoft JhengHei", 12, "bold"),
             command=lambda: self.update_pid("position"),
         )
-        pos_btn.pack(fill="x", padx=15, pady=(0, 15))
+        pos_btn.pack(fill="x", padx=15, pady=(0, 5))
+
+        pos_tune_btn = tk.Button(
+            self.position_pid_frame,
+            text="自動調參",
+            bg="#6c757d",
+            fg="white",
+            font=("Microsoft JhengHei", 12, "bold"),
+            command=lambda: self.auto_tune("position"),
+        )
+        pos_tune_btn.pack(fill="x", padx=15, pady=(0, 15))
 
         # 速度PID參數區塊
         self.velocity_pid_frame = tk.Frame(
@@ -287,7 +573,27 @@ class PIDControlGUI:
             font=("Microsoft JhengHei", 12, "bold"),
             command=lambda: self.update_pid("velocity"),
         )
-        vel_btn.pack(fill="x", padx=15, pady=(0, 15))
+        vel_btn.pack(fill="x", padx=15, pady=(0, 5))
+
+        vel_tune_btn = tk.Button(
+            self.velocity_pid_frame,
+            text="自動調參",
+            bg="#6c757d",
+            fg="white",
+            font=("Microsoft JhengHei", 12, "bold"),
+            command=lambda: self.auto_tune("velocity"),
+        )
+        vel_tune_btn.pack(fill="x", padx=15, pady=(0, 5))
+
+        identify_btn = tk.Button(
+            self.velocity_pid_frame,
+            text="由錄製檔辨識模型",
+            bg="#6c757d",
+            fg="white",
+            font=("Microsoft JhengHei", 12, "bold"),
+            command=self.identify_plant,
+        )
+        identify_btn.pack(fill="x", padx=15, pady=(0, 15))
 
         
 
@@ -342,10 +648,48 @@ class PIDControlGUI:
         self.vel_ax.set_ylabel("速度 (mm/s)", color="#34495e")
         self.vel_ax.grid(True, color="#bdc3c7", linewidth=0.8)
 
+        # 持久化線條, 之後只更新資料
+        (self.pos_line,) = self.pos_ax.plot(
+            [], [], color="#2E5BBA", linewidth=2.5, label="實際位置 (mm)"
+        )
+        (self.target_pos_line,) = self.pos_ax.plot(
+            [],
+            [],
+            color="#D73027",
+            linewidth=2.5,
+            linestyle="--",
+            label="目標位置 (mm)",
+        )
+        (self.vel_line,) = self.vel_ax.plot(
+            [], [], color="#1A9641", linewidth=2.5, label="實際速度 (mm/s)"
+        )
+        (self.target_vel_line,) = self.vel_ax.plot(
+            [],
+            [],
+            color="#F57C00",
+            linewidth=2.5,
+            linestyle="--",
+            label="目標速度 (mm/s)",
+        )
+
+        # 添加圖例，固定在右上角
+        self.pos_ax.legend(loc="upper right", frameon=True, fancybox=True, shadow=True)
+        self.vel_ax.legend(loc="upper right", frameon=True, fancybox=True, shadow=True)
+
         # 嵌入tkinter
         self.canvas = FigureCanvasTkAgg(self.fig, chart_container)
         self.canvas.get_tk_widget().pack(fill="both", expand=True)
 
+        # 增量繪圖: 只 blit 資料層
+        self.renderer = BlitRenderer(self.canvas)
+        for line in (
+            self.pos_line,
+            self.target_pos_line,
+            self.vel_line,
+            self.target_vel_line,
+        ):
+            self.renderer.add_line(line)
+
         # 狀態欄
         status_frame = tk.Frame(
             self.chart_area, bg="#f5f5f5", height=40, relief="solid", bd=1
@@ -371,26 +715,74 @@ class PIDControlGUI:
         )
         self.target_label.pack(side="left", padx=20, pady=10)
 
+        # 最近一次步階響應的分析結果
+        self.step_label = tk.Label(
+            status_frame,
+            text=format_step(None),
+            font=("Microsoft JhengHei", 12),
+            bg="#f5f5f5",
+            fg="#333333",
+        )
+        self.step_label.pack(side="left", padx=20, pady=10)
+
+        # 參數更新訊息 (取代會阻塞畫面的 messagebox)
+        self.info_label = tk.Label(
+            status_frame,
+            text="",
+            font=("Microsoft JhengHei", 12),
+            bg="#f5f5f5",
+            fg="#333333",
+        )
+        self.info_label.pack(side="left", padx=20, pady=10)
+
+        latency_btn = tk.Button(
+            status_frame,
+            text="延遲診斷",
+            bg="#6c757d",
+            fg="white",
+            font=("Microsoft JhengHei", 10),
+            command=self.open_latency_window,
+        )
+        latency_btn.pack(side="right", padx=10, pady=5)
+
     def on_mode_change(self, event=None):
         self.current_mode = (
             "position" if self.mode_var.get() == "position" else "velocity"
         )
         self.current_target = None
+        # 依模式分析位置或速度的步階 (接收執行緒之後會使用新的分析器)
+        self.step_analyzer = StepAnalyzer(self.current_mode)
         self.update_display_mode()
 
     def on_com_port_change(self, event=None):
-        self.is_running = False
         com = self.com_var.get()
+        if self.acquisition == "asyncio":
+            # 連線/斷線在協程中進行, 不阻塞畫面
+            self.loop.create_task(self.switch_port_async(com))
+            return
+        self.is_running = False
         if com == "Disconnect":
             if self.serial is not None:
+                self.transmitter.serial = None
                 self.serial.close()
                 print(f"close port")
+        elif com == SIMULATOR_PORT:
+            self.start_simulation()
         ## serial not open
         elif(self.serial is None or not self.serial.is_open):
             com = com[:com.find(" ")]
-            self.serial = serial.Serial(com, 921600)
+            try:
+                self.serial = self.open_port(com)
+            except (serial.SerialException, OSError) as e:
+                self.info_label.config(text=f"無法開啟 {com}: {e}")
+                return
+            self.transmitter.serial = self.serial
+            self.connect_link(com)
             self.is_running = True
             print(f"open port: {com}: {self.serial.is_open}")
+        else:
+            # 連線仍開啟 (例如回放後重新選擇): 恢復接收
+            self.is_running = True
         
         # self.current_mode = (
         #     "position" if self.mode_var.get() == "position" else "velocity"
@@ -433,34 +825,219 @@ class PIDControlGUI:
             self.position_pid["Kp"] = self.pos_kp_var.get()
             self.position_pid["Ki"] = self.pos_ki_var.get()
             self.position_pid["Kd"] = self.pos_kd_var.get()
-            data = struct.pack('<4sfffi', b"\xAA\xBB\xCC\xFF", self.position_pid["Kp"], self.position_pid["Ki"], self.position_pid["Kd"], 1)
-            self.serial.write(data)
-            messagebox.showinfo(
-                "參數更新",
-                f"位置PID參數已更新:\nKp={self.position_pid['Kp']}\nKi={self.position_pid['Ki']}\nKd={self.position_pid['Kd']}",
+            data = pack_pid_config(self.position_pid["Kp"], self.position_pid["Ki"], self.position_pid["Kd"], POSITION_MODE)
+            self.transmitter.submit(data, key=(PID_KEY, POSITION_MODE))
+            self.info_label.config(
+                text=f"位置PID參數已更新: Kp={self.position_pid['Kp']} Ki={self.position_pid['Ki']} Kd={self.position_pid['Kd']}",
             )
         else:
             self.velocity_pid["Kp"] = self.vel_kp_var.get()
             self.velocity_pid["Ki"] = self.vel_ki_var.get()
             self.velocity_pid["Kd"] = self.vel_kd_var.get()
-            data = struct.pack('<4sfffi', b"\xAA\xBB\xCC\xFF", self.velocity_pid["Kp"], self.velocity_pid["Ki"], self.velocity_pid["Kd"], 0)
-            self.serial.write(data)
-            messagebox.showinfo(
-                "參數更新",
-                f"速度PID參數已更新:\nKp={self.velocity_pid['Kp']}\nKi={self.velocity_pid['Ki']}\nKd={self.velocity_pid['Kd']}",
+            data = pack_pid_config(self.velocity_pid["Kp"], self.velocity_pid["Ki"], self.velocity_pid["Kd"], VELOCITY_MODE)
+            self.transmitter.submit(data, key=(PID_KEY, VELOCITY_MODE))
+            self.info_label.config(
+                text=f"速度PID參數已更新: Kp={self.velocity_pid['Kp']} Ki={self.velocity_pid['Ki']} Kd={self.velocity_pid['Kd']}",
             )
 
+    def auto_tune(self, pid_type):
+        # 另一個環固定為目前輸入的參數
+        other_pid = dict(self.velocity_pid if pid_type == "position" else self.position_pid)
+        self.info_label.config(text="自動調參中...")
+        threading.Thread(
+            target=self.auto_tune_worker, args=(pid_type, other_pid), daemon=True
+        ).start()
+
+    def auto_tune_worker(self, pid_type, other_pid):
+        candidates = autotune.candidate_grid(*AUTOTUNE_RANGES[pid_type])
+        result = autotune.tune(pid_type, candidates, other_pid, plant=self.plant_model)
+        try:
+            gains = autotune.select_gains(result)
+        except ValueError:
+            self.call_in_ui(self.info_label.config, {"text": "自動調參失敗: 沒有穩定的參數"})
+            return
+        print(f"autotune {pid_type}: {len(candidates)} candidates, pareto {len(result['front'])}, {gains}")
+        self.call_in_ui(self.apply_tuned_gains, pid_type, gains)
+
+    def identify_plant(self):
+        path = filedialog.askopenfilename(filetypes=[("Telemetry recording", "*.prec")])
+        if not path:
+            return
+        self.info_label.config(text="模型辨識中...")
+        threading.Thread(target=self.identify_worker, args=(path,), daemon=True).start()
+
+    def identify_worker(self, path):
+        try:
+            model = identify.fit_fopdt(Replay(path).reports())
+        except ValueError as e:
+            self.call_in_ui(self.info_label.config, {"text": f"模型辨識失敗: {e}"})
+            return
+        print(f"identify {path}: {model}")
+        self.plant_model = identify.to_plant(model)
+        self.call_in_ui(
+            self.info_label.config,
+            {
+                "text": f"受控體: K={model['gain']:.3f} τ={model['tau'] * 1000:.1f} ms "
+                f"延遲={model['delay'] * 1000:.0f} ms 死區={model['deadband']:.1f} 吻合度 {model['fit']:.1f}%"
+            },
+        )
+
+    def apply_tuned_gains(self, pid_type, gains):
+        if pid_type == "position":
+            variables = (self.pos_kp_var, self.pos_ki_var, self.pos_kd_var)
+        else:
+            variables = (self.vel_kp_var, self.vel_ki_var, self.vel_kd_var)
+        for var, label in zip(variables, ("Kp", "Ki", "Kd")):
+            var.set(round(gains[label], 4))
+        # 走原本的 pid_config_t 傳送路徑
+        self.update_pid(pid_type)
+
     def send_target(self):
+        # 手動目標優先於正在串流的軌跡 / 頻率響應激勵
+        self.stop_stream()
         if self.current_mode == "position":
             self.current_target = self.target_position_var.get()
             self.target_label.config(text=f"目標: {self.current_target} mm")
-            data = struct.pack('<4sffi', b"\xAA\xBB\xCC\xEE", 0, self.current_target, 1)
-            self.serial.write(data)
+            data = pack_control(0, self.current_target, POSITION_MODE)
+            self.transmitter.submit(data, key=TARGET_KEY)
         else:
             self.current_target = self.target_velocity_var.get()
             self.target_label.config(text=f"目標: {self.current_target} mm/s")
-            data = struct.pack('<4sffi', b"\xAA\xBB\xCC\xEE", self.current_target, 0, 0)
-            self.serial.write(data)
+            data = pack_control(self.current_target, 0, VELOCITY_MODE)
+            self.transmitter.submit(data, key=TARGET_KEY)
+
+    def stop_stream(self):
+        # 軌跡與頻率響應激勵共用 self.streamer; stop() 不會呼叫 on_done, 在這裡還原該串流的狀態與按鈕
+        self.streamer.stop()
+        self.traj_btn.config(text="執行軌跡")
+        if self.bode_active:
+            self.finish_bode()
+
+    def toggle_trajectory(self):
+        if self.streamer.is_running and not self.bode_active:
+            self.stop_stream()
+            return
+        # 頻率響應量測中: 先結束量測再開始軌跡
+        self.stop_stream()
+
+        target = self.target_position_var.get()
+        kind = self.traj_var.get()
+        if kind in ("trapezoid", "s-curve"):
+            # 從目前位置移動到目標位置
+            pos = self.telemetry.view("pos", last=1)
+            start = float(pos[0]) if len(pos) else 0.0
+            profile = trajectory.trapezoid if kind == "trapezoid" else trajectory.s_curve
+            values = profile(start, target, TRAJ_MAX_VEL, TRAJ_ACCEL, TRAJ_RATE)
+        elif kind == "sine sweep":
+            values = trajectory.sine_sweep(
+                target, TRAJ_AMPLITUDE, [0.5, 1, 2, 4], rate=TRAJ_RATE
+            )
+        else:
+            values = trajectory.chirp(target, TRAJ_AMPLITUDE, 0.5, 5, 10, rate=TRAJ_RATE)
+
+        self.current_target = target
+        self.target_label.config(text=f"目標: {kind} ({len(values) / TRAJ_RATE:.1f} s)")
+        self.traj_btn.config(text="停止軌跡")
+        self.streamer.start(
+            values,
+            POSITION_MODE,
+            TRAJ_RATE,
+            on_done=lambda: self.call_in_ui(self.traj_btn.config, {"text": "執行軌跡"}),
+        )
+
+    def toggle_bode(self):
+        if self.bode_active:
+            self.stop_stream()
+            return
+        # 軌跡執行中: 先停止軌跡再開始量測
+        self.stop_stream()
+
+        if self.bode_var.get() == "multisine":
+            period = trajectory.multisine(
+                0, BODE_AMPLITUDE, BODE_FREQS, BODE_PERIOD, TRAJ_RATE, mode=VELOCITY_MODE
+            )
+        else:
+            period = trajectory.chirp(
+                0, BODE_AMPLITUDE, BODE_FREQS[0], BODE_FREQS[-1], BODE_PERIOD, TRAJ_RATE,
+                method="log", mode=VELOCITY_MODE,
+            )
+        values = np.tile(period, BODE_REPEATS)
+        # 每次量測重新累計頻譜
+        self.bode_estimator = WelchEstimator(segment_time=BODE_PERIOD)
+        self.bode_active = True
+        self.open_bode_window()
+        self.current_target = 0
+        self.target_label.config(text=f"目標: {self.bode_var.get()} ({len(values) / TRAJ_RATE:.0f} s)")
+        self.bode_btn.config(text="停止量測")
+        self.streamer.start(values, VELOCITY_MODE, TRAJ_RATE, on_done=self.finish_bode)
+
+    def finish_bode(self):
+        # 可能在串流執行緒呼叫: 停止激勵後速度歸零
+        self.bode_active = False
+        self.transmitter.submit(pack_control(0, 0, VELOCITY_MODE), key=TARGET_KEY)
+        self.call_in_ui(self.bode_btn.config, {"text": "頻率響應"})
+
+    def open_bode_window(self):
+        if self.bode_window is not None:
+            self.bode_window.lift()
+            return
+        window = tk.Toplevel(self.root)
+        window.title("頻率響應")
+        window.geometry("800x600")
+        fig = Figure(figsize=(8, 6), dpi=100, facecolor="white")
+        self.bode_mag_ax = fig.add_subplot(2, 1, 1)
+        self.bode_mag_ax.set_ylabel("增益 (dB)", color="#34495e")
+        self.bode_phase_ax = fig.add_subplot(2, 1, 2, sharex=self.bode_mag_ax)
+        self.bode_phase_ax.set_xlabel("頻率 (Hz)", color="#34495e")
+        self.bode_phase_ax.set_ylabel("相位 (度)", color="#34495e")
+        self.bode_lines = {}
+        for key, color, label in (
+            ("closed", "#2E5BBA", "閉迴路 T"),
+            ("open", "#D73027", "開迴路 L"),
+        ):
+            (mag,) = self.bode_mag_ax.semilogx([], [], color=color, marker=".", label=label)
+            (phase,) = self.bode_phase_ax.semilogx([], [], color=color, marker=".", label=label)
+            self.bode_lines[key] = (mag, phase)
+        for ax in (self.bode_mag_ax, self.bode_phase_ax):
+            ax.grid(True, which="both", color="#bdc3c7", linewidth=0.8)
+            ax.legend(loc="lower left")
+        self.bode_canvas = FigureCanvasTkAgg(fig, window)
+        self.bode_canvas.get_tk_widget().pack(fill="both", expand=True)
+        window.protocol("WM_DELETE_WINDOW", self.close_bode_window)
+        self.bode_window = window
+        self.root.after(BODE_REFRESH_MS, self.update_bode)
+
+    def close_bode_window(self):
+        self.bode_window.destroy()
+        self.bode_window = None
+
+    def update_bode(self):
+        if self.bode_window is None:
+            return
+        response = self.bode_estimator.response()
+        if response is not None:
+            valid = response["excited"]
+            freq = response["freq"][valid]
+            for key, (mag, phase) in self.bode_lines.items():
+                values = response[key][valid]
+                mag.set_data(freq, 20 * np.log10(np.abs(values)))
+                phase.set_data(freq, np.degrees(np.unwrap(np.angle(values))))
+            for ax in (self.bode_mag_ax, self.bode_phase_ax):
+                ax.relim()
+                ax.autoscale_view()
+            m = margins(response)
+
+            def fmt(value, unit):
+                return "-" if value is None else f"{value:.1f} {unit}"
+
+            self.bode_mag_ax.set_title(
+                f"增益裕度 {fmt(m['gain_margin'], 'dB')}  相位裕度 {fmt(m['phase_margin'], '度')}  "
+                f"穿越 {fmt(m['crossover'], 'Hz')}  頻寬 {fmt(m['bandwidth'], 'Hz')}  "
+                f"({self.bode_estimator.segments} 段)",
+                fontsize=12,
+            )
+            self.bode_canvas.draw_idle()
+        self.root.after(BODE_REFRESH_MS, self.update_bode)
 
     def start_receiver(self):
         self.is_running = False
@@ -471,170 +1048,492 @@ class PIDControlGUI:
 
     def receiver_loop(self):
         while True:
-            if not self.is_running:
+            ser = self.serial
+            if not self.is_running or ser is None:
                 time.sleep(0.1)
                 continue
-            # print(self.serial.readline())
-            # continue
-            data = self.serial.read_until(b"\xAA\xBB\xCC\xDD", None)
-            if(len(data) != 36):
-                print(len(data))
-                continue
-            # print(f"==ST==\n", data, "\n==ED==", len(data), "\n")
-            vel, pos, target_vel, target_pos, output, p, i, d, *_ = struct.unpack('<8f4B', data)
-            
-            self.time_counter += 0.01
-            velocity = vel
-            position = pos
-            self.time_data.append(self.time_counter)
-            self.position_data.append(position)
-            self.velocity_data.append(velocity)
-            self.target_position_data.append(target_pos)
-            self.target_velocity_data.append(target_vel)
-            # 限制數據點數量
-            if len(self.time_data) > 1000:
-                self.time_data.pop(0)
-                self.position_data.pop(0)
-                self.velocity_data.pop(0)
-                self.target_position_data.pop(0)
-                self.target_velocity_data.pop(0)
-            # 更新圖表
-            if(time.time() - self.last_update_time >= 0.1):
-                self.last_update_time = time.time()
-                self.root.after(0, self.update_charts)
-            self.fps_cnt += 1
-            if(time.time() - self.last_print_fps >= 1):
-                self.last_print_fps = time.time()
-                print(f"pps: {self.fps_cnt}")
-                self.fps_cnt = 0
+            tracer = self.tracer
+            if isinstance(ser, AcquisitionProcess):
+                # 解碼已在擷取行程完成, 這裡只從共享記憶體複製新資料
+                records = ser.poll()
+                n = len(records)
+                if n == 0:
+                    # 擷取行程因序列埠錯誤結束, 或太久沒有資料
+                    if not ser.is_open or self.link.expired():
+                        self.reconnect(ser)
+                    else:
+                        time.sleep(POLL_INTERVAL)
+                    continue
+                if tracer is not None:
+                    # 讀取發生在擷取行程, 以 host_time 換算成本行程的 perf_counter
+                    decoded = time.perf_counter()
+                    read = decoded - (time.time() - records["host_time"][0])
+                self.time_counter = records["time"][-1]
+                self.telemetry.extend(records)
+                resyncs = ser.resyncs
+                lost = ser.lost
+            else:
+                # 有多少讀多少, 一次解碼所有完整封包
+                try:
+                    chunk = ser.read(min(max(ser.in_waiting, 1), READ_CHUNK))
+                except (serial.SerialException, OSError):
+                    # USB 拔除或裝置重置
+                    self.reconnect(ser)
+                    continue
+                if tracer is not None:
+                    read = time.perf_counter()
+                reports = self.decoder.feed(chunk)
+                self.retry_negotiation()
+                n = len(reports)
+                if n == 0:
+                    if self.link.expired():
+                        self.reconnect(ser)
+                    continue
+                if tracer is not None:
+                    decoded = time.perf_counter()
+
+                records = self.store_reports(reports)
+                resyncs = self.decoder.resyncs
+                lost = self.decoder.lost
+            if tracer is not None:
+                tracer.batch(records, read, decoded)
+            self.ingest(records, resyncs, lost)
             # time.sleep(0.1)
 
-    def start_simulation(self):
+    def reconnect(self, ser):
+        # 接收執行緒判定斷線: 以退避間隔重新開啟同一個序列埠, 使用者切換或斷開連線時放棄
+        if not self.is_running or self.serial is not ser:
+            return
+        self.drop_link(ser)
+        while True:
+            self.link.wait_retry()
+            if not self.is_running or self.serial is not ser:
+                return
+            try:
+                new = self.reopen_port(self.port_name)
+            except (serial.SerialException, OSError):
+                continue
+            self.attach_link(new)
+            return
+
+    def connect_link(self, port):
+        # 使用者開啟連線: 協商協定並開始監控連線
+        self.port_name = port
+        self.resume_pending = False
+        self.link.reset()
+        self.negotiate_protocol()
+
+    def drop_link(self, ser):
+        # 停止送出並關閉斷線的連線, 新的中斷在遙測中標記缺口
+        self.transmitter.serial = None
+        try:
+            ser.close()
+        except (serial.SerialException, OSError):
+            pass
+        if self.link.lost():
+            self.mark_gap()
+            print(f"link lost: {self.port_name}")
+            self.call_in_ui(self.info_label.config, {"text": f"{self.port_name} 連線中斷, 重新連線中..."})
+
+    def mark_gap(self):
+        # 寫入一筆 NaN 讓圖表在斷線處斷開, 重新連線後的時間軸從 gap_start 加上中斷時間繼續
+        gap = np.full(1, np.nan, dtype=TELEMETRY_DTYPE)
+        gap["time"] = self.time_counter
+        gap["host_time"] = time.time()
+        self.telemetry.extend(gap)
+        self.gap_start = self.time_counter
+
+    def reopen_port(self, port):
+        # 時間軸跳過中斷期間 (擷取行程模式在開啟時就需要起始時間)
+        self.time_counter = self.gap_start + self.link.outage()
+        return self.open_port(port)
+
+    def attach_link(self, ser):
+        # 重新開啟成功: 等第一批資料到達 (裝置已離開 bootloader 開始執行) 再協商並恢復設定;
+        # 重置後的裝置先送 v1 回報, 解碼器回到協商狀態才能解出來
+        self.serial = ser
+        self.transmitter.serial = ser
+        self.decoder.reset()
+        self.resume_pending = True
+        self.link.connected()
+        print(f"reopen port: {self.port_name}")
+
+    def resume_session(self):
+        # 重新連線後的第一批資料: 重新協商協定, 重送最後的 PID 參數與控制命令, 讓滑軌回到斷線前的狀態
+        self.resume_pending = False
+        self.negotiate_protocol()
+        self.transmitter.resend([(PID_KEY, POSITION_MODE), (PID_KEY, VELOCITY_MODE), TARGET_KEY])
+        outage = self.link.reconnected()
+        text = f"已重新連線 {self.port_name}, 中斷 {outage * 1000:.0f} ms"
+        print(text)
+        self.call_in_ui(self.info_label.config, {"text": text})
+
+    def negotiate_protocol(self):
+        # 連線後要求 v2 協定, 舊韌體不回應時解碼器會退回 36 byte 格式
+        if isinstance(self.serial, AcquisitionProcess):
+            # 解碼器在擷取行程, 由它自己協商
+            return
+        self.transmitter.submit(self.decoder.hello(), key=PROTO_KEY)
+
+    def retry_negotiation(self):
+        # 協商中只收到 v1 回報: 裝置可能剛重置完沒收到 proto_cfg_t, 再送一次
+        hello = self.decoder.retry_hello()
+        if hello is not None:
+            self.transmitter.submit(hello, key=PROTO_KEY)
+
+    def store_reports(self, reports):
+        # 時間軸依裝置時間 (v2) 或回報週期 (v1) 累加, 遺失的樣本會留下時間缺口
+        time_values = self.time_counter + np.cumsum(reports["dt"])
+        self.time_counter = time_values[-1]
+        return self.telemetry.extend_reports(time_values, time.time(), reports)
+
+    def ingest(self, records, resyncs, lost=0):
+        # 新資料的共同後續處理: 錄製、排程繪圖、統計
+        n = len(records)
+        if self.resume_pending:
+            self.resume_session()
+        self.link.alive()
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.add_reports(records)
+        self.analyze(records)
+        self.fps_cnt += n
+        if(time.time() - self.last_print_fps >= 1):
+            self.last_print_fps = time.time()
+            tx = self.transmitter.latency_stats()
+            overruns = getattr(self.serial, "overruns", 0)
+            print(f"pps: {self.fps_cnt}, fps: {self.renderer.fps:.1f}, resync: {resyncs}, lost: {lost}, overrun: {overruns}, tx p50/max: {tx['p50']:.2f}/{tx['max']:.2f} ms")
+            self.fps_cnt = 0
+
+    def analyze(self, records):
+        # 即時資料與回放共用: 步階分析、頻率響應估計, 排程繪圖
+        self.step_analyzer.feed(records)
+        if self.bode_active:
+            self.bode_estimator.feed(records)
+        self.schedule_chart_update()
+
+    async def switch_port_async(self, com):
+        # 先關閉舊連線 (在執行緒池中關閉, 避免阻塞事件迴圈)
+        if self.receive_task is not None:
+            self.receive_task.cancel()
+            self.receive_task = None
+        if self.serial is not None:
+            old, self.serial = self.serial, None
+            self.transmitter.serial = None
+            await self.loop.run_in_executor(None, old.close)
+            print(f"close port")
+        if com == "Disconnect":
+            return
+        port = SIMULATOR_PORT if com == SIMULATOR_PORT else com[:com.find(" ")]
+        try:
+            ser = await self.loop.run_in_executor(None, self.open_port, port)
+        except serial.SerialException as e:
+            self.info_label.config(text=f"無法開啟 {port}: {e}")
+            return
+        self.serial = ser
+        self.transmitter.serial = ser
+        self.connect_link(port)
         self.is_running = True
-        self.simulation_thread = threading.Thread(
-            target=self.simulation_loop, daemon=True
-        )
-        self.simulation_thread.start()
-
-    def simulation_loop(self):
-        while self.is_running:
-            self.time_counter += 1
-
-            # 模擬位置和速度數據
-            position = 50 + 30 * math.sin(self.time_counter * 0.1) + random.random() * 5
-            velocity = 20 + 15 * math.cos(self.time_counter * 0.1) + random.random() * 3
-
-            self.time_data.append(self.time_counter)
-            self.position_data.append(position)
-            self.velocity_data.append(velocity)
-
-            # 目標數據
-            if self.current_mode == "position" and self.current_target is not None:
-                self.target_position_data.append(self.current_target)
-            else:
-                self.target_position_data.append(None)
-
-            if self.current_mode == "velocity" and self.current_target is not None:
-                self.target_velocity_data.append(self.current_target)
-            else:
-                self.target_velocity_data.append(None)
-
-            # 限制數據點數量
-            if len(self.time_data) > 50:
-                self.time_data.pop(0)
-                self.position_data.pop(0)
-                self.velocity_data.pop(0)
-                self.target_position_data.pop(0)
-                self.target_velocity_data.pop(0)
+        # 連線完成後立即開始接收
+        self.receive_task = self.loop.create_task(self.receive_async(ser))
+        print(f"open port: {port}: {ser.is_open}")
+
+    async def receive_async(self, ser):
+        import asyncio
+
+        # 讀取協程: 等待資料時讓出事件迴圈給 Tk 與傳送協程, 斷線時在協程中重新連線
+        while ser.is_open:
+            try:
+                chunk = await asyncio.wait_for(aio_link.read(ser, READ_CHUNK), self.link.timeout)
+            except asyncio.TimeoutError:
+                chunk = b""
+            except (serial.SerialException, OSError):
+                # USB 拔除或裝置重置
+                chunk = None
+            if chunk is None or (not chunk and self.link.expired()):
+                ser = await self.reconnect_async(ser)
+                continue
+            read = time.perf_counter()
+            reports = self.decoder.feed(chunk)
+            self.retry_negotiation()
+            # 回放中繼續讀取 (避免序列埠緩衝溢位) 但不寫入緩衝區
+            if len(reports) and self.is_running:
+                decoded = time.perf_counter()
+                records = self.store_reports(reports)
+                tracer = self.tracer
+                if tracer is not None:
+                    tracer.batch(records, read, decoded)
+                self.ingest(records, self.decoder.resyncs, self.decoder.lost)
+
+    async def reconnect_async(self, ser):
+        # 與 reconnect 相同, 等待與開啟在執行緒池中進行; 使用者切換序列埠時本協程會被取消
+        self.drop_link(ser)
+        while True:
+            await self.loop.run_in_executor(None, self.link.wait_retry)
+            try:
+                new = await self.loop.run_in_executor(None, self.reopen_port, self.port_name)
+            except (serial.SerialException, OSError):
+                continue
+            self.attach_link(new)
+            return new
+
+    async def run_async(self):
+        from aio_link import run_tk
+
+        # 傳送協程在背景載入完成後由 finish_startup 建立
+        await run_tk(self.root)
+        if self.writer_task is not None:
+            self.writer_task.cancel()
+        if self.receive_task is not None:
+            self.receive_task.cancel()
+
+    def mainloop(self):
+        if self.acquisition == "asyncio":
+            # 使用 __init__ 建立的事件迴圈
+            try:
+                self.loop.run_until_complete(self.run_async())
+                self.loop.run_until_complete(self.loop.shutdown_default_executor())
+            finally:
+                self.loop.close()
+        else:
+            self.root.mainloop()
+
+    def call_in_ui(self, func, *args):
+        # 從工作執行緒更新畫面。asyncio 模式以 root.update() 驅動 Tk, 沒有 mainloop,
+        # 其他執行緒呼叫 root.after 會引發 RuntimeError, 改交給事件迴圈在主執行緒執行
+        if self.acquisition == "asyncio":
+            if not self.loop.is_closed():
+                self.loop.call_soon_threadsafe(func, *args)
+        else:
+            self.root.after(0, func, *args)
 
-            # 更新圖表
+    def schedule_chart_update(self):
+        # 限制刷新頻率, 並避免在上一幀完成前重複排程
+        if(time.time() - self.last_update_time >= REFRESH_INTERVAL and not self.chart_pending):
+            self.last_update_time = time.time()
+            self.chart_pending = True
             self.root.after(0, self.update_charts)
-
-            time.sleep(0.1)
-
-    def update_charts(self):
-        # 清除舊的繪圖
-        self.pos_ax.clear()
-        self.vel_ax.clear()
-
-        # 重新設置圖表
-        self.pos_ax.set_title(
-            "即時位置監控", fontsize=16, fontweight="600", color="#2c3e50"
+            tracer = self.tracer
+            if tracer is not None:
+                tracer.scheduled()
+
+    def toggle_recording(self):
+        if self.recorder is not None:
+            self.transmitter.on_write = None
+            recorder, self.recorder = self.recorder, None
+            recorder.stop()
+            # 錄製期間的步階結果另存一份 CSV
+            steps = self.step_analyzer.save(
+                os.path.splitext(recorder.path)[0] + "_steps.csv", since=self.record_start
+            )
+            self.record_btn.config(text="開始錄製")
+            self.info_label.config(
+                text=f"已錄製 {recorder.records_written} 筆 ({recorder.bytes_written / 1e6:.1f} MB), {steps} 個步階"
+            )
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".prec", filetypes=[("Telemetry recording", "*.prec")]
         )
-        self.pos_ax.set_ylabel("位置 (mm)", color="#34495e")
-        self.pos_ax.grid(True, color="#bdc3c7", linewidth=0.8)
-
-        self.vel_ax.set_title(
-            "即時速度監控", fontsize=16, fontweight="600", color="#2c3e50"
+        if not path:
+            return
+        self.recorder = TelemetryRecorder(path)
+        self.record_start = self.time_counter
+        self.transmitter.on_write = self.recorder.add_command
+        self.record_btn.config(text="停止錄製")
+        self.info_label.config(text=f"錄製中: {path}")
+
+    def toggle_replay(self):
+        if self.replay is not None and self.replay.is_running:
+            # 按鈕與接收狀態由 finish_replay 還原
+            self.replay.stop()
+            return
+        path = filedialog.askopenfilename(filetypes=[("Telemetry recording", "*.prec")])
+        if not path:
+            return
+        # 回放時停止接收, 資料走同一個緩衝區、分析與繪圖流程
+        self.is_running = False
+        self.telemetry.clear()
+        self.step_analyzer = StepAnalyzer(self.current_mode)
+        self.replay = Replay(path)
+        self.replay_btn.config(text="停止回放")
+        self.info_label.config(text=f"回放: {path} ({self.replay.duration:.1f} s)")
+        self.replay.play(
+            self.telemetry,
+            REPLAY_SPEEDS[self.replay_speed_var.get()],
+            on_batch=self.analyze,
+            on_done=lambda: self.call_in_ui(self.finish_replay),
         )
-        self.vel_ax.set_xlabel("時間", color="#34495e")
-        self.vel_ax.set_ylabel("速度 (mm/s)", color="#34495e")
-        self.vel_ax.grid(True, color="#bdc3c7", linewidth=0.8)
 
-        if self.time_data:
-            # 繪製位置數據
-            self.pos_ax.plot(
-                self.time_data,
-                self.position_data,
-                color="#2E5BBA",
-                linewidth=2.5,
-                label="實際位置 (mm)",
-            )
+    def finish_replay(self):
+        self.replay_btn.config(text="回放")
+        # 時間軸從回放的最後時間繼續, 仍開啟的連線恢復接收
+        last = self.telemetry.view(last=1)
+        if len(last):
+            self.time_counter = float(last["time"][0])
+        if self.serial is not None and self.serial.is_open:
+            self.is_running = True
 
-            # 繪製位置目標線
-            target_pos_clean = [
-                t if t is not None else np.nan for t in self.target_position_data
-            ]
-            if any(t is not None for t in self.target_position_data):
-                self.pos_ax.plot(
-                    self.time_data,
-                    target_pos_clean,
-                    color="#D73027",
-                    linewidth=2.5,
-                    linestyle="--",
-                    label="目標位置 (mm)",
-                )
-
-            # 繪製速度數據
-            self.vel_ax.plot(
-                self.time_data,
-                self.velocity_data,
-                color="#1A9641",
-                linewidth=2.5,
-                label="實際速度 (mm/s)",
+    def toggle_export(self):
+        if self.exporter is not None and self.exporter.is_running:
+            self.exporter.stop()
+            return
+        # 選錄製檔匯出完整紀錄 (含命令與 PID 參數變更), 取消則匯出目前緩衝區的遙測
+        source = filedialog.askopenfilename(
+            title="選擇要匯出的錄製檔 (取消則匯出目前緩衝區)",
+            filetypes=[("Telemetry recording", "*.prec")],
+        )
+        if not source:
+            source = self.telemetry
+        # 預設 CSV; 只有安裝 pyarrow 時才提供 Parquet / Arrow
+        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=export_filetypes())
+        if not path:
+            return
+        try:
+            self.exporter = Exporter(
+                source,
+                path,
+                on_progress=lambda done, total: self.call_in_ui(self.show_export_progress, done, total),
+                on_done=lambda result: self.call_in_ui(self.finish_export, result),
             )
+        except ValueError as e:
+            self.info_label.config(text=f"匯出失敗: {e}")
+            return
+        self.export_btn.config(text="停止匯出")
+
+    def show_export_progress(self, done, total):
+        self.info_label.config(text=f"匯出中: {done / max(total, 1):.0%}")
+
+    def finish_export(self, result):
+        self.export_btn.config(text="匯出")
+        if isinstance(result, Exception):
+            self.info_label.config(text=f"匯出失敗: {result}")
+            return
+        reports, events = result
+        self.info_label.config(text=f"已匯出 {reports} 筆遙測, {events} 筆命令: {self.exporter.path}")
 
-            # 繪製速度目標線
-            target_vel_clean = [
-                t if t is not None else np.nan for t in self.target_velocity_data
-            ]
-            if any(t is not None for t in self.target_velocity_data):
-                self.vel_ax.plot(
-                    self.time_data,
-                    target_vel_clean,
-                    color="#F57C00",
-                    linewidth=2.5,
-                    linestyle="--",
-                    label="目標速度 (mm/s)",
-                )
+    def start_simulation(self):
+        # 以韌體模擬器取代序列埠, 接收/傳送路徑完全相同
+        if self.serial is not None and self.serial.is_open:
+            self.serial.close()
+        self.serial = self.open_port(SIMULATOR_PORT)
+        self.transmitter.serial = self.serial
+        self.connect_link(SIMULATOR_PORT)
+        self.is_running = True
+        print(f"open port: {SIMULATOR_PORT}")
+
+    def open_port(self, port):
+        # 依接收模式開啟序列埠 / 模擬器, 或啟動擷取行程
+        if self.acquisition == "process":
+            return AcquisitionProcess(
+                port,
+                921600,
+                simulated=port == SIMULATOR_PORT,
+                start_time=self.time_counter,
+                protocol=PROTOCOL_VERSION,
+                batch=PROTOCOL_BATCH,
+                encoding=PROTOCOL_ENCODING,
+                field_mask=PROTOCOL_FIELD_MASK,
+                down_sample=PROTOCOL_DOWN_SAMPLE,
+            )
+        if port == SIMULATOR_PORT:
+            return SimulatedSerial()
+        return serial.Serial(port, 921600, timeout=READ_TIMEOUT)
 
-        # 添加圖例，固定在右上角
-        self.pos_ax.legend(loc="upper right", frameon=True, fancybox=True, shadow=True)
-        self.vel_ax.legend(loc="upper right", frameon=True, fancybox=True, shadow=True)
+    def update_charts(self):
+        self.chart_pending = False
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.frame_start()
+        # 增量更新抽樣索引, 每條線只取整段歷史的 min/max 抽樣
+        self.lod.update()
+
+        # 只更新線條資料, 不重建座標軸
+        for line, field in (
+            (self.pos_line, "pos"),
+            (self.target_pos_line, "target_pos"),
+            (self.vel_line, "vel"),
+            (self.target_vel_line, "target_vel"),
+        ):
+            line.set_data(*self.lod.query(field, max_points=PLOT_POINTS))
+
+        analyzer = self.step_analyzer
+        current = analyzer.current()
+        if current is not None:
+            self.step_label.config(text=format_step(current, running=True))
+        else:
+            self.step_label.config(text=format_step(analyzer.last()))
+
+        self.renderer.update()
+        if tracer is not None:
+            tracer.frame_done()
+
+    def open_latency_window(self):
+        if self.latency_window is not None:
+            self.latency_window.lift()
+            return
+        self.tracer = LatencyTracer()
+        window = tk.Toplevel(self.root)
+        window.title("延遲診斷")
+        self.latency_label = tk.Label(window, font=("Consolas", 11), justify="left", anchor="w")
+        self.latency_label.pack(fill="both", expand=True, padx=15, pady=10)
+        button_row = tk.Frame(window)
+        button_row.pack(fill="x", padx=15, pady=(0, 10))
+        tk.Button(button_row, text="匯出 CSV", command=self.export_latency).pack(side="left", padx=(0, 5))
+        tk.Button(button_row, text="重設", command=lambda: self.tracer.reset()).pack(side="left")
+        window.protocol("WM_DELETE_WINDOW", self.close_latency_window)
+        self.latency_window = window
+        self.update_latency()
+
+    def close_latency_window(self):
+        self.tracer = None
+        self.latency_window.destroy()
+        self.latency_window = None
+
+    def update_latency(self):
+        if self.latency_window is None:
+            return
+        tracer = self.tracer
+        trace = tracer.trace()
+        rate = trace["samples"].sum() / max(trace["drawn"][-1] - trace["read"][0], 1e-9) if len(trace) else 0
+        self.latency_label.config(
+            text=f"{format_stats(tracer.stats())}\n\n"
+            f"畫面 {len(trace)} / {tracer.frames}  每畫面樣本 {trace['samples'].mean() if len(trace) else 0:.1f}  "
+            f"{rate:.0f} 樣本/s  fps {self.renderer.fps:.1f}"
+        )
+        self.root.after(LATENCY_REFRESH_MS, self.update_latency)
 
-        # 刷新畫布
-        self.canvas.draw()
+    def export_latency(self):
+        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+        if path:
+            frames = self.tracer.save(path)
+            self.info_label.config(text=f"已匯出 {frames} 個畫面的延遲: {path}")
 
     def on_closing(self):
         self.is_running = False
+        if not self.ready:
+            # 背景載入尚未完成, 還沒有任何執行緒或連線
+            self.root.destroy()
+            return
+        self.streamer.stop()
+        self.port_watcher.stop()
+        if self.replay is not None:
+            self.replay.stop()
+        if self.recorder is not None:
+            self.recorder.stop()
+        if self.exporter is not None:
+            self.exporter.stop()
+        self.transmitter.stop()
+        if self.serial is not None:
+            self.serial.close()
         self.root.destroy()
 
 
 def main():
     root = tk.Tk()
+    startup.mark("tk root")
     app = PIDControlGUI(root)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
-    root.mainloop()
+    app.mainloop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,223 @@
+import os
+import time
+
+import numpy as np
+
+from protocol import (
+    ProtocolDecoder,
+    pack_control,
+    pack_pid_config,
+    PROTOCOL_V2,
+    ENCODING_FLOAT,
+    ENCODING_INT16,
+    DEFAULT_FIELD_MASK,
+    FIELD_MASK_ALL,
+    VELOCITY_MODE,
+    POSITION_MODE,
+)
+from recorder import TelemetryRecorder
+from serial_tx import TransmitWorker, TARGET_KEY, PID_KEY, PROTO_KEY
+from telemetry_buffer import TelemetryBuffer
+
+# 協定設定預設與 gui_01_v4 相同 (v2, 每 frame 8 筆, int16, 每個 1 ms 迴圈回報)
+DEFAULT_BATCH = 8
+DEFAULT_DOWN_SAMPLE = 1
+ENCODINGS = {"float": ENCODING_FLOAT, "int16": ENCODING_INT16}
+SIMULATOR_PORT = "Simulator"
+BAUDRATE = 921600
+READ_CHUNK = 65536
+# 只保留最近的資料供統計顯示, 記憶體用量固定
+WINDOW_SIZE = 4096
+PID_TYPES = {"position": POSITION_MODE, "velocity": VELOCITY_MODE}
+
+
+def load_script(path):
+    """讀取設定點腳本, 回傳 (依時間排序的 [(秒, 封包, key)], 腳本長度 (秒))
+
+    每行為「時間(s) 命令 參數...」, # 之後為註解:
+        0    pos 50                 位置目標 (mm)
+        2.5  vel -80                速度目標 (mm/s)
+        10   pid position 20 0.1 10 PID 參數
+        20   end                    腳本長度 (重複執行的週期), 沒有時為最後一個事件的時間
+    """
+    length = None
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            fields = line.split("#", 1)[0].split()
+            if not fields:
+                continue
+            try:
+                t, command, args = float(fields[0]), fields[1], fields[2:]
+                if command == "pos":
+                    events.append((t, pack_control(0, float(args[0]), POSITION_MODE), TARGET_KEY))
+                elif command == "vel":
+                    events.append((t, pack_control(float(args[0]), 0, VELOCITY_MODE), TARGET_KEY))
+                elif command == "end":
+                    length = t
+                elif command == "pid":
+                    kp, ki, kd = map(float, args[1:4])
+                    events.append((t, pack_pid_config(kp, ki, kd, PID_TYPES[args[0]]), (PID_KEY, PID_TYPES[args[0]])))
+                else:
+                    raise ValueError(f"unknown command {command!r}")
+            except (IndexError, KeyError, ValueError) as e:
+                raise ValueError(f"{path}:{number}: {e}") from None
+    events.sort(key=lambda event: event[0])
+    if length is None:
+        length = events[-1][0] if events else 0.0
+    return events, length
+
+
+def open_port(port):
+    if port == SIMULATOR_PORT:
+        from simulator import SimulatedSerial
+
+        return SimulatedSerial()
+    import serial
+
+    return serial.Serial(port, BAUDRATE, timeout=0.01)
+
+
+class HeadlessRun:
+    """不建立 GUI 的長時間擷取: 連線、協商協定、依腳本送出設定點、把遙測寫入錄製檔並定期輸出統計
+
+    解碼與錄製使用與 GUI 相同的 ProtocolDecoder / TelemetryRecorder / TransmitWorker,
+    只保留最近 WINDOW_SIZE 筆資料, 可連續執行數天而記憶體不增加;
+    rotate 秒數到時換一個新的錄製檔, 避免單一檔案過大。
+    """
+
+    def __init__(
+        self,
+        port,
+        record=None,
+        script=None,
+        loop=False,
+        rotate=None,
+        batch=DEFAULT_BATCH,
+        encoding=ENCODING_INT16,
+        down_sample=DEFAULT_DOWN_SAMPLE,
+    ):
+        self.port = port
+        self.record = record
+        self.rotate = rotate
+        self.events, self.script_length = load_script(script) if script else ([], 0.0)
+        self.loop = loop and bool(self.events)
+        field_mask = DEFAULT_FIELD_MASK if encoding == ENCODING_INT16 else FIELD_MASK_ALL
+        self.decoder = ProtocolDecoder(
+            PROTOCOL_V2, batch, encoding=encoding, field_mask=field_mask, down_sample=down_sample
+        )
+        self.window = TelemetryBuffer(WINDOW_SIZE)
+        self.transmitter = TransmitWorker()
+        self.recorder = None
+        self.files = 0
+        self.samples = 0
+        self.time_counter = 0.0
+
+    def _open_recorder(self):
+        if self.recorder is not None:
+            self.recorder.stop()
+        if self.rotate:
+            base, ext = os.path.splitext(self.record)
+            path = f"{base}_{self.files + 1:04d}_{time.strftime('%Y%m%d_%H%M%S')}{ext or '.prec'}"
+        else:
+            path = self.record
+        self.recorder = TelemetryRecorder(path)
+        self.transmitter.on_write = self.recorder.add_command
+        self.files += 1
+        self._file_start = time.monotonic()
+
+    def _send_events(self, elapsed):
+        """送出時間已到的腳本事件, loop 時以腳本長度為週期重複"""
+        period = self.script_length if self.loop else None
+        while self._next_event < len(self.events):
+            t, data, key = self.events[self._next_event]
+            if t + self._script_offset > elapsed:
+                return
+            self.transmitter.submit(data, key=key)
+            self._next_event += 1
+            if self._next_event == len(self.events) and period is not None:
+                # 週期為 0 (只有一個時間點) 時至少隔 1 秒再重複
+                self._script_offset += max(period, 1.0)
+                self._next_event = 0
+
+    def stats(self, elapsed, interval_samples, interval):
+        tx = self.transmitter.latency_stats()
+        last = self.window.view(last=1)
+        text = (
+            f"[{elapsed:9.0f} s] {interval_samples / interval:8.0f} samples/s  total {self.samples}  "
+            f"lost {self.decoder.lost}  resync {self.decoder.resyncs}  crc {self.decoder.crc_errors}  "
+            f"tx p50/max {tx['p50']:.2f}/{tx['max']:.2f} ms"
+        )
+        if len(last):
+            text += f"  pos {last['pos'][0]:.2f} mm  vel {last['vel'][0]:.1f} mm/s"
+        if self.recorder is not None:
+            text += f"  rec {self.recorder.bytes_written / 1e6:.1f} MB"
+        return text
+
+    def run(self, duration=None, stats_interval=5.0, print_fn=print):
+        ser = open_port(self.port)
+        self.transmitter.serial = ser
+        if self.record:
+            self._open_recorder()
+        self.transmitter.submit(self.decoder.hello(), key=PROTO_KEY)
+        self._next_event = 0
+        self._script_offset = 0.0
+        start = last_stats = time.monotonic()
+        interval_samples = 0
+        try:
+            while ser.is_open:
+                now = time.monotonic()
+                elapsed = now - start
+                if duration is not None and elapsed >= duration:
+                    break
+                if self.events:
+                    self._send_events(elapsed)
+                if self.rotate and self.recorder is not None and now - self._file_start >= self.rotate:
+                    self._open_recorder()
+                if now - last_stats >= stats_interval:
+                    print_fn(self.stats(elapsed, interval_samples, now - last_stats))
+                    last_stats = now
+                    interval_samples = 0
+
+                chunk = ser.read(min(max(ser.in_waiting, 1), READ_CHUNK))
+                reports = self.decoder.feed(chunk)
+                hello = self.decoder.retry_hello()
+                if hello is not None:
+                    # 裝置重置期間遺失了 proto_cfg_t
+                    self.transmitter.submit(hello, key=PROTO_KEY)
+                n = len(reports)
+                if n == 0:
+                    continue
+                # 與 PIDControlGUI.store_reports 相同的時間軸
+                time_values = self.time_counter + np.cumsum(reports["dt"])
+                self.time_counter = time_values[-1]
+                records = self.window.extend_reports(time_values, time.time(), reports)
+                if self.recorder is not None:
+                    self.recorder.add_reports(records)
+                self.samples += n
+                interval_samples += n
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.transmitter.stop()
+            if self.recorder is not None:
+                self.recorder.stop()
+            ser.close()
+        elapsed = time.monotonic() - start
+        print_fn(self.stats(elapsed, self.samples, max(elapsed, 1e-9)))
+        return self.samples
+
+
+def main(args):
+    """main.py --backend headless 的進入點"""
+    run = HeadlessRun(
+        args.port,
+        record=args.record,
+        script=args.script,
+        loop=args.loop,
+        rotate=args.rotate,
+        batch=args.batch,
+        encoding=ENCODINGS[args.encoding],
+        down_sample=args.down_sample,
+    )
+    run.run(args.duration, args.stats_interval)
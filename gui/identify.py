@@ -0,0 +1,295 @@
+import math
+
+import numpy as np
+
+from jit import njit
+from simulator import PlantModel, LOOP_DT, VEL_FILT, PWM_MAX
+
+# FOPDT 搜尋範圍
+MAX_DELAY = 0.02  # s
+TAU_RANGE = (0.002, 2.0)  # s
+TAU_GRID = 8
+GOLDEN_ITERATIONS = 20
+DEADBAND_ITERATIONS = 14
+# 模型輸出從零初始條件開始, 前面這段暫態不計入誤差 (s)
+WARMUP = 0.5
+
+
+def sample_time(records):
+    """回報間隔 (s), 以時間差的中位數估計"""
+    return float(np.median(np.diff(records["time"])))
+
+
+def applied_duty(output):
+    """與韌體 drive_motor() 相同: 控制輸出截斷成整數後飽和在 ±PWM_MAX"""
+    return np.clip(np.trunc(np.asarray(output, dtype=np.float64)), -PWM_MAX, PWM_MAX)
+
+
+def windows(records, length, step=None):
+    """依時間把紀錄切成長度 length (s) 的視窗, 每 step (s) 一個, 回傳切片串列"""
+    step = length if step is None else step
+    times = records["time"]
+    if not len(times):
+        return []
+    starts = np.arange(times[0], times[-1] - length + step / 2, step)
+    lo = np.searchsorted(times, starts)
+    hi = np.searchsorted(times, starts + length)
+    return [records[a:b] for a, b in zip(lo, hi)]
+
+
+def fit_score(y, y_model):
+    """NRMSE 吻合度 (%): 100 為完全吻合, 0 等同只用平均值"""
+    y = np.asarray(y, dtype=np.float64)
+    denom = np.linalg.norm(y - y.mean())
+    if denom == 0:
+        return 0.0
+    return float(100.0 * (1.0 - np.linalg.norm(y - y_model) / denom))
+
+
+@njit(cache=True)
+def _response(u, s, a, beta, out_u, out_s):
+    """一階受控體 (極點 a, 單位直流增益) 加上韌體速度量測 (極點 beta) 對 u 與 s 的響應
+
+    韌體的速度是編碼器位置的差分, 等於相鄰兩個迴圈速度的平均 (半個取樣的延遲), 之後才經過 VEL_FILT 濾波。
+    """
+    vu = vs = zu = zs = 0.0
+    out_u[0] = out_s[0] = 0.0
+    for k in range(1, len(u)):
+        last_u, last_s = vu, vs
+        vu = a * vu + (1.0 - a) * u[k - 1]
+        vs = a * vs + (1.0 - a) * s[k - 1]
+        zu = beta * zu + (1.0 - beta) * 0.5 * (last_u + vu)
+        zs = beta * zs + (1.0 - beta) * 0.5 * (last_s + vs)
+        out_u[k] = zu
+        out_s[k] = zs
+
+
+class _FopdtProblem:
+    """固定 tau 時, 增益與死區為線性參數: z ≈ K * R_u[k - n] - K * d * R_s[k - n]"""
+
+    def __init__(self, z, u, ts, max_lag, start):
+        self.z = z
+        self.u = u
+        self.s = np.sign(u)
+        self.ts = ts
+        self.max_lag = max_lag
+        self.start = start
+        # 韌體每 LOOP_DT 濾波一次, 回報間隔較長時合併為一個極點
+        self.beta = (1.0 - VEL_FILT) ** (ts * 1000 / LOOP_DT)
+        self.zz = float(z[start:] @ z[start:])
+        self.ru = np.empty_like(z)
+        self.rs = np.empty_like(z)
+
+    def basis(self, tau):
+        _response(self.u, self.s, math.exp(-self.ts / tau), self.beta, self.ru, self.rs)
+
+    def solve_all(self):
+        """一次計算所有延遲的誤差, 回傳 (最小誤差平方和, 參數, 延遲)"""
+        n = len(self.z)
+        z = self.z[self.start :]
+        # 各延遲的互相關 (BLAS 內積)
+        corr = np.array(
+            [
+                [z @ self.ru[self.start - lag : n - lag], z @ self.rs[self.start - lag : n - lag]]
+                for lag in range(self.max_lag + 1)
+            ]
+        )
+        # 不同延遲的 Gram 矩陣以累積和在 O(1) 取得
+        cuu = np.concatenate([[0.0], np.cumsum(self.ru * self.ru)])
+        css = np.concatenate([[0.0], np.cumsum(self.rs * self.rs)])
+        cus = np.concatenate([[0.0], np.cumsum(self.ru * self.rs)])
+        best = (np.inf, None, 0)
+        for lag in range(self.max_lag + 1):
+            lo, hi = self.start - lag, n - lag
+            G = np.array(
+                [[cuu[hi] - cuu[lo], cus[hi] - cus[lo]], [cus[hi] - cus[lo], css[hi] - css[lo]]]
+            )
+            sse, theta = self._sse(G, corr[lag])
+            if sse < best[0]:
+                best = (sse, theta, lag)
+        return best
+
+    def deadzone(self, tau, lag, deadband):
+        """以實際死區 PWM 計算, 回傳 (誤差平方和, 增益, 模型輸出)"""
+        w = np.sign(self.u) * np.maximum(np.abs(self.u) - deadband, 0.0)
+        _response(w, self.s, math.exp(-self.ts / tau), self.beta, self.ru, self.rs)
+        n = len(self.z)
+        r = self.ru[self.start - lag : n - lag]
+        rr = r @ r
+        if rr == 0:
+            return np.inf, 0.0, r
+        zr = self.z[self.start :] @ r
+        gain = zr / rr
+        return self.zz - gain * zr, float(gain), gain * r
+
+    def _sse(self, G, g):
+        try:
+            theta = np.linalg.solve(G, g)
+        except np.linalg.LinAlgError:
+            return np.inf, None
+        return self.zz - theta @ g, theta
+
+
+def fit_fopdt(records, max_delay=MAX_DELAY, tau_range=TAU_RANGE):
+    """以 PWM (output) 與速度 (vel) 擬合一階加純延遲 (FOPDT) 與 PWM 死區
+
+    模型包含韌體的編碼器差分與 VEL_FILT 速度濾波, 因此得到的是馬達 + 滑軌本身的參數:
+    tau 以對數網格加黃金分割搜尋, 每個 tau 的增益與死區以最小平方直接解出,
+    延遲以一次互相關比較所有候選值。回傳
+    {"gain", "tau", "delay", "deadband", "fit" (%), "ts", "samples"}。
+
+    閉迴路 (速度 PID) 紀錄也適用, 但需要每個迴圈都回報 (down_sample=1): 回報之間的 PWM 無從得知,
+    回報率較低時增益與 tau 會偏小。量化雜訊經回授與 PWM 相關, 死區仍可能偏差數個 PWM;
+    test_identify.py 以模擬器檢查參數是否還原。
+    """
+    ts = sample_time(records)
+    z = records["vel"].astype(np.float64)
+    u = applied_duty(records["output"])
+    max_lag = int(round(max_delay / ts))
+    start = max(int(round(WARMUP / ts)), max_lag + 1)
+    if len(z) <= start + 10:
+        raise ValueError("not enough samples to identify a model")
+    problem = _FopdtProblem(z, u, ts, max_lag, start)
+
+    # 粗網格: 找最佳的 (tau, 延遲)
+    grid = np.geomspace(tau_range[0], tau_range[1], TAU_GRID)
+    errors = []
+    best = None
+    for tau in grid:
+        problem.basis(tau)
+        sse, theta, lag = problem.solve_all()
+        errors.append(sse)
+        if best is None or sse < best[0]:
+            best = (sse, theta, lag, tau)
+    _, theta, lag, tau = best
+    if theta is None:
+        # 所有延遲的最小平方都無解, 例如 PWM 全為 0
+        raise ValueError("excitation too small to identify a model")
+
+    # 在相鄰網格點之間以黃金分割細調 tau (對數尺度); tau 與延遲會互相取代,
+    # 每個 tau 都重新比較所有延遲, 不沿用粗網格上的延遲
+    k = int(np.argmin(errors))
+
+    def tau_cost(log_tau):
+        problem.basis(math.exp(log_tau))
+        return problem.solve_all()
+
+    log_tau, (sse, refined, refined_lag) = _golden(
+        tau_cost, math.log(grid[max(k - 1, 0)]), math.log(grid[min(k + 1, len(grid) - 1)])
+    )
+    if refined is not None and sse <= best[0]:
+        theta, lag, tau = refined, refined_lag, math.exp(log_tau)
+    gain = float(theta[0])
+    deadband = max(float(-theta[1] / theta[0]), 0.0) if gain else 0.0
+
+    # 上面以 sign(u) 線性近似死區, 這裡改用實際的死區非線性細調 (此時增益為唯一的線性參數)
+    deadband, (_, gain, model) = _golden(
+        lambda d: problem.deadzone(tau, lag, d), 0.0, min(2 * deadband, PWM_MAX) + 1.0, DEADBAND_ITERATIONS
+    )
+    n = len(z)
+    return {
+        "gain": gain,
+        "tau": float(tau),
+        "delay": lag * ts,
+        "deadband": deadband,
+        # 吻合度以模型的模擬輸出 (非一步預測) 計算
+        "fit": fit_score(z[start:], model),
+        "ts": ts,
+        "samples": n - start,
+    }
+
+
+def _golden(cost, lo, hi, iterations=GOLDEN_ITERATIONS):
+    """黃金分割搜尋 cost(x)[0] 的最小值, 回傳 (x, cost(x))"""
+    ratio = (math.sqrt(5) - 1) / 2
+    x1 = hi - ratio * (hi - lo)
+    x2 = lo + ratio * (hi - lo)
+    f1, f2 = cost(x1), cost(x2)
+    for _ in range(iterations):
+        if f1[0] < f2[0]:
+            hi, x2, f2 = x2, x1, f1
+            x1 = hi - ratio * (hi - lo)
+            f1 = cost(x1)
+        else:
+            lo, x1, f1 = x1, x2, f2
+            x2 = lo + ratio * (hi - lo)
+            f2 = cost(x2)
+    return (x1, f1) if f1[0] < f2[0] else (x2, f2)
+
+
+def to_plant(model, travel=None):
+    """把 fit_fopdt() 的結果轉成 PlantModel, 可直接交給 FirmwareSimulator 與 autotune"""
+    kwargs = {} if travel is None else {"travel": travel}
+    return PlantModel(
+        gain=model["gain"],
+        tau=model["tau"],
+        deadband=model["deadband"],
+        delay=round(model["delay"] * 1000 / LOOP_DT) * LOOP_DT / 1000,
+        **kwargs,
+    )
+
+
+def _lagged(x, lags, start):
+    """回傳 (len(x) - start, len(lags)) 的延遲矩陣, 第 j 欄為 x[k - lags[j]]"""
+    n = len(x)
+    return np.column_stack([x[start - lag : n - lag] for lag in lags])
+
+
+@njit(cache=True)
+def _simulate_arx(a, b, nk, u, y0, out):
+    """以 ARX 模型自由模擬 (不使用量測輸出), 前 len(y0) 筆為初始條件"""
+    na = len(a)
+    nb = len(b)
+    start = len(y0)
+    out[:start] = y0
+    for k in range(start, len(u)):
+        acc = 0.0
+        for i in range(na):
+            acc -= a[i] * out[k - 1 - i]
+        for j in range(nb):
+            acc += b[j] * u[k - nk - j]
+        out[k] = acc
+
+
+def fit_arx(records, output="vel", na=2, nb=2, nk=1):
+    """以最小平方擬合 ARX 模型 y[k] + a1 y[k-1] + ... = b1 u[k-nk] + ... (u 為實際 PWM)
+
+    回傳 {"a", "b", "nk", "stable", "fit" (自由模擬的 %, 不穩定時為 -inf), "prediction_fit" (一步預測的 %), "ts"}。
+    """
+    y = records[output].astype(np.float64)
+    u = applied_duty(records["output"])
+    start = max(na, nb + nk - 1)
+    if len(y) <= start + na + nb:
+        raise ValueError("not enough samples to identify a model")
+    X = np.hstack(
+        [-_lagged(y, range(1, na + 1), start), _lagged(u, range(nk, nk + nb), start)]
+    )
+    theta, *_ = np.linalg.lstsq(X, y[start:], rcond=None)
+    a, b = theta[:na], theta[na:]
+    # 量化雜訊大時一步預測很準但模型可能不穩定, 自由模擬會發散
+    stable = bool(np.all(np.abs(np.roots(np.concatenate([[1.0], a]))) < 1))
+    if stable:
+        simulated = np.empty_like(y)
+        _simulate_arx(a, b, nk, u, y[:start].copy(), simulated)
+        fit = fit_score(y[start:], simulated[start:])
+    else:
+        fit = -np.inf
+    return {
+        "a": a,
+        "b": b,
+        "nk": nk,
+        "stable": stable,
+        "fit": fit,
+        "prediction_fit": fit_score(y[start:], X @ theta),
+        "ts": sample_time(records),
+    }
+
+
+def simulate_arx(model, output_pwm, y0=None):
+    """以 fit_arx() 的結果模擬 PWM 序列 output_pwm 的響應"""
+    u = applied_duty(output_pwm)
+    start = max(len(model["a"]), len(model["b"]) + model["nk"] - 1)
+    y0 = np.zeros(start) if y0 is None else np.asarray(y0, dtype=np.float64)[:start]
+    out = np.empty(len(u))
+    _simulate_arx(model["a"], model["b"], model["nk"], u, y0, out)
+    return out
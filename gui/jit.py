@@ -0,0 +1,8 @@
+try:
+    from numba import njit
+except ImportError:  # 沒有 numba 時以純 Python 執行 (較慢但結果相同)
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
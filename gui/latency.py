@@ -0,0 +1,169 @@
+import csv
+import threading
+import time
+
+import numpy as np
+
+# 每個畫面記錄的時間點 (time.perf_counter, 秒), 依資料流順序
+TIMESTAMPS = (
+    "read",  # 序列埠讀取完成 (擷取行程模式為該行程收到資料的時間)
+    "decode",  # 解碼完成 (擷取行程模式為 GUI 行程從共享記憶體取到資料)
+    "insert",  # 寫入 TelemetryBuffer
+    "schedule",  # root.after 排程繪圖
+    "render",  # Tk 開始執行 update_charts
+    "drawn",  # canvas.draw / blit 完成
+)
+# 各階段 = 相鄰時間點的差, 另加整體延遲與裝置取樣到讀取的延遲
+STAGES = ("sample", "decode", "insert", "schedule", "dispatch", "draw", "total")
+STAGE_LABELS = {
+    "sample": "取樣→讀取",
+    "decode": "讀取→解碼",
+    "insert": "解碼→寫入",
+    "schedule": "寫入→排程",
+    "dispatch": "排程→執行",
+    "draw": "繪圖",
+    "total": "讀取→畫面",
+}
+TRACE_DTYPE = np.dtype(
+    [(name, "<f8") for name in TIMESTAMPS] + [("samples", "<i8"), ("sample_age", "<f8"), ("offset", "<f8")]
+)
+# 滾動視窗的畫面數
+TRACE_HISTORY = 4096
+
+
+class LatencyTracer:
+    """從裝置取樣到畫面更新的延遲追蹤
+
+    同一畫面之前到達的多批資料以最早的一批計算延遲 (畫面最舊資料的延遲)。
+    batch() 在接收端呼叫, scheduled() / frame_start() / frame_done() 在排程與 Tk 執行緒呼叫,
+    每次只寫入預先配置的環形陣列; 百分位數在 stats() 時才計算。
+    不追蹤時 GUI 端的 tracer 為 None, 只多一次屬性判斷。
+
+    取樣延遲以裝置時間軸估計: 主機接收時間 - 裝置時間的差值扣掉視窗內的最小值,
+    因此是相對於最快的一批, 包含韌體批次、序列傳輸與讀取等待, 不含固定的時鐘偏移。
+    """
+
+    def __init__(self, history=TRACE_HISTORY):
+        self._trace = np.zeros(history, dtype=TRACE_DTYPE)
+        self.frames = 0
+        self._lock = threading.Lock()
+        self._pending = None
+        self._frame = None
+
+    def batch(self, records, read, decode, insert=None):
+        """一批資料寫入緩衝區後呼叫, read / decode / insert 為 perf_counter 時間"""
+        if not len(records):
+            return
+        insert = time.perf_counter() if insert is None else insert
+        host_time = records["host_time"]
+        device_time = records["time"]
+        # 最舊一筆的 (主機 - 裝置) 差值, 與最新一筆的差值 (作為基準的候選)
+        oldest = float(host_time[0] - device_time[0])
+        newest = float(host_time[-1] - device_time[-1])
+        with self._lock:
+            pending = self._pending
+            if pending is None:
+                self._pending = [read, decode, insert, np.nan, len(records), oldest, newest]
+            else:
+                pending[4] += len(records)
+                pending[6] = min(pending[6], newest)
+
+    def scheduled(self):
+        """root.after 排程繪圖後呼叫"""
+        now = time.perf_counter()
+        with self._lock:
+            if self._pending is not None and np.isnan(self._pending[3]):
+                self._pending[3] = now
+
+    def frame_start(self):
+        """update_charts 開始時呼叫, 取走目前畫面要顯示的資料"""
+        now = time.perf_counter()
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is not None and np.isnan(pending[3]):
+            # 資料到達時已經有排程中的畫面, 直接由它畫出
+            pending[3] = pending[2]
+        self._frame = (pending, now)
+
+    def frame_done(self):
+        """renderer.update() 完成後呼叫"""
+        if self._frame is None:
+            return
+        (pending, render), self._frame = self._frame, None
+        if pending is None:
+            return
+        drawn = time.perf_counter()
+        read, decode, insert, schedule, samples, oldest, newest = pending
+        row = self._trace[self.frames % len(self._trace)]
+        row["read"] = read
+        row["decode"] = decode
+        row["insert"] = insert
+        row["schedule"] = schedule
+        row["render"] = render
+        row["drawn"] = drawn
+        row["samples"] = samples
+        row["sample_age"] = oldest
+        row["offset"] = newest
+        self.frames += 1
+
+    def trace(self):
+        """視窗內的畫面紀錄 (由舊到新, TRACE_DTYPE), sample_age 已換成相對延遲"""
+        history = len(self._trace)
+        n = min(self.frames, history)
+        out = self._trace[(self.frames - n + np.arange(n)) % history]
+        if n:
+            out["sample_age"] -= out["offset"].min()
+        return out
+
+    def durations(self, trace=None):
+        """各階段延遲 (秒), 回傳 {stage: 陣列}"""
+        trace = self.trace() if trace is None else trace
+        out = {"sample": trace["sample_age"]}
+        for stage, (start, end) in zip(STAGES[1:-1], zip(TIMESTAMPS, TIMESTAMPS[1:])):
+            out[stage] = trace[end] - trace[start]
+        out["total"] = trace["drawn"] - trace["read"]
+        return out
+
+    def stats(self):
+        """各階段的 {"p50", "p99", "max"} (ms)"""
+        out = {}
+        for stage, values in self.durations().items():
+            if not len(values):
+                out[stage] = {"p50": 0.0, "p99": 0.0, "max": 0.0}
+                continue
+            values = values * 1000
+            p50, p99 = np.percentile(values, [50, 99])
+            out[stage] = {"p50": p50, "p99": p99, "max": values.max()}
+        return out
+
+    def histogram(self, stage, bins=None):
+        """某階段延遲的分佈, 預設為 0.01 ms ~ 10 s 的對數間隔, 回傳 (次數, 邊界 ms)"""
+        bins = np.geomspace(0.01, 10000, 61) if bins is None else bins
+        values = self.durations()[stage] * 1000
+        return np.histogram(np.clip(values, bins[0], bins[-1]), bins)
+
+    def save(self, path):
+        """把每個畫面的各階段延遲 (ms) 寫成 CSV"""
+        trace = self.trace()
+        durations = self.durations(trace)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("read", "samples") + STAGES)
+            columns = [trace["read"], trace["samples"]] + [durations[stage] * 1000 for stage in STAGES]
+            writer.writerows(zip(*[column.tolist() for column in columns]))
+        return len(trace)
+
+    def reset(self):
+        with self._lock:
+            self._trace[:] = 0
+            self.frames = 0
+            self._pending = None
+
+
+def format_stats(stats):
+    """診斷面板的文字表格"""
+    lines = [f"{'階段':<8}{'p50':>9}{'p99':>9}{'max':>9}  (ms)"]
+    for stage in STAGES:
+        s = stats[stage]
+        lines.append(f"{STAGE_LABELS[stage]:<8}{s['p50']:>9.2f}{s['p99']:>9.2f}{s['max']:>9.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,141 @@
+import numpy as np
+
+# 每層的合併倍數 (第 L 層每個區段包含 FACTOR ** L 筆原始資料)
+FACTOR = 4
+
+
+def _reduce(times, values, size):
+    """把原始資料每 size 筆合併為一個 (時間, 最小值, 最大值), 最後一段可不滿"""
+    idx = np.arange(0, len(values), size)
+    return times[idx], np.minimum.reduceat(values, idx), np.maximum.reduceat(values, idx)
+
+
+class _Level:
+    """單一解析度的 min/max 區段, 以絕對區段序號存放在鏡像環形陣列中"""
+
+    def __init__(self, size, capacity, n_fields):
+        self.size = size  # 每個區段包含的原始筆數
+        self.capacity = capacity
+        self.time = np.zeros(2 * capacity)
+        self.min = np.zeros((n_fields, 2 * capacity), dtype=np.float32)
+        self.max = np.zeros((n_fields, 2 * capacity), dtype=np.float32)
+        self.first = 0  # 第一個有效區段的序號
+        self.count = 0  # 已完成的區段數 (下一個區段的序號)
+
+    def reset(self, start):
+        """從原始序號 start 之後的第一個完整區段重新開始"""
+        self.first = self.count = -(-start // self.size)
+
+    def append(self, time, mn, mx):
+        idx = np.arange(self.count, self.count + len(time)) % self.capacity
+        for offset in (0, self.capacity):
+            self.time[idx + offset] = time
+            self.min[:, idx + offset] = mn
+            self.max[:, idx + offset] = mx
+        self.count += len(time)
+
+    def span(self, k0, k1):
+        """回傳區段 [k0, k1) 在陣列中的連續切片 (k1 - k0 <= capacity)"""
+        start = k0 % self.capacity
+        return slice(start, start + k1 - k0)
+
+    def oldest(self):
+        return max(self.first, self.count - self.capacity)
+
+
+class MinMaxPyramid:
+    """TelemetryBuffer 的多解析度 min/max 抽樣索引
+
+    第 L 層把每 FACTOR ** L 筆原始資料合併為 (最小值, 最大值), 每次 update() 只處理新進的資料,
+    由下往上逐層合併。query() 依可見範圍挑選區段數不超過 max_points / 2 的最細層級,
+    每個區段畫出最小與最大兩點, 因此縮小檢視時窄尖峰也不會消失。
+    update() 與 query() 需在同一個執行緒 (GUI 執行緒) 呼叫。
+    """
+
+    def __init__(self, buffer, fields, factor=FACTOR):
+        self.buffer = buffer
+        self.fields = tuple(fields)
+        self.factor = factor
+        self.levels = []
+        size = factor
+        while size <= buffer.capacity:
+            self.levels.append(_Level(size, buffer.capacity // size + 2, len(self.fields)))
+            size *= factor
+        self._done = 0  # 已處理的原始序號
+
+    def reset(self, start=0):
+        for level in self.levels:
+            level.reset(start)
+        self._done = start
+
+    def update(self):
+        """把緩衝區中新進的資料併入各層"""
+        data, start = self.buffer.window()
+        total = start + len(data)
+        # 緩衝區被清除, 或新資料多到舊資料已被覆寫: 從目前視窗重新建立
+        if total < self._done or (self.levels and start > self.levels[0].count * self.levels[0].size):
+            self.reset(start)
+        if not self.levels or total == self._done:
+            return
+
+        src = None
+        for level in self.levels:
+            k1 = total // level.size
+            if k1 <= level.count:
+                break
+            if src is None:
+                # 第一層直接由原始資料合併
+                a = level.count * level.size - start
+                b = k1 * level.size - start
+                mn = np.empty((len(self.fields), k1 - level.count), dtype=np.float32)
+                mx = np.empty_like(mn)
+                for j, name in enumerate(self.fields):
+                    block = data[name][a:b].reshape(-1, level.size)
+                    mn[j] = block.min(axis=1)
+                    mx[j] = block.max(axis=1)
+                time = data["time"][a:b:level.size]
+            else:
+                # 其他層由下一層的 FACTOR 個區段合併
+                s = src.span(level.count * self.factor, k1 * self.factor)
+                n = k1 - level.count
+                mn = src.min[:, s].reshape(len(self.fields), n, self.factor).min(axis=2)
+                mx = src.max[:, s].reshape(len(self.fields), n, self.factor).max(axis=2)
+                time = src.time[s][:: self.factor]
+            level.append(time, mn, mx)
+            src = level
+        self._done = total
+
+    def query(self, field, t0=None, t1=None, max_points=2000):
+        """回傳時間範圍 [t0, t1] 內要繪製的 (x, y), 點數約不超過 max_points"""
+        data, start = self.buffer.window()
+        times = data["time"]
+        i0 = 0 if t0 is None else int(np.searchsorted(times, t0))
+        i1 = len(data) if t1 is None else int(np.searchsorted(times, t1, side="right"))
+        values = data[field]
+        if i1 - i0 <= max_points or not self.levels:
+            return times[i0:i1], values[i0:i1]
+
+        # 區段數不超過 max_points / 2 的最細層級
+        i0 += start
+        i1 += start
+        level = self.levels[-1]
+        for candidate in self.levels:
+            if (i1 - i0) // candidate.size <= max_points // 2:
+                level = candidate
+                break
+        j = self.fields.index(field)
+        size = level.size
+        k0 = max(-(-i0 // size), level.oldest())
+        k1 = min(i1 // size, level.count)
+        if k1 <= k0:
+            t, mn, mx = _reduce(times[i0 - start : i1 - start], values[i0 - start : i1 - start], size)
+            return np.repeat(t, 2), np.column_stack([mn, mx]).ravel()
+
+        # 頭尾不足一個區段 (或尚未併入) 的部分直接由原始資料合併
+        head = _reduce(times[i0 - start : k0 * size - start], values[i0 - start : k0 * size - start], size)
+        tail = _reduce(times[k1 * size - start : i1 - start], values[k1 * size - start : i1 - start], size)
+        s = level.span(k0, k1)
+        t = np.concatenate([head[0], level.time[s], tail[0]])
+        mn = np.concatenate([head[1], level.min[j, s], tail[1]])
+        mx = np.concatenate([head[2], level.max[j, s], tail[2]])
+        return np.repeat(t, 2), np.column_stack([mn, mx]).ravel()
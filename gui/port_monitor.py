@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import deque
+
+# 列舉序列埠的間隔 (秒); pyserial 沒有跨平台的插拔事件, 以輪詢比對清單
+SCAN_INTERVAL = 0.5
+# 超過此時間沒有收到任何資料即判定斷線 (秒)
+LINK_TIMEOUT = 0.5
+# 開啟連線後等待第一筆資料的時間 (秒), Uno 開啟序列埠時會重置, bootloader 約 1.5 秒
+RESUME_TIMEOUT = 3.0
+# 重新連線的退避間隔 (秒): 由 RETRY_MIN 起每次加倍, 最多 RETRY_MAX
+RETRY_MIN = 0.05
+RETRY_MAX = 2.0
+
+
+def scan():
+    """目前的序列埠清單 [(device, description, hwid)], 依名稱排序"""
+    from serial.tools import list_ports
+
+    return [(p.device, p.description, p.hwid) for p in sorted(list_ports.comports())]
+
+
+class PortWatcher:
+    """背景執行緒定期列舉序列埠, 清單改變 (插拔) 時在該執行緒呼叫 on_change(ports)"""
+
+    def __init__(self, on_change, ports=None, interval=SCAN_INTERVAL):
+        self.on_change = on_change
+        self.ports = scan() if ports is None else ports
+        self.interval = interval
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            ports = scan()
+            if ports != self.ports:
+                self.ports = ports
+                self.on_change(ports)
+
+    def stop(self):
+        self._stop.set()
+
+
+class LinkMonitor:
+    """單一連線的健康狀態與重新連線的退避間隔
+
+    接收端每收到一批資料呼叫 alive(), 超過 timeout 沒有資料時 expired() 為 True;
+    剛開啟連線時改以 resume_timeout 等待裝置開始回報。重新開啟失敗後 wait_retry() 依退避間隔等待,
+    序列埠清單改變 (notify()) 時提前結束並從最短間隔重新退避, 裝置重新插上後立即重試。
+    """
+
+    def __init__(self, timeout=LINK_TIMEOUT, resume_timeout=RESUME_TIMEOUT, retry_min=RETRY_MIN, retry_max=RETRY_MAX):
+        self.timeout = timeout
+        self.resume_timeout = resume_timeout
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.lost_at = None
+        self.reconnects = 0
+        self.outages = deque(maxlen=100)  # 每次從最後一筆資料到恢復資料的時間 (秒)
+        self._delay = retry_min
+        self._wake = threading.Event()
+        self.reset()
+
+    def reset(self):
+        """使用者開啟新的連線: 清除中斷狀態"""
+        self.down = False
+        self.connected()
+
+    def connected(self):
+        """開啟連線後呼叫, resume_timeout 內沒有資料才判定斷線"""
+        self.last_data = time.monotonic()
+        self._limit = self.resume_timeout
+
+    def alive(self):
+        self.last_data = time.monotonic()
+        self._limit = self.timeout
+
+    def expired(self):
+        return time.monotonic() - self.last_data > self._limit
+
+    def lost(self):
+        """判定斷線, 回傳是否為新的中斷 (重新開啟後又失敗時為 False, 退避間隔繼續加倍)"""
+        if self.down:
+            return False
+        self.down = True
+        self.lost_at = self.last_data
+        self._delay = self.retry_min
+        return True
+
+    def outage(self):
+        """從最後一筆資料到現在的時間 (秒)"""
+        return time.monotonic() - self.lost_at
+
+    def wait_retry(self):
+        """等待下一次重新開啟"""
+        delay = self._delay
+        self._delay = min(delay * 2, self.retry_max)
+        if self._wake.wait(delay):
+            # 序列埠清單剛改變
+            self._delay = self.retry_min
+        self._wake.clear()
+
+    def notify(self):
+        self._wake.set()
+
+    def reconnected(self):
+        """重新連線後收到第一批資料時呼叫, 回傳這次中斷的時間 (秒)"""
+        outage = self.outage()
+        self.down = False
+        self.reconnects += 1
+        self.outages.append(outage)
+        return outage
@@ -0,0 +1,527 @@
+import binascii
+import struct
+import time
+
+import numpy as np
+
+from telemetry_buffer import REPORT_FIELDS
+
+# 封包識別碼 (與 src/main.cpp 相同)
+REPORT_IDENT = b"\xAA\xBB\xCC\xDD"
+CTRL_CFG_IDENT = b"\xAA\xBB\xCC\xEE"
+PID_CFG_IDENT = b"\xAA\xBB\xCC\xFF"
+PROTO_CFG_IDENT = b"\xAA\xBB\xCC\xA0"
+FRAME_V2_IDENT = b"\xAA\xBB\xCC\xD2"
+SESSION_IDENT = b"\xAA\xBB\xCC\xD3"
+COMPACT_IDENT = b"\xAA\xBB\xCC\xD4"
+
+# 協定版本: v1 為 36 byte status_report_t, v2 加上序號、微秒時間戳記、CRC 與批次樣本
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+# v2 每個 frame 最多的樣本數 (src/main.cpp MAX_BATCH)
+MAX_BATCH = 8
+
+# v2 樣本編碼: float32, 或 int16 定點 (刻度由 session frame 告知)
+ENCODING_FLOAT = 0
+ENCODING_INT16 = 1
+# 欄位遮罩 (bit k 對應 REPORT_FIELDS[k]), d 在韌體固定為 0 因此預設不送
+FIELD_MASK_ALL = (1 << len(REPORT_FIELDS)) - 1
+DEFAULT_FIELD_MASK = FIELD_MASK_ALL & ~(1 << REPORT_FIELDS.index("d"))
+# int16 定點刻度 (src/main.cpp FIXED_SCALE): 實際值 = 整數 * 刻度
+FIXED_SCALE = (0.02, 0.01, 0.02, 0.01, 0.25, 0.25, 0.25, 0.25)
+# int16 編碼時的最大回報降採樣 (樣本時間差不超過 65.535 ms)
+MAX_COMPACT_DOWN_SAMPLE = 60
+
+# control_t.mode / pid_config_t.type
+VELOCITY_MODE = 0
+POSITION_MODE = 1
+
+# 韌體回報週期 (LOOP_DT * DOWN_SAMPLE, 秒)
+REPORT_PERIOD = 0.01
+# 協商時送出 proto_cfg_t 的次數上限, 每次都只收到 v1 回報才固定為 v1
+# (開啟序列埠會重置 Uno, bootloader 期間送出的 proto_cfg_t 會遺失)
+HELLO_ATTEMPTS = 5
+
+# 韌體的目標限制 (src/main.cpp)
+MIN_VEL = 4.9  # mm/s
+MAX_VEL = 400.1  # mm/s
+MIN_POS = -0.1  # mm
+MAX_POS = 200.1  # mm
+
+# status_report_t 的線上格式: 8 個 float32 + 4 byte 結尾
+REPORT_DTYPE = np.dtype(
+    [(name, "<f4") for name in REPORT_FIELDS] + [("ident", "u1", (4,))]
+)
+REPORT_SIZE = REPORT_DTYPE.itemsize  # 36
+
+# v2 frame: frame_header_t + count 個 sample_t + CRC-16/CCITT-FALSE (從 ident 到最後一個樣本)
+FRAME_HEADER_DTYPE = np.dtype([("ident", "u1", (4,)), ("seq", "<u4"), ("count", "<u2")])
+FRAME_HEADER_SIZE = FRAME_HEADER_DTYPE.itemsize  # 10
+SAMPLE_V2_DTYPE = np.dtype([("time_us", "<u4")] + [(name, "<f4") for name in REPORT_FIELDS])
+SAMPLE_V2_SIZE = SAMPLE_V2_DTYPE.itemsize  # 36
+CRC_SIZE = 2
+
+# session frame: 編碼、欄位遮罩、回報降採樣與各欄位刻度, 切換協定時與每秒送出一次
+SESSION_DTYPE = np.dtype(
+    [
+        ("ident", "u1", (4,)),
+        ("encoding", "u1"),
+        ("field_mask", "u1"),
+        ("down_sample", "u1"),
+        ("reserved", "u1"),
+        ("scale", "<f4", (len(REPORT_FIELDS),)),
+    ]
+)
+SESSION_SIZE = SESSION_DTYPE.itemsize + CRC_SIZE  # 42
+# 定點 frame: 標頭多一個第一筆樣本的時間, 每筆樣本為 uint16 時間差 (us) + 遮罩內欄位的 int16
+COMPACT_HEADER_SIZE = FRAME_HEADER_SIZE + 4  # 14
+
+# 兩種協定共用的解碼結果: seq 為樣本序號, dt 為與前一筆樣本的裝置時間差 (秒)
+SAMPLE_DTYPE = np.dtype(
+    [(name, "<f4") for name in REPORT_FIELDS] + [("seq", "<u4"), ("dt", "<f8")]
+)
+
+
+def pack_control(target_vel, target_pos, mode):
+    """打包 control_t"""
+    return struct.pack("<4sffi", CTRL_CFG_IDENT, target_vel, target_pos, mode)
+
+
+def pack_pid_config(kp, ki, kd, pid_type):
+    """打包 pid_config_t, pid_type 0: velocity, 1: position"""
+    return struct.pack("<4sfffi", PID_CFG_IDENT, kp, ki, kd, pid_type)
+
+
+def pack_protocol_config(version, batch=1, encoding=ENCODING_FLOAT, field_mask=FIELD_MASK_ALL, down_sample=0):
+    """打包 proto_cfg_t, 要求韌體改用指定的協定版本、批次大小與編碼
+
+    down_sample 為每幾個 1 ms 迴圈回報一次, 0 表示韌體預設 (DOWN_SAMPLE);
+    int16 編碼的樣本時間差為 uint16 微秒, 因此韌體把 down_sample 限制在 MAX_COMPACT_DOWN_SAMPLE 以內。
+    """
+    return struct.pack(
+        "<4sBBBBBxxx", PROTO_CFG_IDENT, version, batch, encoding, field_mask, down_sample
+    )
+
+
+def unpack_command(data):
+    """解析主機送出的封包 (pack_* 的反向), 回傳 (種類, 欄位 dict), 無法辨識時為 ("unknown", {})"""
+    data = bytes(data)
+    ident = data[:4]
+    if ident == CTRL_CFG_IDENT and len(data) >= 16:
+        target_vel, target_pos, mode = struct.unpack_from("<ffi", data, 4)
+        return "control", {"target_vel": target_vel, "target_pos": target_pos, "mode": mode}
+    if ident == PID_CFG_IDENT and len(data) >= 20:
+        kp, ki, kd, pid_type = struct.unpack_from("<fffi", data, 4)
+        return "pid", {"kp": kp, "ki": ki, "kd": kd, "mode": pid_type}
+    if ident == PROTO_CFG_IDENT and len(data) >= 9:
+        version, batch, encoding, field_mask, down_sample = struct.unpack_from("<5B", data, 4)
+        return "protocol", {
+            "version": version,
+            "batch": batch,
+            "encoding": encoding,
+            "field_mask": field_mask,
+            "down_sample": down_sample,
+        }
+    return "unknown", {}
+
+
+def crc16(data, crc=0xFFFF):
+    """CRC-16/CCITT-FALSE (與 src/main.cpp 的 crc16_update 相同)"""
+    return binascii.crc_hqx(data, crc)
+
+
+def encode_reports(reports):
+    """把含 REPORT_FIELDS 欄位的結構化陣列編碼成 status_report_t 位元組串"""
+    frames = np.empty(len(reports), dtype=REPORT_DTYPE)
+    for name in REPORT_FIELDS:
+        frames[name] = reports[name]
+    frames["ident"] = np.frombuffer(REPORT_IDENT, dtype=np.uint8)
+    return frames.tobytes()
+
+
+def encode_frames_v2(reports, time_us, seq, batch=1):
+    """把 len(reports) 筆樣本編碼成每 batch 筆一個的 v2 frame (最後一個 frame 可不滿)"""
+    samples = np.empty(len(reports), dtype=SAMPLE_V2_DTYPE)
+    samples["time_us"] = time_us
+    for name in REPORT_FIELDS:
+        samples[name] = reports[name]
+    out = bytearray()
+    for start in range(0, len(samples), batch):
+        part = samples[start : start + batch]
+        frame = struct.pack("<4sIH", FRAME_V2_IDENT, (seq + start) & 0xFFFFFFFF, len(part)) + part.tobytes()
+        out += frame + struct.pack("<H", crc16(frame))
+    return bytes(out)
+
+
+def encode_session(encoding, field_mask, down_sample, scale=FIXED_SCALE):
+    """編碼 session frame"""
+    frame = struct.pack(
+        f"<4sBBBx{len(REPORT_FIELDS)}f", SESSION_IDENT, encoding, field_mask, down_sample, *scale
+    )
+    return frame + struct.pack("<H", crc16(frame))
+
+
+def compact_dtype(field_mask):
+    """定點樣本的格式"""
+    return np.dtype(
+        [("dt", "<u2")]
+        + [(name, "<i2") for k, name in enumerate(REPORT_FIELDS) if field_mask >> k & 1]
+    )
+
+
+def encode_frames_compact(reports, time_us, seq, batch=1, field_mask=DEFAULT_FIELD_MASK, scale=FIXED_SCALE):
+    """把樣本編碼成 int16 定點 frame (與韌體相同: 四捨五入並飽和在 ±32767)"""
+    dtype = compact_dtype(field_mask)
+    time_us = np.asarray(time_us, dtype=np.int64)
+    samples = np.empty(len(reports), dtype=dtype)
+    for k, name in enumerate(REPORT_FIELDS):
+        if name in dtype.names:
+            samples[name] = np.clip(np.round(reports[name] / np.float32(scale[k])), -32767, 32767)
+    out = bytearray()
+    for start in range(0, len(samples), batch):
+        part = samples[start : start + batch]
+        t = time_us[start : start + batch]
+        part["dt"] = np.diff(t, prepend=t[0]) & 0xFFFF
+        frame = struct.pack(
+            "<4sIHI", COMPACT_IDENT, (seq + start) & 0xFFFFFFFF, len(part), int(t[0]) & 0xFFFFFFFF
+        ) + part.tobytes()
+        out += frame + struct.pack("<H", crc16(frame))
+    return bytes(out)
+
+
+_TRAILER = np.frombuffer(REPORT_IDENT, dtype=np.uint8)
+_FRAME_OFFSETS = np.arange(REPORT_SIZE)
+
+
+class FrameDecoder:
+    """批次解碼 status_report_t
+
+    每次 feed() 接收任意長度的位元組, 一次找出所有結尾識別碼並以向量化方式解碼,
+    未完整的封包留到下次讀取。長度不符的片段會被丟棄並計入 resync 次數。
+    """
+
+    def __init__(self, max_pending=4096):
+        self.max_pending = max_pending
+        self._pending = b""
+        self.frames = 0
+        self.resyncs = 0
+        self.dropped_bytes = 0
+
+    def feed(self, chunk):
+        """解碼一段資料, 回傳 REPORT_DTYPE 結構化陣列"""
+        data = self._pending + bytes(chunk)
+        buf = np.frombuffer(data, dtype=np.uint8)
+        n = len(buf) - len(_TRAILER) + 1
+        if n <= 0:
+            self._pending = data
+            return np.empty(0, dtype=REPORT_DTYPE)
+
+        # 找出所有結尾識別碼的位置
+        match = buf[:n] == _TRAILER[0]
+        for k in range(1, len(_TRAILER)):
+            match &= buf[k : n + k] == _TRAILER[k]
+        ends = np.flatnonzero(match) + len(_TRAILER)
+
+        if len(ends) == 0:
+            # 沒有結尾, 避免垃圾資料無限累積
+            if len(data) > self.max_pending:
+                keep = len(_TRAILER) - 1
+                self.dropped_bytes += len(data) - keep
+                self.resyncs += 1
+                data = data[-keep:]
+            self._pending = data
+            return np.empty(0, dtype=REPORT_DTYPE)
+
+        # 兩個結尾之間剛好一個封包長度才是有效封包
+        gaps = np.diff(ends, prepend=0)
+        valid = gaps == REPORT_SIZE
+        bad = ~valid
+        self.resyncs += int(np.count_nonzero(bad))
+        self.dropped_bytes += int(gaps[bad].sum())
+
+        starts = ends[valid] - REPORT_SIZE
+        frames = buf[starts[:, None] + _FRAME_OFFSETS]
+        reports = frames.view(REPORT_DTYPE).reshape(-1)
+
+        self._pending = data[ends[-1] :]
+        self.frames += len(reports)
+        return reports
+
+    def reset(self):
+        self._pending = b""
+
+
+_V2_PREFIX = np.frombuffer(FRAME_V2_IDENT[:3], dtype=np.uint8)
+_FLOAT_KIND = FRAME_V2_IDENT[3]
+_SESSION_KIND = SESSION_IDENT[3]
+_COMPACT_KIND = COMPACT_IDENT[3]
+
+
+def _find(buf, pattern):
+    """回傳 pattern 在 buf 中所有出現位置"""
+    n = len(buf) - len(pattern) + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+    match = buf[:n] == pattern[0]
+    for k in range(1, len(pattern)):
+        match &= buf[k : n + k] == pattern[k]
+    return np.flatnonzero(match)
+
+
+class FrameDecoderV2:
+    """解碼 v2 frame (float32 或 int16 定點), 回傳 SAMPLE_DTYPE
+
+    以 frame 開頭的識別碼定位, 長度由 count (與 session 的欄位遮罩) 決定, CRC 不符的候選位置
+    略過 (計入 crc_errors)。樣本序號不連續的部分計入 lost, 因此可以區分遺失與損毀的封包。
+    定點 frame 依最近一次 session frame 的刻度還原, 遮罩外的欄位填 0;
+    收到 session 之前的定點 frame 無法解碼, 計入 dropped_bytes。
+    """
+
+    def __init__(self, max_pending=4096):
+        self.max_pending = max_pending
+        self._pending = b""
+        self._next_seq = None
+        self._last_time_us = None
+        self.session = None  # 最近一次的 SESSION_DTYPE
+        self._compact = None
+        self.frames = 0
+        self.samples = 0
+        self.crc_errors = 0
+        self.lost = 0
+        self.resyncs = 0
+        self.dropped_bytes = 0
+
+    def _frame_length(self, data, start, kind):
+        """回傳 frame 長度, 標頭不完整時回傳 None, 不是有效標頭時回傳 0"""
+        if kind == _SESSION_KIND:
+            return SESSION_SIZE
+        if start + FRAME_HEADER_SIZE > len(data):
+            return None
+        count = struct.unpack_from("<H", data, start + 8)[0]
+        if count == 0 or count > MAX_BATCH:
+            return 0
+        if kind == _FLOAT_KIND:
+            return FRAME_HEADER_SIZE + count * SAMPLE_V2_SIZE + CRC_SIZE
+        if self._compact is None:
+            return 0
+        return COMPACT_HEADER_SIZE + count * self._compact.itemsize + CRC_SIZE
+
+    def _set_session(self, frame):
+        session = np.frombuffer(frame, dtype=SESSION_DTYPE, count=1)[0]
+        self.session = session
+        self._compact = compact_dtype(int(session["field_mask"]))
+
+    def _expand_compact(self, frame):
+        """定點 frame 還原成 SAMPLE_V2_DTYPE"""
+        time_us = struct.unpack_from("<I", frame, FRAME_HEADER_SIZE)[0]
+        packed = np.frombuffer(frame, dtype=self._compact, offset=COMPACT_HEADER_SIZE)
+        out = np.zeros(len(packed), dtype=SAMPLE_V2_DTYPE)
+        dt = packed["dt"].astype(np.int64)
+        dt[0] = 0
+        out["time_us"] = (time_us + np.cumsum(dt)) & 0xFFFFFFFF
+        scale = self.session["scale"]
+        for k, name in enumerate(REPORT_FIELDS):
+            if name in self._compact.names:
+                out[name] = packed[name] * scale[k]
+        return out
+
+    def feed(self, chunk):
+        data = self._pending + bytes(chunk)
+        buf = np.frombuffer(data, dtype=np.uint8)
+        pos = 0  # 已處理到的位置
+        keep = None  # 不完整 frame 的起點
+        seqs = []
+        parts = []
+        for start in _find(buf, _V2_PREFIX):
+            start = int(start)
+            if start < pos:
+                continue
+            if start + len(FRAME_V2_IDENT) > len(data):
+                keep = start
+                break
+            kind = data[start + 3]
+            if kind not in (_FLOAT_KIND, _SESSION_KIND, _COMPACT_KIND):
+                continue
+            length = self._frame_length(data, start, kind)
+            if length is None or start + length > len(data):
+                keep = start
+                break
+            if length == 0:
+                continue
+            end = start + length
+            frame = data[start : end - CRC_SIZE]
+            if crc16(frame) != struct.unpack_from("<H", data, end - CRC_SIZE)[0]:
+                self.crc_errors += 1
+                continue
+            if start > pos:
+                self.resyncs += 1
+                self.dropped_bytes += start - pos
+            pos = end
+            if kind == _SESSION_KIND:
+                self._set_session(frame)
+                continue
+            seq, count = struct.unpack_from("<IH", frame, 4)
+            seqs.append((seq + np.arange(count, dtype=np.int64)) & 0xFFFFFFFF)
+            if kind == _FLOAT_KIND:
+                parts.append(np.frombuffer(frame, dtype=SAMPLE_V2_DTYPE, offset=FRAME_HEADER_SIZE))
+            else:
+                parts.append(self._expand_compact(frame))
+
+        tail = len(data) - len(FRAME_V2_IDENT) + 1
+        if keep is None:
+            # 保留可能是識別碼開頭的最後幾個位元組
+            keep = max(pos, tail)
+        elif len(data) - keep > self.max_pending:
+            keep = max(pos, tail)
+        # 沒有落在任何 frame 內的位元組
+        if keep > pos:
+            self.resyncs += 1
+            self.dropped_bytes += keep - pos
+        self._pending = data[keep:]
+
+        if not parts:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        raw = np.concatenate(parts)
+        samples = np.empty(len(raw), dtype=SAMPLE_DTYPE)
+        for name in REPORT_FIELDS:
+            samples[name] = raw[name]
+        seq = np.concatenate(seqs)
+        samples["seq"] = seq
+
+        # 序號缺口 = 遺失的樣本 (uint32 迴繞)
+        first = seq[0] if self._next_seq is None else self._next_seq
+        prev = np.concatenate([[first], seq[:-1] + 1])
+        gaps = (seq - prev) & 0xFFFFFFFF
+        # 序號倒退 (裝置重置) 不算遺失
+        gaps[gaps >= 1 << 31] = 0
+        self.lost += int(gaps.sum())
+        self._next_seq = (int(seq[-1]) + 1) & 0xFFFFFFFF
+
+        # micros() 約 71 分鐘迴繞一次
+        time_us = raw["time_us"].astype(np.int64)
+        first = time_us[0] if self._last_time_us is None else self._last_time_us
+        prev = np.concatenate([[first], time_us[:-1]])
+        dt = ((time_us - prev) & 0xFFFFFFFF) / 1e6
+        if self._last_time_us is None:
+            # 第一筆沒有前一筆可比較: 以 session 的回報週期 (1 ms 迴圈) 代替
+            dt[0] = REPORT_PERIOD if self.session is None else self.session["down_sample"] / 1000
+        samples["dt"] = dt
+        self._last_time_us = int(time_us[-1])
+
+        self.frames += len(parts)
+        self.samples += len(samples)
+        return samples
+
+    def reset(self):
+        self._pending = b""
+        self._next_seq = None
+        self._last_time_us = None
+        self.session = None
+        self._compact = None
+
+
+class ProtocolDecoder:
+    """連線時協商協定版本的解碼器, 兩種協定都輸出 SAMPLE_DTYPE
+
+    hello() 回傳要送給裝置的 proto_cfg_t; 收到第一個有效的 v2 frame 即切換到 v2。
+    送出後超過 timeout 仍只收到 36 byte 的 status_report_t 時, retry_hello() 回傳新的 proto_cfg_t
+    (裝置可能剛重置完, 沒收到前一次); max_attempts 次都沒有回應才是舊韌體, 固定為 v1。
+    v1 的 seq 由主機計數, dt 固定為 REPORT_PERIOD。
+    """
+
+    def __init__(
+        self,
+        version=PROTOCOL_V2,
+        batch=1,
+        timeout=0.5,
+        encoding=ENCODING_FLOAT,
+        field_mask=FIELD_MASK_ALL,
+        down_sample=0,
+        max_attempts=HELLO_ATTEMPTS,
+    ):
+        self.requested = version
+        self.batch = batch
+        self.encoding = encoding
+        self.field_mask = field_mask
+        self.down_sample = down_sample
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.attempts = 0
+        self._retry = False
+        self.v1 = FrameDecoder()
+        self.v2 = FrameDecoderV2()
+        self.version = None  # None: 協商中
+        self._hello_time = None
+        self._v1_seq = 0
+
+    def hello(self, retry=False):
+        """重設狀態並回傳協商封包, 連線時呼叫 (retry=False 重新計算次數)"""
+        self.reset()
+        self.attempts = self.attempts + 1 if retry else 1
+        self._hello_time = time.monotonic()
+        if self.requested == PROTOCOL_V1:
+            self.version = PROTOCOL_V1
+            return pack_protocol_config(PROTOCOL_V1)
+        return pack_protocol_config(
+            self.requested, self.batch, self.encoding, self.field_mask, self.down_sample
+        )
+
+    def feed(self, chunk):
+        if self.version == PROTOCOL_V2:
+            return self.v2.feed(chunk)
+        if self.version == PROTOCOL_V1:
+            return self._from_v1(self.v1.feed(chunk))
+        # 協商中: 兩種格式都嘗試
+        samples = self.v2.feed(chunk)
+        if len(samples):
+            self.version = PROTOCOL_V2
+            self.v1.reset()
+            return samples
+        reports = self.v1.feed(chunk)
+        if len(reports) and (
+            self._hello_time is None or time.monotonic() - self._hello_time >= self.timeout
+        ):
+            if self._hello_time is not None and self.attempts < self.max_attempts:
+                self._retry = True
+            else:
+                self.version = PROTOCOL_V1
+                self.v2.reset()
+        return self._from_v1(reports)
+
+    def retry_hello(self):
+        """協商中只收到 v1 回報時回傳要再送一次的 proto_cfg_t (並重設解碼器), 否則回傳 None
+
+        接收端每次 feed() 後呼叫, 把回傳的封包送給裝置。
+        """
+        if not self._retry:
+            return None
+        return self.hello(retry=True)
+
+    def _from_v1(self, reports):
+        samples = np.empty(len(reports), dtype=SAMPLE_DTYPE)
+        for name in REPORT_FIELDS:
+            samples[name] = reports[name]
+        samples["seq"] = (self._v1_seq + np.arange(len(reports))) & 0xFFFFFFFF
+        samples["dt"] = REPORT_PERIOD
+        self._v1_seq += len(reports)
+        return samples
+
+    @property
+    def resyncs(self):
+        return self.v2.resyncs if self.version == PROTOCOL_V2 else self.v1.resyncs
+
+    @property
+    def lost(self):
+        return self.v2.lost
+
+    @property
+    def crc_errors(self):
+        return self.v2.crc_errors
+
+    def reset(self):
+        self.v1.reset()
+        self.v2.reset()
+        self.version = None
+        self._hello_time = None
+        self._retry = False
+        self._v1_seq = 0
@@ -0,0 +1,454 @@
+import sys
+import time
+import threading
+
+import numpy as np
+import pyqtgraph as pg
+import serial
+import serial.tools.list_ports as list_ports
+from PyQt5.QtCore import QTimer, pyqtSignal
+from PyQt5.QtWidgets import (
+    QApplication,
+    QComboBox,
+    QGroupBox,
+    QHBoxLayout,
+    QLabel,
+    QLineEdit,
+    QMainWindow,
+    QPushButton,
+    QVBoxLayout,
+    QWidget,
+)
+
+from telemetry_buffer import TelemetryBuffer
+from protocol import (
+    ProtocolDecoder,
+    PROTOCOL_V2,
+    ENCODING_INT16,
+    DEFAULT_FIELD_MASK,
+    VELOCITY_MODE,
+    POSITION_MODE,
+    pack_control,
+    pack_pid_config,
+)
+from serial_tx import TransmitWorker, TARGET_KEY, PID_KEY, PROTO_KEY
+from simulator import SimulatedSerial
+from port_monitor import LinkMonitor
+
+# pyqtgraph 可以直接顯示完整歷史 (降採樣 + 只畫可見範圍)
+HISTORY_SIZE = 200_000
+# 圖表刷新間隔 (ms), 約 60 fps
+REFRESH_MS = 16
+# 單次讀取序列埠的最大位元組數
+READ_CHUNK = 65536
+# 序列埠讀取逾時 (秒), 沒有資料時接收執行緒也能定期檢查連線狀態
+READ_TIMEOUT = 0.05
+# 協定設定與 gui_01_v4 相同: v2, 每 frame 8 筆, int16, 每個 1 ms 迴圈回報
+PROTOCOL_BATCH = 8
+PROTOCOL_DOWN_SAMPLE = 1
+# 不接硬體時的模擬裝置
+SIMULATOR_PORT = "Simulator"
+
+
+class PIDControlQtGUI(QMainWindow):
+    # 接收執行緒的狀態訊息經由訊號交給 GUI 執行緒顯示
+    status_changed = pyqtSignal(str)
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        super().__init__()
+        self.setWindowTitle("PID 控制系統")
+        self.setGeometry(100, 100, 1200, 900)
+
+        # 全域變數
+        self.current_mode = "position"
+        self.current_target = None
+        self.telemetry = TelemetryBuffer(history_size)
+        self.decoder = ProtocolDecoder(
+            PROTOCOL_V2,
+            PROTOCOL_BATCH,
+            encoding=ENCODING_INT16,
+            field_mask=DEFAULT_FIELD_MASK,
+            down_sample=PROTOCOL_DOWN_SAMPLE,
+        )
+        self.transmitter = TransmitWorker()
+        self.link = LinkMonitor()
+        self.port_name = None
+        self.resume_pending = False
+        self.time_counter = 0
+        self.is_running = False
+        self.serial: serial.Serial = None
+        self.fps_cnt = 0
+        self.frame_cnt = 0
+        self.last_total = 0
+        self.last_print_fps = time.time()
+
+        # PID參數
+        self.position_pid = {"Kp": 1.0, "Ki": 0.1, "Kd": 0.01}
+        self.velocity_pid = {"Kp": 0.8, "Ki": 0.05, "Kd": 0.005}
+
+        # 主佈局
+        main_layout = QHBoxLayout()
+        main_layout.addWidget(self.create_control_panel(), 1)
+        main_layout.addWidget(self.create_chart_area(), 3)
+        central_widget = QWidget()
+        central_widget.setLayout(main_layout)
+        self.setCentralWidget(central_widget)
+
+        self.update_display_mode()
+        self.status_changed.connect(self.info_label.setText)
+        self.start_receiver()
+
+        # 繪圖計時器: 接收執行緒只寫緩衝區, 由 GUI 執行緒定時取資料
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.update_charts)
+        self.timer.start(REFRESH_MS)
+
+    def create_control_panel(self):
+        panel = QWidget()
+        layout = QVBoxLayout()
+
+        # 標題
+        title = QLabel("PID 控制系統")
+        title.setStyleSheet("font-size: 20px; font-weight: bold; color: #333333;")
+        layout.addWidget(title)
+
+        # 連線設定
+        connection_group = QGroupBox("連線設定")
+        connection_layout = QVBoxLayout()
+        ports = ["Disconnect", SIMULATOR_PORT]
+        for port, desc, hwid in sorted(list_ports.comports()):
+            print(f"  {port}: {desc} [{hwid}]")
+            ports.append(f"{port} {desc}")
+        self.com_combo = QComboBox()
+        self.com_combo.addItems(ports)
+        self.com_combo.currentTextChanged.connect(self.on_com_port_change)
+        connection_layout.addWidget(self.com_combo)
+        connection_group.setLayout(connection_layout)
+        layout.addWidget(connection_group)
+
+        # 控制模式
+        mode_group = QGroupBox("控制模式")
+        mode_layout = QVBoxLayout()
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItems(["position", "velocity"])
+        self.mode_combo.currentTextChanged.connect(self.on_mode_change)
+        mode_layout.addWidget(self.mode_combo)
+        mode_group.setLayout(mode_layout)
+        layout.addWidget(mode_group)
+
+        # 目標設定
+        target_group = QGroupBox("目標設定")
+        target_layout = QVBoxLayout()
+        self.target_pos_widget = QWidget()
+        pos_layout = QVBoxLayout()
+        pos_layout.setContentsMargins(0, 0, 0, 0)
+        self.target_position = QLineEdit("50")
+        pos_layout.addWidget(QLabel("目標位置 (mm)"))
+        pos_layout.addWidget(self.target_position)
+        self.target_pos_widget.setLayout(pos_layout)
+        target_layout.addWidget(self.target_pos_widget)
+
+        self.target_vel_widget = QWidget()
+        vel_layout = QVBoxLayout()
+        vel_layout.setContentsMargins(0, 0, 0, 0)
+        self.target_velocity = QLineEdit("20")
+        vel_layout.addWidget(QLabel("目標速度 (mm/s)"))
+        vel_layout.addWidget(self.target_velocity)
+        self.target_vel_widget.setLayout(vel_layout)
+        target_layout.addWidget(self.target_vel_widget)
+
+        send_target_button = QPushButton("發送目標")
+        send_target_button.clicked.connect(self.send_target)
+        target_layout.addWidget(send_target_button)
+        target_group.setLayout(target_layout)
+        layout.addWidget(target_group)
+
+        # 位置 PID
+        self.position_pid_group, (self.pos_kp, self.pos_ki, self.pos_kd) = (
+            self.create_pid_group("位置 PID 參數", "確認位置參數", self.position_pid, "position")
+        )
+        layout.addWidget(self.position_pid_group)
+
+        # 速度 PID
+        self.velocity_pid_group, (self.vel_kp, self.vel_ki, self.vel_kd) = (
+            self.create_pid_group("速度 PID 參數", "確認速度參數", self.velocity_pid, "velocity")
+        )
+        layout.addWidget(self.velocity_pid_group)
+
+        layout.addStretch(1)
+        panel.setLayout(layout)
+        return panel
+
+    def create_pid_group(self, title, button_text, pid, pid_type):
+        group = QGroupBox(title)
+        group_layout = QVBoxLayout()
+        entries = []
+        for label in ("Kp", "Ki", "Kd"):
+            entry = QLineEdit(str(pid[label]))
+            group_layout.addWidget(QLabel(label))
+            group_layout.addWidget(entry)
+            entries.append(entry)
+        button = QPushButton(button_text)
+        button.clicked.connect(lambda: self.update_pid(pid_type))
+        group_layout.addWidget(button)
+        group.setLayout(group_layout)
+        return group, entries
+
+    def create_chart_area(self):
+        area = QWidget()
+        layout = QVBoxLayout()
+
+        # 位置圖表
+        self.position_plot = pg.PlotWidget(title="即時位置監控")
+        self.position_plot.setLabel("left", "位置 (mm)")
+        self.position_plot.addLegend(offset=(-10, 10))
+        self.position_curve = self.position_plot.plot(
+            pen=pg.mkPen(color="#2E5BBA", width=2.5), name="實際位置 (mm)"
+        )
+        self.target_position_curve = self.position_plot.plot(
+            pen=pg.mkPen(color="#D73027", width=2.5, dash=[8, 4]), name="目標位置 (mm)"
+        )
+        layout.addWidget(self.position_plot)
+
+        # 速度圖表
+        self.velocity_plot = pg.PlotWidget(title="即時速度監控")
+        self.velocity_plot.setLabel("left", "速度 (mm/s)")
+        self.velocity_plot.setLabel("bottom", "時間")
+        self.velocity_plot.addLegend(offset=(-10, 10))
+        self.velocity_plot.setXLink(self.position_plot)
+        self.velocity_curve = self.velocity_plot.plot(
+            pen=pg.mkPen(color="#1A9641", width=2.5), name="實際速度 (mm/s)"
+        )
+        self.target_velocity_curve = self.velocity_plot.plot(
+            pen=pg.mkPen(color="#F57C00", width=2.5, dash=[8, 4]), name="目標速度 (mm/s)"
+        )
+        layout.addWidget(self.velocity_plot)
+
+        # 長歷史: 峰值降採樣 + 只畫可見範圍
+        for plot in (self.position_plot, self.velocity_plot):
+            plot.setDownsampling(auto=True, mode="peak")
+            plot.setClipToView(True)
+            plot.showGrid(x=True, y=True)
+
+        # 狀態欄
+        status_layout = QHBoxLayout()
+        self.mode_label = QLabel("當前模式: 位置控制")
+        self.mode_label.setStyleSheet("font-weight: bold; color: #333333;")
+        self.target_label = QLabel("目標: 未設定")
+        self.target_label.setStyleSheet("font-weight: bold; color: #007bff;")
+        status_layout.addWidget(self.mode_label)
+        status_layout.addWidget(self.target_label)
+        # 參數更新訊息 (取代會阻塞畫面的對話框)
+        self.info_label = QLabel("")
+        status_layout.addWidget(self.info_label)
+        status_layout.addStretch(1)
+        layout.addLayout(status_layout)
+
+        area.setLayout(layout)
+        return area
+
+    def on_mode_change(self, text):
+        self.current_mode = "position" if text == "position" else "velocity"
+        self.current_target = None
+        self.update_display_mode()
+
+    def on_com_port_change(self, com):
+        self.is_running = False
+        if com == "Disconnect":
+            if self.serial is not None:
+                self.transmitter.serial = None
+                self.serial.close()
+                print(f"close port")
+        elif com == SIMULATOR_PORT:
+            # 以韌體模擬器取代序列埠
+            if self.serial is not None and self.serial.is_open:
+                self.serial.close()
+            self.connect_link(SIMULATOR_PORT, self.open_port(SIMULATOR_PORT))
+        ## serial not open
+        elif self.serial is None or not self.serial.is_open:
+            com = com[: com.find(" ")]
+            try:
+                ser = self.open_port(com)
+            except (serial.SerialException, OSError) as e:
+                self.info_label.setText(f"無法開啟 {com}: {e}")
+                return
+            self.connect_link(com, ser)
+
+    def open_port(self, port):
+        if port == SIMULATOR_PORT:
+            return SimulatedSerial()
+        return serial.Serial(port, 921600, timeout=READ_TIMEOUT)
+
+    def connect_link(self, port, ser):
+        # 使用者開啟連線: 協商協定 (舊韌體自動退回 v1) 並開始監控連線
+        self.port_name = port
+        self.serial = ser
+        self.transmitter.serial = ser
+        self.resume_pending = False
+        self.link.reset()
+        self.transmitter.submit(self.decoder.hello(), key=PROTO_KEY)
+        self.is_running = True
+        print(f"open port: {port}: {ser.is_open}")
+
+    def update_display_mode(self):
+        is_position = self.current_mode == "position"
+        self.position_pid_group.setVisible(is_position)
+        self.target_pos_widget.setVisible(is_position)
+        self.velocity_pid_group.setVisible(not is_position)
+        self.target_vel_widget.setVisible(not is_position)
+        self.mode_label.setText("當前模式: 位置控制" if is_position else "當前模式: 速度控制")
+        self.target_label.setText("目標: 未設定")
+
+    def update_pid(self, pid_type):
+        if pid_type == "position":
+            pid, entries, type_id, name = (
+                self.position_pid,
+                (self.pos_kp, self.pos_ki, self.pos_kd),
+                POSITION_MODE,
+                "位置",
+            )
+        else:
+            pid, entries, type_id, name = (
+                self.velocity_pid,
+                (self.vel_kp, self.vel_ki, self.vel_kd),
+                VELOCITY_MODE,
+                "速度",
+            )
+        for label, entry in zip(("Kp", "Ki", "Kd"), entries):
+            pid[label] = float(entry.text())
+        self.transmitter.submit(
+            pack_pid_config(pid["Kp"], pid["Ki"], pid["Kd"], type_id), key=(PID_KEY, type_id)
+        )
+        self.info_label.setText(
+            f"{name}PID參數已更新: Kp={pid['Kp']} Ki={pid['Ki']} Kd={pid['Kd']}"
+        )
+
+    def send_target(self):
+        if self.current_mode == "position":
+            self.current_target = float(self.target_position.text())
+            self.target_label.setText(f"目標: {self.current_target} mm")
+            data = pack_control(0, self.current_target, POSITION_MODE)
+        else:
+            self.current_target = float(self.target_velocity.text())
+            self.target_label.setText(f"目標: {self.current_target} mm/s")
+            data = pack_control(self.current_target, 0, VELOCITY_MODE)
+        self.transmitter.submit(data, key=TARGET_KEY)
+
+    def start_receiver(self):
+        self.receiver_thread = threading.Thread(target=self.receiver_loop, daemon=True)
+        self.receiver_thread.start()
+
+    def receiver_loop(self):
+        while True:
+            ser = self.serial
+            if not self.is_running or ser is None:
+                time.sleep(0.1)
+                continue
+            # 有多少讀多少, 一次解碼所有完整封包
+            try:
+                chunk = ser.read(min(max(ser.in_waiting, 1), READ_CHUNK))
+            except (serial.SerialException, OSError):
+                # USB 拔除或裝置重置
+                self.reconnect(ser)
+                continue
+            reports = self.decoder.feed(chunk)
+            hello = self.decoder.retry_hello()
+            if hello is not None:
+                # 裝置重置期間遺失了 proto_cfg_t
+                self.transmitter.submit(hello, key=PROTO_KEY)
+            n = len(reports)
+            if n == 0:
+                if self.link.expired():
+                    self.reconnect(ser)
+                continue
+            if self.resume_pending:
+                self.resume_session()
+            self.link.alive()
+
+            # 時間軸依裝置時間 (v2) 或回報週期 (v1) 累加
+            time_values = self.time_counter + np.cumsum(reports["dt"])
+            self.time_counter = time_values[-1]
+            self.telemetry.extend_reports(time_values, time.time(), reports)
+            self.fps_cnt += n
+
+    def reconnect(self, ser):
+        # 接收執行緒判定斷線: 以退避間隔重新開啟同一個序列埠, 使用者切換或斷開連線時放棄
+        if not self.is_running or self.serial is not ser:
+            return
+        self.transmitter.serial = None
+        try:
+            ser.close()
+        except (serial.SerialException, OSError):
+            pass
+        if self.link.lost():
+            print(f"link lost: {self.port_name}")
+            self.status_changed.emit(f"{self.port_name} 連線中斷, 重新連線中...")
+        while True:
+            self.link.wait_retry()
+            if not self.is_running or self.serial is not ser:
+                return
+            try:
+                new = self.open_port(self.port_name)
+            except (serial.SerialException, OSError):
+                continue
+            break
+        # 等第一批資料到達 (裝置已離開 bootloader) 再協商並恢復設定
+        self.serial = new
+        self.transmitter.serial = new
+        self.decoder.reset()
+        self.resume_pending = True
+        self.link.connected()
+        print(f"reopen port: {self.port_name}")
+
+    def resume_session(self):
+        # 重新連線後的第一批資料: 重新協商協定, 重送最後的 PID 參數與控制命令
+        self.resume_pending = False
+        self.transmitter.submit(self.decoder.hello(), key=PROTO_KEY)
+        self.transmitter.resend([(PID_KEY, POSITION_MODE), (PID_KEY, VELOCITY_MODE), TARGET_KEY])
+        # 時間軸跳過中斷期間
+        outage = self.link.reconnected()
+        self.time_counter += outage
+        text = f"已重新連線 {self.port_name}, 中斷 {outage * 1000:.0f} ms"
+        print(text)
+        self.status_changed.emit(text)
+
+    def update_charts(self):
+        # 沒有新資料就不重設曲線
+        if self.telemetry.total != self.last_total:
+            self.last_total = self.telemetry.total
+            data = self.telemetry.view()
+            time_data = data["time"]
+            # 實際值來自韌體, 一定是有限值, 略過逐點檢查
+            self.position_curve.setData(time_data, data["pos"], skipFiniteCheck=True)
+            self.target_position_curve.setData(time_data, data["target_pos"])
+            self.velocity_curve.setData(time_data, data["vel"], skipFiniteCheck=True)
+            self.target_velocity_curve.setData(time_data, data["target_vel"])
+
+        self.frame_cnt += 1
+        if time.time() - self.last_print_fps >= 1:
+            elapsed = time.time() - self.last_print_fps
+            self.last_print_fps = time.time()
+            tx = self.transmitter.latency_stats()
+            print(
+                f"pps: {self.fps_cnt / elapsed:.0f}, fps: {self.frame_cnt / elapsed:.1f}, "
+                f"resync: {self.decoder.resyncs}, tx p50/max: {tx['p50']:.2f}/{tx['max']:.2f} ms"
+            )
+            self.fps_cnt = 0
+            self.frame_cnt = 0
+
+    def closeEvent(self, event):
+        self.is_running = False
+        self.timer.stop()
+        self.transmitter.stop()
+        super().closeEvent(event)
+
+
+def main():
+    app = QApplication(sys.argv)
+    window = PIDControlQtGUI()
+    window.show()
+    sys.exit(app.exec_())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from telemetry_buffer import REPORT_FIELDS, TELEMETRY_DTYPE
+
+# 檔案格式: 16 byte 檔頭 + 固定長度紀錄 (append-only)
+MAGIC = b"PIDREC\x00\x01"
+HEADER_SIZE = 16
+
+KIND_REPORT = 0
+KIND_COMMAND = 1
+
+# 每筆紀錄 56 bytes, report 與 command 共用 payload 區
+RECORD_DTYPE = np.dtype(
+    {
+        "names": ["kind", "size", "host_time", "time", "report", "command"],
+        "formats": ["u1", "u1", "<f8", "<f8", ("<f4", (len(REPORT_FIELDS),)), ("u1", (32,))],
+        "offsets": [0, 1, 8, 16, 24, 24],
+        "itemsize": 56,
+    }
+)
+
+
+def to_telemetry(records):
+    """把檔案中的 report 紀錄轉回 TELEMETRY_DTYPE"""
+    records = records[records["kind"] == KIND_REPORT]
+    out = np.empty(len(records), dtype=TELEMETRY_DTYPE)
+    out["time"] = records["time"]
+    out["host_time"] = records["host_time"]
+    values = records["report"]
+    for k, name in enumerate(REPORT_FIELDS):
+        out[name] = values[:, k]
+    return out
+
+
+def to_commands(records):
+    """把檔案中的 command 紀錄轉成 [(host_time, time, bytes)]"""
+    cmds = records[records["kind"] == KIND_COMMAND]
+    return [(c["host_time"], c["time"], c["command"][: c["size"]].tobytes()) for c in cmds]
+
+
+class TelemetryRecorder:
+    """把每筆解碼後的回報與送出的命令寫入二進位檔
+
+    接收執行緒只把陣列丟進佇列 (O(1)), 由背景執行緒轉換格式並分塊寫檔,
+    不會增加 receiver_loop 的延遲。
+    """
+
+    def __init__(self, path, flush_interval=0.25, chunk_records=4096):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.chunk_records = chunk_records
+        self._queue = queue.SimpleQueue()
+        self.records_written = 0
+        self.bytes_written = 0
+        self.last_time = 0.0  # 最近一筆回報的時間軸, 命令以此對齊
+
+        # 每次錄製一個新檔, 之後只往後附加
+        self._file = open(path, "wb")
+        self._file.write(MAGIC.ljust(HEADER_SIZE, b"\x00"))
+
+        self.is_running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add_reports(self, records):
+        """records: TELEMETRY_DTYPE 陣列 (例如 TelemetryBuffer.extend_reports 的回傳值)"""
+        if len(records):
+            self.last_time = records["time"][-1]
+            self._queue.put(records)
+
+    def add_command(self, data, host_time=None):
+        """記錄一筆送出的封包"""
+        self._queue.put((time.time() if host_time is None else host_time, self.last_time, bytes(data)))
+
+    def _convert(self, items):
+        n = sum(len(item) if isinstance(item, np.ndarray) else 1 for item in items)
+        out = np.zeros(n, dtype=RECORD_DTYPE)
+        k = 0
+        for item in items:
+            if isinstance(item, np.ndarray):
+                part = out[k : k + len(item)]
+                part["kind"] = KIND_REPORT
+                part["time"] = item["time"]
+                part["host_time"] = item["host_time"]
+                part["report"] = np.stack([item[name] for name in REPORT_FIELDS], axis=1)
+                k += len(item)
+            else:
+                host_time, time_value, data = item
+                data = data[:32]
+                out[k]["kind"] = KIND_COMMAND
+                out[k]["size"] = len(data)
+                out[k]["host_time"] = host_time
+                out[k]["time"] = time_value
+                out[k]["command"][: len(data)] = np.frombuffer(data, dtype=np.uint8)
+                k += 1
+        return out
+
+    def _run(self):
+        items = []
+        count = 0
+        last_flush = time.time()
+        # 停止後仍要寫完佇列中剩下的資料
+        while self.is_running or items or not self._queue.empty():
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+                items.append(item)
+                count += len(item) if isinstance(item, np.ndarray) else 1
+            except queue.Empty:
+                pass
+            if items and (
+                count >= self.chunk_records
+                or time.time() - last_flush >= self.flush_interval
+                or not self.is_running
+            ):
+                chunk = self._convert(items)
+                self._file.write(chunk.tobytes())
+                self._file.flush()
+                self.records_written += len(chunk)
+                self.bytes_written += chunk.nbytes
+                items = []
+                count = 0
+                last_flush = time.time()
+        self._file.close()
+
+    def stop(self):
+        self.is_running = False
+        self.thread.join()
+
+
+class Replay:
+    """以 memmap 讀取錄製檔, 可即時跳轉並以 1x / N 倍 / 最快速度回放"""
+
+    def __init__(self, path):
+        self.path = path
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"not a telemetry recording: {path}")
+        # 寫到一半的最後一筆不讀
+        count = max(size - HEADER_SIZE, 0) // RECORD_DTYPE.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        self.position = 0
+        self._stop = threading.Event()
+        self.thread = None
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def duration(self):
+        if not len(self.records):
+            return 0.0
+        return float(self.records["time"][-1] - self.records["time"][0])
+
+    def seek(self, time_value):
+        """跳到時間軸 time_value (二分搜尋, 只讀取 log n 個分頁)"""
+        self.position = int(np.searchsorted(self.records["time"], time_value))
+        return self.position
+
+    def reports(self, start=0, stop=None):
+        return to_telemetry(self.records[start:stop])
+
+    def commands(self):
+        """回傳 [(host_time, time, bytes)]"""
+        return to_commands(self.records)
+
+    @property
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def play(self, buffer, speed=1.0, on_batch=None, on_done=None, max_batch=10000):
+        """在背景執行緒把回報送進 TelemetryBuffer, speed 為 None 時全速回放
+
+        每批寫入後呼叫 on_batch(records), 讓呼叫端以即時資料相同的流程分析。
+        """
+        self.stop()
+        self._stop.clear()
+        self.thread = threading.Thread(
+            target=self._run, args=(buffer, speed, on_batch, on_done, max_batch), daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.is_running:
+            self.thread.join()
+
+    def _run(self, buffer, speed, on_batch, on_done, max_batch):
+        times = self.records["time"]
+        n = len(self.records)
+        i = self.position
+        if i < n:
+            t_start = times[i]
+        wall_start = time.perf_counter()
+        while i < n and not self._stop.is_set():
+            stop = min(i + max_batch, n)
+            if speed is not None:
+                now = t_start + (time.perf_counter() - wall_start) * speed
+                stop = i + int(np.searchsorted(times[i:stop], now, side="right"))
+                if stop == i:
+                    self._stop.wait(0.01)
+                    continue
+            records = to_telemetry(self.records[i:stop])
+            buffer.extend(records)
+            i = stop
+            self.position = i
+            if on_batch is not None:
+                on_batch(records)
+        if on_done is not None:
+            on_done()
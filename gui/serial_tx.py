@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+# 同一種封包只保留最新一筆的 key
+TARGET_KEY = "control"
+PID_KEY = "pid"
+PROTO_KEY = "protocol"
+
+
+class TransmitWorker:
+    """獨立的傳送執行緒, 以有界佇列取代在 GUI 執行緒直接 serial.write()
+
+    以相同 key 送出的封包會合併 (coalesce), 尚未寫出前只保留最新值且維持原本的排隊順序,
+    例如拖動滑桿時連續的目標值。每筆封包記錄從 submit() 到寫入完成的延遲。
+    每個 key 最後一次 submit 的封包保留在 latest, 重新連線後以 resend() 恢復裝置狀態。
+    """
+
+    def __init__(self, maxsize=64, history=1000):
+        self.serial = None
+        self.maxsize = maxsize
+        self._pending = OrderedDict()
+        self.latest = {}
+        self._cond = threading.Condition()
+        self._seq = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=history)  # 秒
+        # 寫入完成後的回呼 on_write(data), 例如記錄器
+        self.on_write = None
+        self.is_running = True
+        self.start()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, data, key=None):
+        """排入一筆封包, 佇列已滿時丟棄並回傳 False"""
+        now = time.perf_counter()
+        with self._cond:
+            if key is None:
+                # 不合併的封包給一個唯一的 key
+                self._seq += 1
+                key = ("raw", self._seq)
+            else:
+                self.latest[key] = data
+            if key in self._pending:
+                self._pending[key] = (data, now)
+                self.coalesced += 1
+                return True
+            if len(self._pending) >= self.maxsize:
+                self.dropped += 1
+                return False
+            self._pending[key] = (data, now)
+            self._cond.notify()
+        return True
+
+    def resend(self, keys):
+        """依序重新送出這些 key 最後一次 submit 的封包, 回傳送出的筆數"""
+        with self._cond:
+            packets = [(key, self.latest[key]) for key in keys if key in self.latest]
+        for key, data in packets:
+            self.submit(data, key=key)
+        return len(packets)
+
+    def backlog(self):
+        """尚未寫出的封包數"""
+        with self._cond:
+            return len(self._pending)
+
+    def _pop(self):
+        """取出最舊的一筆封包 (需持有 self._cond)"""
+        key, (data, submit_time) = self._pending.popitem(last=False)
+        return data, submit_time, self.serial
+
+    def _write(self, ser, data, submit_time):
+        if ser is None or not ser.is_open:
+            self.dropped += 1
+            return
+        try:
+            ser.write(data)
+        except Exception as e:
+            self.errors += 1
+            print(f"tx error: {e}")
+            return
+        self.latencies.append(time.perf_counter() - submit_time)
+        self.sent += 1
+        on_write = self.on_write
+        if on_write is not None:
+            on_write(data)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.is_running and not self._pending:
+                    self._cond.wait()
+                if not self.is_running:
+                    return
+                data, submit_time, ser = self._pop()
+            self._write(ser, data, submit_time)
+
+    def latency_stats(self):
+        """回傳最近封包的延遲統計 (ms)"""
+        if not self.latencies:
+            return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+        values = np.array(self.latencies) * 1000
+        p50, p99 = np.percentile(values, [50, 99])
+        return {"p50": p50, "p99": p99, "max": values.max()}
+
+    def stop(self):
+        with self._cond:
+            self.is_running = False
+            self._cond.notify()
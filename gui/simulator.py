@@ -0,0 +1,466 @@
+import math
+import struct
+import threading
+import time
+
+import numpy as np
+
+from jit import njit
+from protocol import (
+    MIN_VEL,
+    MAX_VEL,
+    MIN_POS,
+    MAX_POS,
+    VELOCITY_MODE,
+    POSITION_MODE,
+    REPORT_DTYPE,
+    REPORT_IDENT,
+    PROTOCOL_V1,
+    PROTOCOL_V2,
+    MAX_BATCH,
+    ENCODING_FLOAT,
+    ENCODING_INT16,
+    FIELD_MASK_ALL,
+    MAX_COMPACT_DOWN_SAMPLE,
+    encode_reports,
+    encode_frames_v2,
+    encode_frames_compact,
+    encode_session,
+)
+from telemetry_buffer import REPORT_FIELDS
+
+
+# 韌體參數 (src/main.cpp)
+PULSE_PER_REV = 193.6
+LOOP_DT = 1  # ms
+DIST_PER_REV = 40
+DOWN_SAMPLE = 10
+VEL_FILT = 0.05
+PWM_MAX = 255
+INTEGRAL_LIMIT = 1000
+END_LIMIT = 200  # mm, 超過時停止正向速度
+SESSION_INTERVAL = 1000  # ms, v2 定期重送 session frame
+
+# 韌體預設 PID (vel_cfg / pos_cfg)
+DEFAULT_VEL_PID = {"Kp": 10.0, "Ki": 0.1, "Kd": 0.0}
+DEFAULT_POS_PID = {"Kp": 20.0, "Ki": 0.1, "Kd": 10.0}
+
+# 狀態向量索引
+(
+    S_ENCODER,
+    S_VEL,
+    S_POS,
+    S_TARGET_VEL,
+    S_TARGET_POS,
+    S_MODE,
+    S_POS_I,
+    S_LAST_POS_E,
+    S_VEL_I,
+    S_LAST_VEL_E,
+    S_SAMPLE,
+    S_X,
+    S_V,
+    S_COUNTS,
+    S_DELAY,
+) = range(15)
+STATE_SIZE = 15
+
+
+class PlantModel:
+    """馬達 + 線性滑軌的一階加純延遲模型
+
+    gain: 每單位 PWM 的穩態速度 (mm/s), tau: 時間常數 (s),
+    deadband: 靜摩擦造成的 PWM 死區, travel: 機構行程 (mm), 0 為原點開關位置,
+    delay: PWM 到開始運動的純延遲 (s, 以 LOOP_DT 為單位)。
+    """
+
+    def __init__(self, gain=1.8, tau=0.04, deadband=25, travel=210.0, delay=0.0):
+        self.gain = gain
+        self.tau = tau
+        self.deadband = deadband
+        self.travel = travel
+        self.delay = delay
+
+    def as_array(self):
+        return np.array([self.gain, self.tau, self.deadband, self.travel], dtype=np.float64)
+
+    def __repr__(self):
+        return (
+            f"PlantModel(gain={self.gain}, tau={self.tau}, "
+            f"deadband={self.deadband}, travel={self.travel}, delay={self.delay})"
+        )
+
+
+@njit(cache=True)
+def _constrain_vel(value):
+    if value > 0 and value > MIN_VEL:
+        return min(max(value, MIN_VEL), MAX_VEL)
+    elif value < 0 and value < -MIN_VEL:
+        return min(max(value, -MAX_VEL), -MIN_VEL)
+    return 0.0
+
+
+@njit(cache=True)
+def _constrain_pos(value):
+    if value > 0 and value > MIN_POS:
+        return min(max(value, MIN_POS), MAX_POS)
+    elif value < 0 and value < -MIN_POS:
+        return min(max(value, -MAX_POS), -MIN_POS)
+    return 0.0
+
+
+@njit(cache=True)
+def _simulate(state, gains, plant, delay_line, cmd_mode, cmd_vel, cmd_pos, down_sample, out):
+    """執行 len(cmd_mode) 個 1 ms 迴圈, 回報寫入 out, 回傳回報筆數
+
+    delay_line: 純延遲的 PWM 環形佇列 (長度 = 延遲的迴圈數, 0 表示沒有延遲)
+
+    gains: [pos_kp, pos_ki, pos_kd, vel_kp, vel_ki, vel_kd]
+    cmd_*: 每一步收到的 control_t, cmd_mode < 0 代表該步沒有封包
+    """
+    counts_per_mm = PULSE_PER_REV / DIST_PER_REV
+    vel_scale = (1000 // LOOP_DT) * (DIST_PER_REV / PULSE_PER_REV)
+    dt = LOOP_DT / 1000.0
+    gain, tau, deadband, travel = plant[0], plant[1], plant[2], plant[3]
+    decay = math.exp(-dt / tau)
+
+    encoder = state[S_ENCODER]
+    vel = state[S_VEL]
+    pos = state[S_POS]
+    target_vel = state[S_TARGET_VEL]
+    target_pos = state[S_TARGET_POS]
+    mode = int(state[S_MODE])
+    pos_error_i = state[S_POS_I]
+    last_pos_error = state[S_LAST_POS_E]
+    vel_error_i = state[S_VEL_I]
+    last_vel_error = state[S_LAST_VEL_E]
+    sample = int(state[S_SAMPLE])
+    x = state[S_X]
+    v = state[S_V]
+    last_counts = state[S_COUNTS]
+    delay_idx = int(state[S_DELAY])
+
+    n_reports = 0
+    for k in range(len(cmd_mode)):
+        # 編碼器量化
+        counts = math.floor(x * counts_per_mm)
+        delta_enc = counts - last_counts
+        last_counts = counts
+        encoder += delta_enc
+        this_vel = delta_enc * vel_scale
+        vel = this_vel * VEL_FILT + vel * (1.0 - VEL_FILT)
+        pos = encoder / counts_per_mm
+
+        # 位置控制
+        if mode == POSITION_MODE:
+            pos_error = target_pos - pos
+            pos_error_i = min(max(pos_error_i + pos_error, -INTEGRAL_LIMIT), INTEGRAL_LIMIT)
+            target_vel = _constrain_vel(
+                pos_error * gains[0]
+                + pos_error_i * gains[1]
+                + (pos_error - last_pos_error) * gains[2]
+            )
+            last_pos_error = pos_error
+
+        # 速度控制
+        vel_error = target_vel - vel
+        vel_error_i = min(max(vel_error_i + vel_error, -INTEGRAL_LIMIT), INTEGRAL_LIMIT)
+        vel_p = vel_error * gains[3]
+        vel_i = vel_error_i * gains[4]
+        vel_d = (vel_error - last_vel_error) * gains[5]
+        vel_output = vel_p + vel_i + vel_d
+        last_vel_error = vel_error
+        # drive_motor(int duty): 截斷成整數後飽和
+        duty = min(max(float(int(vel_output)), -PWM_MAX), PWM_MAX)
+
+        # 回報
+        sample += 1
+        if sample >= down_sample:
+            sample = 0
+            out[n_reports, 0] = vel
+            out[n_reports, 1] = pos
+            out[n_reports, 2] = target_vel
+            out[n_reports, 3] = target_pos
+            out[n_reports, 4] = vel_output
+            out[n_reports, 5] = vel_p
+            out[n_reports, 6] = vel_i
+            out[n_reports, 7] = 0.0
+            n_reports += 1
+
+        # 原點開關 / 行程上限
+        if x <= 0 and target_vel < 0:
+            target_vel = 0.0
+            encoder = 0.0
+        elif pos > END_LIMIT and target_vel > 0:
+            target_vel = 0.0
+
+        # handle_serial(): 收到的 control_t
+        if cmd_mode[k] >= 0:
+            mode = cmd_mode[k]
+            if mode == VELOCITY_MODE:
+                target_vel = _constrain_vel(cmd_vel[k])
+            elif mode == POSITION_MODE:
+                target_pos = _constrain_pos(cmd_pos[k])
+
+        # 純延遲
+        if len(delay_line):
+            delayed = delay_line[delay_idx]
+            delay_line[delay_idx] = duty
+            delay_idx = (delay_idx + 1) % len(delay_line)
+            duty = delayed
+
+        # 馬達 + 滑軌一階響應
+        if duty > deadband:
+            drive = duty - deadband
+        elif duty < -deadband:
+            drive = duty + deadband
+        else:
+            drive = 0.0
+        v_ss = gain * drive
+        v_new = v_ss + (v - v_ss) * decay
+        x += (v + v_new) / 2 * dt
+        v = v_new
+        if x <= 0:
+            x = 0.0
+            v = max(v, 0.0)
+        elif x >= travel:
+            x = travel
+            v = min(v, 0.0)
+
+    state[S_ENCODER] = encoder
+    state[S_VEL] = vel
+    state[S_POS] = pos
+    state[S_TARGET_VEL] = target_vel
+    state[S_TARGET_POS] = target_pos
+    state[S_MODE] = mode
+    state[S_POS_I] = pos_error_i
+    state[S_LAST_POS_E] = last_pos_error
+    state[S_VEL_I] = vel_error_i
+    state[S_LAST_VEL_E] = last_vel_error
+    state[S_SAMPLE] = sample
+    state[S_X] = x
+    state[S_V] = v
+    state[S_COUNTS] = last_counts
+    state[S_DELAY] = delay_idx
+    return n_reports
+
+
+class FirmwareSimulator:
+    """重現 src/main.cpp 的 loop(): 1 ms 週期、編碼器量化、VEL_FILT 濾波、
+    位置→速度串級 PID (積分限制 ±1000)、PWM 飽和 ±255 與 DOWN_SAMPLE 回報
+
+    write() 以與 handle_serial() 相同的狀態機解析 control_t / pid_config_t。
+    """
+
+    def __init__(self, plant=None, vel_pid=None, pos_pid=None, down_sample=DOWN_SAMPLE):
+        self.plant = plant or PlantModel()
+        self.down_sample = down_sample
+        self.default_down_sample = down_sample
+        vel_pid = vel_pid or DEFAULT_VEL_PID
+        pos_pid = pos_pid or DEFAULT_POS_PID
+        self.gains = np.array(
+            [pos_pid["Kp"], pos_pid["Ki"], pos_pid["Kd"], vel_pid["Kp"], vel_pid["Ki"], vel_pid["Kd"]],
+            dtype=np.float64,
+        )
+        self.state = np.zeros(STATE_SIZE, dtype=np.float64)
+        self._delay_line = np.zeros(int(round(self.plant.delay * 1000 / LOOP_DT)))
+        self.steps = 0
+        # 尚未套用的 control_t (mode, target_vel, target_pos)
+        self._command = None
+        # handle_serial() 狀態
+        self._serial_buffer = bytearray()
+        self._pack_type = 0
+        # 協定狀態 (proto_cfg_t), 開機時為 v1
+        self.protocol = PROTOCOL_V1
+        self.batch = 1
+        self.encoding = ENCODING_FLOAT
+        self.field_mask = FIELD_MASK_ALL
+        self.seq = 0
+        self._session = b""  # 待送出的 session frame
+        self._session_step = 0
+        self._batch_reports = np.zeros(0, dtype=REPORT_DTYPE)
+        self._batch_time = np.zeros(0, dtype=np.int64)
+
+    def set_target(self, target_vel, target_pos, mode):
+        """等同收到一個 control_t, 在下一步套用"""
+        self._command = (mode, target_vel, target_pos)
+
+    def set_pid(self, kp, ki, kd, pid_type):
+        """等同收到一個 pid_config_t"""
+        offset = 0 if pid_type == POSITION_MODE else 3
+        if pid_type in (VELOCITY_MODE, POSITION_MODE):
+            self.gains[offset : offset + 3] = (kp, ki, kd)
+
+    def set_protocol(self, version, batch, encoding=ENCODING_FLOAT, field_mask=FIELD_MASK_ALL, down_sample=0):
+        """等同收到一個 proto_cfg_t (與韌體 set_protocol() 相同的限制)"""
+        if version not in (PROTOCOL_V1, PROTOCOL_V2):
+            return
+        self.protocol = version
+        self.batch = min(max(batch, 1), MAX_BATCH)
+        self.encoding = ENCODING_INT16 if encoding == ENCODING_INT16 else ENCODING_FLOAT
+        self.field_mask = field_mask or FIELD_MASK_ALL
+        self.down_sample = down_sample or self.default_down_sample
+        if self.encoding == ENCODING_INT16:
+            self.down_sample = min(self.down_sample, MAX_COMPACT_DOWN_SAMPLE)
+        self._batch_reports = self._batch_reports[:0]
+        self._batch_time = self._batch_time[:0]
+        if version == PROTOCOL_V2:
+            self._send_session()
+
+    def _send_session(self):
+        self._session += encode_session(self.encoding, self.field_mask, self.down_sample)
+        self._session_step = self.steps
+
+    def write(self, data):
+        """逐位元組解析主機送來的封包 (與 handle_serial() 相同)"""
+        for n in bytes(data):
+            buf = self._serial_buffer
+            buf.append(n)
+            cursor = len(buf)
+            if (
+                (cursor - 1 == 0 and n != 0xAA)
+                or (cursor - 1 == 1 and n != 0xBB)
+                or (cursor - 1 == 2 and n != 0xCC)
+            ):
+                buf.clear()
+            elif cursor - 1 == 3:
+                if n == 0xEE:
+                    self._pack_type = 0
+                elif n == 0xFF:
+                    self._pack_type = 1
+                elif n == 0xA0:
+                    self._pack_type = 2
+                else:
+                    buf.clear()
+            elif self._pack_type == 0 and cursor == 16:
+                target_vel, target_pos, mode = struct.unpack_from("<ffi", buf, 4)
+                self.set_target(target_vel, target_pos, mode)
+                buf.clear()
+            elif self._pack_type == 1 and cursor == 20:
+                kp, ki, kd, pid_type = struct.unpack_from("<fffi", buf, 4)
+                self.set_pid(kp, ki, kd, pid_type)
+                buf.clear()
+            elif self._pack_type == 2 and cursor == 12:
+                self.set_protocol(*buf[4:9])
+                buf.clear()
+        return len(data)
+
+    def run(self, steps=None, duration=None, cmd_mode=None, cmd_vel=None, cmd_pos=None):
+        """模擬 steps 個 1 ms 迴圈 (或 duration 秒), 回傳 REPORT_DTYPE 回報陣列
+
+        cmd_* 可給每一步的 control_t 序列 (cmd_mode < 0 代表沒有封包), 例如串流軌跡。
+        """
+        if steps is None:
+            steps = int(round(duration * 1000 / LOOP_DT)) if duration is not None else len(cmd_mode)
+        if cmd_mode is None:
+            cmd_mode = np.full(steps, -1, dtype=np.int64)
+            cmd_vel = np.zeros(steps)
+            cmd_pos = np.zeros(steps)
+        else:
+            cmd_mode = np.asarray(cmd_mode, dtype=np.int64)
+            cmd_vel = np.asarray(cmd_vel, dtype=np.float64)
+            cmd_pos = np.asarray(cmd_pos, dtype=np.float64)
+        if self._command is not None and steps > 0:
+            # handle_serial() 在第一個迴圈結束時套用
+            cmd_mode = cmd_mode.copy()
+            cmd_vel = cmd_vel.copy()
+            cmd_pos = cmd_pos.copy()
+            cmd_mode[0], cmd_vel[0], cmd_pos[0] = self._command
+            self._command = None
+
+        out = np.empty((steps // self.down_sample + 1, 8), dtype=np.float32)
+        n = _simulate(
+            self.state,
+            self.gains,
+            self.plant.as_array(),
+            self._delay_line,
+            cmd_mode,
+            cmd_vel,
+            cmd_pos,
+            self.down_sample,
+            out,
+        )
+        self.steps += steps
+        return _to_reports(out[:n])
+
+    def frames(self, steps=None, duration=None):
+        """模擬並回傳與實機相同的位元組串 (v1: 36 byte status_report_t, v2: 批次 frame)"""
+        start = self.steps
+        first = max(self.down_sample - int(self.state[S_SAMPLE]), 1)
+        reports = self.run(steps, duration)
+        # 回報在迴圈計數達到 down_sample 時送出, 時間戳記為該迴圈的開始時間
+        time_us = (start + first - 1 + np.arange(len(reports)) * self.down_sample) * LOOP_DT * 1000
+        if self.protocol == PROTOCOL_V1:
+            return encode_reports(reports)
+        if self.steps - self._session_step >= SESSION_INTERVAL // LOOP_DT:
+            self._send_session()
+        session, self._session = self._session, b""
+        # 湊滿 batch 筆才送出一個 frame
+        reports = np.concatenate([self._batch_reports, reports])
+        time_us = np.concatenate([self._batch_time, time_us])
+        full = len(reports) // self.batch * self.batch
+        if self.encoding == ENCODING_INT16:
+            data = encode_frames_compact(
+                reports[:full], time_us[:full] & 0xFFFFFFFF, self.seq, self.batch, self.field_mask
+            )
+        else:
+            data = encode_frames_v2(reports[:full], time_us[:full] & 0xFFFFFFFF, self.seq, self.batch)
+        self.seq = (self.seq + full) & 0xFFFFFFFF
+        self._batch_reports = reports[full:]
+        self._batch_time = time_us[full:]
+        return session + data
+
+
+def _to_reports(values):
+    reports = np.zeros(len(values), dtype=REPORT_DTYPE)
+    for k, name in enumerate(REPORT_FIELDS):
+        reports[name] = values[:, k]
+    reports["ident"] = np.frombuffer(REPORT_IDENT, dtype=np.uint8)
+    return reports
+
+
+class SimulatedSerial:
+    """以 FirmwareSimulator 即時模擬的序列埠, 介面與 serial.Serial 相容
+
+    read() 依實際經過時間推進模擬, 讓 GUI 不接硬體也能用同一條接收/傳送路徑。
+    """
+
+    def __init__(self, simulator=None):
+        self.simulator = simulator or FirmwareSimulator()
+        self.port = "Simulator"
+        self.is_open = True
+        self._lock = threading.Lock()
+        self._out = bytearray()
+        self._last_time = time.perf_counter()
+
+    def _advance(self):
+        now = time.perf_counter()
+        steps = int((now - self._last_time) * 1000 / LOOP_DT)
+        if steps > 0:
+            self._last_time += steps * LOOP_DT / 1000
+            self._out += self.simulator.frames(steps)
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            self._advance()
+            return len(self._out)
+
+    def read(self, size=1):
+        while self.is_open:
+            with self._lock:
+                self._advance()
+                if len(self._out) >= size:
+                    data = bytes(self._out[:size])
+                    del self._out[:size]
+                    return data
+            time.sleep(LOOP_DT / 1000 * self.simulator.down_sample)
+        return b""
+
+    def write(self, data):
+        with self._lock:
+            self._advance()
+            return self.simulator.write(data)
+
+    def close(self):
+        self.is_open = False
@@ -0,0 +1,20 @@
+import time
+
+# 行程啟動後盡早匯入, 以此為 0 點
+_start = time.perf_counter()
+_marks = []
+
+
+def mark(name):
+    """記錄一個啟動階段完成的時間"""
+    _marks.append((name, time.perf_counter()))
+
+
+def report():
+    """各階段耗時與累計時間 (ms) 的文字表格"""
+    lines = [f"{'階段':<14}{'耗時':>9}{'累計':>9}  (ms)"]
+    last = _start
+    for name, t in sorted(_marks, key=lambda m: m[1]):
+        lines.append(f"{name:<14}{(t - last) * 1000:>9.1f}{(t - _start) * 1000:>9.1f}")
+        last = t
+    return "\n".join(lines)
@@ -0,0 +1,249 @@
+import csv
+import math
+
+import numpy as np
+
+from jit import njit
+
+# 設定點變化超過此值才視為新的步階 (小於 min_step 的變化, 例如軌跡串流, 只結束目前的步階)
+TARGET_EPS = 1e-4
+# 安定帶 (步階大小的比例)
+SETTLE_BAND = 0.02
+# 連續停留在安定帶內多久才算安定 (秒)
+SETTLE_HOLD = 0.3
+# 保存的步階結果筆數
+STEP_HISTORY = 1024
+# 各控制模式要分析的 (設定點, 輸出) 欄位與最小步階
+CHANNELS = {
+    "position": ("target_pos", "pos", 1.0),  # mm
+    "velocity": ("target_vel", "vel", 5.0),  # mm/s
+}
+
+# 每個步階的結果
+STEP_FIELDS = (
+    "time",  # 步階開始時間 (s)
+    "start",  # 步階開始時的輸出值
+    "target",
+    "rise_time",  # 10% -> 90% (s)
+    "overshoot",  # 峰值超越量 (%)
+    "settling_time",  # 進入並停留在安定帶的時間 (s), 未安定為 NaN
+    "ss_error",  # 安定後的平均誤差 (目標 - 輸出)
+    "iae",
+    "ise",
+    "settled",
+)
+R_TIME, R_START, R_TARGET, R_RISE, R_OVERSHOOT, R_SETTLING, R_SS_ERROR, R_IAE, R_ISE, R_SETTLED = range(10)
+STEP_DTYPE = np.dtype([(name, "<f8") for name in STEP_FIELDS])
+
+# 狀態向量索引
+(
+    S_INIT,
+    S_ACTIVE,
+    S_COUNT,
+    S_LAST_T,
+    S_LAST_TARGET,
+    S_T0,
+    S_Y0,
+    S_TARGET,
+    S_T10,
+    S_T90,
+    S_PEAK,
+    S_LAST_OUT,
+    S_IN_SUM,
+    S_IN_N,
+    S_IAE,
+    S_ISE,
+) = range(16)
+STATE_SIZE = 16
+
+
+@njit(cache=True)
+def _finish(state, results, settled):
+    """把目前的步階寫入結果環形陣列"""
+    row = int(state[S_COUNT]) % results.shape[0]
+    t0 = state[S_T0]
+    results[row, R_TIME] = t0
+    results[row, R_START] = state[S_Y0]
+    results[row, R_TARGET] = state[S_TARGET]
+    results[row, R_RISE] = state[S_T90] - state[S_T10]
+    results[row, R_OVERSHOOT] = max(state[S_PEAK] - 1.0, 0.0) * 100.0
+    if settled:
+        results[row, R_SETTLING] = state[S_LAST_OUT] - t0
+        results[row, R_SS_ERROR] = state[S_IN_SUM] / max(state[S_IN_N], 1.0)
+    else:
+        results[row, R_SETTLING] = math.nan
+        results[row, R_SS_ERROR] = math.nan
+    results[row, R_IAE] = state[S_IAE]
+    results[row, R_ISE] = state[S_ISE]
+    results[row, R_SETTLED] = 1.0 if settled else 0.0
+    state[S_COUNT] += 1
+    state[S_ACTIVE] = 0
+
+
+@njit(cache=True)
+def _analyze(state, params, time, target, value, results):
+    """逐筆更新步階狀態 (每筆 O(1), 不配置記憶體), 回傳完成的步階數
+
+    params: [min_step, settle_band, settle_hold]
+    """
+    min_step, band, hold = params[0], params[1], params[2]
+    done = 0
+    for k in range(len(time)):
+        t = time[k]
+        r = target[k]
+        y = value[k]
+        if state[S_INIT] == 0:
+            state[S_INIT] = 1
+            state[S_LAST_T] = t
+            state[S_LAST_TARGET] = r
+            continue
+
+        # 設定點改變: 結束目前的步階, 夠大的變化開始新的步階
+        if abs(r - state[S_LAST_TARGET]) > TARGET_EPS:
+            state[S_LAST_TARGET] = r
+            if state[S_ACTIVE] != 0:
+                _finish(state, results, False)
+                done += 1
+            if abs(r - y) >= min_step:
+                state[S_ACTIVE] = 1
+                state[S_T0] = t
+                state[S_Y0] = y
+                state[S_TARGET] = r
+                state[S_T10] = math.nan
+                state[S_T90] = math.nan
+                state[S_PEAK] = 0.0
+                state[S_LAST_OUT] = t
+                state[S_IN_SUM] = 0.0
+                state[S_IN_N] = 0.0
+                state[S_IAE] = 0.0
+                state[S_ISE] = 0.0
+
+        if state[S_ACTIVE] != 0:
+            dt = t - state[S_LAST_T]
+            err = r - y
+            state[S_IAE] += abs(err) * dt
+            state[S_ISE] += err * err * dt
+            # 正規化進度: 0 為步階開始, 1 為到達目標
+            p = (y - state[S_Y0]) / (r - state[S_Y0])
+            if p >= 0.1 and math.isnan(state[S_T10]):
+                state[S_T10] = t
+            if p >= 0.9 and math.isnan(state[S_T90]):
+                state[S_T90] = t
+            state[S_PEAK] = max(state[S_PEAK], p)
+            if abs(err) > band * abs(r - state[S_Y0]):
+                state[S_LAST_OUT] = t
+                state[S_IN_SUM] = 0.0
+                state[S_IN_N] = 0.0
+            else:
+                state[S_IN_SUM] += err
+                state[S_IN_N] += 1
+                if t - state[S_LAST_OUT] >= hold and not math.isnan(state[S_T90]):
+                    _finish(state, results, True)
+                    done += 1
+        state[S_LAST_T] = t
+    return done
+
+
+class StepAnalyzer:
+    """即時步階響應分析: 偵測設定點變化, 逐筆累計上升時間、超越量、安定時間、穩態誤差與 IAE/ISE
+
+    feed() 在接收執行緒呼叫, 每批資料只執行一次 numba 迴圈, 狀態與結果都在預先配置的陣列中。
+    步階在停留於安定帶 settle_hold 秒後完成, 或在下一次設定點變化時以未安定結束。
+    """
+
+    def __init__(self, mode="position", min_step=None, settle_band=SETTLE_BAND, settle_hold=SETTLE_HOLD, history=STEP_HISTORY):
+        self.target_field, self.value_field, default_step = CHANNELS[mode]
+        self.mode = mode
+        self.params = np.array(
+            [default_step if min_step is None else min_step, settle_band, settle_hold], dtype=np.float64
+        )
+        self.state = np.zeros(STATE_SIZE, dtype=np.float64)
+        self._results = np.full((history, len(STEP_FIELDS)), np.nan)
+
+    @property
+    def count(self):
+        """已完成的步階數"""
+        return int(self.state[S_COUNT])
+
+    @property
+    def active(self):
+        return self.state[S_ACTIVE] != 0
+
+    def feed(self, records):
+        """records: TELEMETRY_DTYPE 陣列, 回傳這批資料中完成的步階數"""
+        if not len(records):
+            return 0
+        return _analyze(
+            self.state,
+            self.params,
+            records["time"],
+            records[self.target_field],
+            records[self.value_field],
+            self._results,
+        )
+
+    def current(self):
+        """進行中的步階 (到目前為止的數值), 沒有時回傳 None"""
+        s = self.state.copy()
+        if s[S_ACTIVE] == 0:
+            return None
+        out = np.zeros((), dtype=STEP_DTYPE)
+        out["time"] = s[S_T0]
+        out["start"] = s[S_Y0]
+        out["target"] = s[S_TARGET]
+        out["rise_time"] = s[S_T90] - s[S_T10]
+        out["overshoot"] = max(s[S_PEAK] - 1.0, 0.0) * 100.0
+        out["settling_time"] = np.nan
+        out["ss_error"] = np.nan
+        out["iae"] = s[S_IAE]
+        out["ise"] = s[S_ISE]
+        out["settled"] = 0.0
+        return out
+
+    def results(self, since=None):
+        """已完成的步階 (由舊到新, STEP_DTYPE), since 為開始時間下限"""
+        count = self.count
+        history = len(self._results)
+        n = min(count, history)
+        rows = self._results[(count - n + np.arange(n)) % history]
+        out = np.zeros(n, dtype=STEP_DTYPE)
+        for k, name in enumerate(STEP_FIELDS):
+            out[name] = rows[:, k]
+        if since is not None:
+            out = out[out["time"] >= since]
+        return out
+
+    def last(self):
+        results = self.results()
+        return results[-1] if len(results) else None
+
+    def save(self, path, since=None):
+        """把步階結果寫成 CSV"""
+        results = self.results(since)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(STEP_FIELDS)
+            writer.writerows(results.tolist())
+        return len(results)
+
+    def reset(self):
+        self.state[:] = 0
+        self._results[:] = np.nan
+
+
+def format_step(step, running=False):
+    """狀態列顯示用的文字"""
+    if step is None:
+        return "步階: -"
+
+    def fmt(value, unit, digits=3):
+        return "-" if np.isnan(value) else f"{value:.{digits}f}{unit}"
+
+    text = (
+        f"上升 {fmt(step['rise_time'], ' s')}  超越 {fmt(step['overshoot'], '%', 1)}  "
+        f"安定 {fmt(step['settling_time'], ' s')}  穩態誤差 {fmt(step['ss_error'], '', 3)}  "
+        f"IAE {fmt(step['iae'], '', 2)}"
+    )
+    if running:
+        return text + " (進行中)"
+    return text if step["settled"] else text + " (未安定)"
@@ -0,0 +1,108 @@
+import threading
+
+import numpy as np
+
+# status_report_t 的欄位 (順序與 src/main.cpp 相同)
+REPORT_FIELDS = ("vel", "pos", "target_vel", "target_pos", "output", "p", "i", "d")
+
+# 緩衝區的資料格式: 繪圖時間軸 + 主機接收時間 + status_report_t 全部欄位
+TELEMETRY_DTYPE = np.dtype(
+    [("time", "<f8"), ("host_time", "<f8")] + [(name, "<f4") for name in REPORT_FIELDS]
+)
+
+
+class TelemetryBuffer:
+    """預先配置的 NumPy 環形緩衝區, O(1) 寫入, 讀取時回傳不複製的有序視圖
+
+    內部陣列長度為 2 * capacity, 每筆資料同時寫在 i 與 i + capacity,
+    因此任何時候最近 capacity 筆資料都是一段連續記憶體, 可以直接切片給圖表使用。
+    """
+
+    def __init__(self, capacity=1000):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = int(capacity)
+        self._data = np.zeros(2 * self.capacity, dtype=TELEMETRY_DTYPE)
+        self._head = 0  # 下一筆資料寫入的位置
+        self._size = 0
+        self.total = 0  # 累計寫入筆數 (不受容量限制)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def append(self, time_value, host_time, report):
+        """寫入一筆資料, report 為 status_report_t 的 8 個欄位"""
+        row = (time_value, host_time, *report[: len(REPORT_FIELDS)])
+        head = self._head
+        self._data[head] = row
+        self._data[head + self.capacity] = row
+        self._advance(1)
+
+    def extend(self, records):
+        """一次寫入多筆資料, records 為 TELEMETRY_DTYPE 的結構化陣列"""
+        n = len(records)
+        if n == 0:
+            return
+        if n > self.capacity:
+            records = records[-self.capacity :]
+            self.total += n - self.capacity
+            n = self.capacity
+        head = self._head
+        cap = self.capacity
+        # 主區段 [head, head + n) 一定落在 2 * capacity 之內
+        self._data[head : head + n] = records
+        # 鏡像區段: 落在前半部的寫到後半部, 落在後半部的寫回前半部
+        first = min(n, cap - head)
+        if first > 0:
+            self._data[head + cap : head + cap + first] = records[:first]
+        if n > first:
+            start = head + first - cap
+            self._data[start : start + n - first] = records[first:]
+        self._advance(n)
+
+    def extend_reports(self, time_values, host_time, reports):
+        """寫入解碼後的 status_report_t 陣列 (任何含 REPORT_FIELDS 欄位的結構化陣列)
+
+        回傳寫入的 TELEMETRY_DTYPE 陣列, 方便記錄器等下游重複使用。
+        """
+        records = np.empty(len(reports), dtype=TELEMETRY_DTYPE)
+        records["time"] = time_values
+        records["host_time"] = host_time
+        for name in REPORT_FIELDS:
+            records[name] = reports[name]
+        self.extend(records)
+        return records
+
+    def _advance(self, n):
+        with self.lock:
+            self._head = (self._head + n) % self.capacity
+            self._size = min(self._size + n, self.capacity)
+            self.total += n
+
+    def view(self, field=None, last=None):
+        """依時間順序回傳最近的資料視圖 (不複製)
+
+        field 為欄位名稱時只回傳該欄位; last 限制回傳最近幾筆。
+        """
+        with self.lock:
+            end = self._head + self.capacity
+            size = self._size
+        if last is not None:
+            size = min(size, last)
+        data = self._data[end - size : end]
+        return data if field is None else data[field]
+
+    def window(self):
+        """回傳 (全部資料的有序視圖, 第一筆的累計序號), 兩者在同一次鎖定內取得"""
+        with self.lock:
+            end = self._head + self.capacity
+            size = self._size
+            start = self.total - size
+        return self._data[end - size : end], start
+
+    def clear(self):
+        with self.lock:
+            self._head = 0
+            self._size = 0
+            self.total = 0
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import identify
+from protocol import VELOCITY_MODE, POSITION_MODE
+from simulator import FirmwareSimulator, PlantModel, LOOP_DT
+from telemetry_buffer import TELEMETRY_DTYPE, REPORT_FIELDS
+
+
+def velocity_steps(plant, seed=0, hold=0.5, pairs=8):
+    """以模擬器 (韌體預設速度 PID, 1 kHz 回報) 錄製正負交替的閉迴路速度步階"""
+    rng = np.random.default_rng(seed)
+    sim = FirmwareSimulator(plant, down_sample=1)
+    # 先移到行程中間, 避免碰到原點開關
+    sim.set_target(0, 100, POSITION_MODE)
+    sim.run(duration=2.0)
+    chunks = []
+    for _ in range(pairs):
+        vel = rng.uniform(20, 100)
+        for sign in (1, -1):
+            sim.set_target(sign * vel, 0, VELOCITY_MODE)
+            chunks.append(sim.run(duration=hold))
+    reports = np.concatenate(chunks)
+    records = np.zeros(len(reports), dtype=TELEMETRY_DTYPE)
+    records["time"] = np.arange(len(reports)) * LOOP_DT / 1000
+    for name in REPORT_FIELDS:
+        records[name] = reports[name]
+    return records
+
+
+@pytest.mark.parametrize("delay", [0.0, 0.005])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_fit_fopdt_recovers_closed_loop_plant(delay, seed):
+    plant = PlantModel(gain=1.5, tau=0.06, deadband=20, delay=delay)
+    model = identify.fit_fopdt(velocity_steps(plant, seed=seed))
+    assert model["gain"] == pytest.approx(plant.gain, rel=0.05)
+    assert model["tau"] == pytest.approx(plant.tau, rel=0.05)
+    assert model["delay"] == pytest.approx(plant.delay, abs=LOOP_DT / 2000)
+    # 量化雜訊經回授與 PWM 相關, 死區容許數個 PWM 的偏差
+    assert model["deadband"] == pytest.approx(plant.deadband, abs=3.0)
+    assert model["fit"] > 90
+
+
+def test_fit_fopdt_rejects_log_without_excitation():
+    records = np.zeros(2000, dtype=TELEMETRY_DTYPE)
+    records["time"] = np.arange(len(records)) * LOOP_DT / 1000
+    with pytest.raises(ValueError, match="excitation"):
+        identify.fit_fopdt(records)
+
+
+def test_fit_fopdt_rejects_short_log():
+    plant = PlantModel(gain=1.5, tau=0.06, deadband=20)
+    with pytest.raises(ValueError, match="not enough samples"):
+        identify.fit_fopdt(velocity_steps(plant)[:100])
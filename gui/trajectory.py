@@ -0,0 +1,173 @@
+import threading
+import time
+
+import numpy as np
+
+from protocol import (
+    MIN_VEL,
+    MAX_VEL,
+    MIN_POS,
+    MAX_POS,
+    VELOCITY_MODE,
+    POSITION_MODE,
+    pack_control,
+)
+from serial_tx import TARGET_KEY
+
+# 預設的設定點串流頻率 (Hz)
+DEFAULT_RATE = 200
+
+
+def constrain_vel(values):
+    """與韌體 constrain_vel() 相同: |v| <= MIN_VEL 歸零, 其餘限制在 [MIN_VEL, MAX_VEL]"""
+    values = np.asarray(values, dtype=float)
+    magnitude = np.clip(np.abs(values), MIN_VEL, MAX_VEL)
+    return np.where(np.abs(values) > MIN_VEL, np.sign(values) * magnitude, 0.0)
+
+
+def constrain_pos(values):
+    """限制在韌體允許的位置範圍 [MIN_POS, MAX_POS]"""
+    return np.clip(np.asarray(values, dtype=float), MIN_POS, MAX_POS)
+
+
+def constrain(values, mode):
+    return constrain_pos(values) if mode == POSITION_MODE else constrain_vel(values)
+
+
+def _move(start, end, max_vel, accel, rate, smooth):
+    distance = abs(end - start)
+    if max_vel <= 0 or accel <= 0:
+        raise ValueError("max_vel and accel must be positive")
+    if distance == 0:
+        return constrain_pos([end])
+    vel = min(max_vel, MAX_VEL)
+    # S 曲線 (升餘弦速度) 的峰值加速度是平均值的 pi/2 倍
+    k = np.pi / 2 if smooth else 1.0
+    if k * vel * vel / accel > distance:
+        # 到不了最高速, 變成三角形速度曲線
+        vel = np.sqrt(distance * accel / k)
+    t_acc = k * vel / accel
+    t_const = (distance - vel * t_acc) / vel
+    total = 2 * t_acc + t_const
+
+    def ramp(tau):
+        # 加速段走過的距離
+        if smooth:
+            return vel / 2 * (tau - t_acc / np.pi * np.sin(np.pi * tau / t_acc))
+        return vel / (2 * t_acc) * tau * tau
+
+    t = np.minimum(np.arange(int(np.ceil(total * rate)) + 1) / rate, total)
+    x = np.where(
+        t < t_acc,
+        ramp(np.minimum(t, t_acc)),
+        np.where(
+            t < t_acc + t_const,
+            vel * t_acc / 2 + vel * (t - t_acc),
+            distance - ramp(np.clip(total - t, 0, t_acc)),
+        ),
+    )
+    return constrain_pos(start + np.sign(end - start) * x)
+
+
+def trapezoid(start, end, max_vel, accel, rate=DEFAULT_RATE):
+    """梯形速度曲線的點到點位置軌跡"""
+    return _move(start, end, max_vel, accel, rate, smooth=False)
+
+
+def s_curve(start, end, max_vel, accel, rate=DEFAULT_RATE):
+    """S 曲線 (升餘弦加速) 的點到點位置軌跡, 加速度連續"""
+    return _move(start, end, max_vel, accel, rate, smooth=True)
+
+
+def sine_sweep(center, amplitude, freqs, cycles=3, rate=DEFAULT_RATE, mode=POSITION_MODE):
+    """步進正弦掃頻: 每個頻率各跑 cycles 個週期"""
+    segments = []
+    for f in freqs:
+        t = np.arange(int(round(cycles / f * rate))) / rate
+        segments.append(np.sin(2 * np.pi * f * t))
+    return constrain(center + amplitude * np.concatenate(segments), mode)
+
+
+def chirp(center, amplitude, f0, f1, duration, rate=DEFAULT_RATE, method="linear", mode=POSITION_MODE):
+    """連續掃頻 (線性或對數), 頻率從 f0 變化到 f1"""
+    t = np.arange(int(round(duration * rate))) / rate
+    if method == "linear":
+        phase = 2 * np.pi * (f0 * t + (f1 - f0) * t * t / (2 * duration))
+    elif method == "log":
+        k = f1 / f0
+        phase = 2 * np.pi * f0 * duration / np.log(k) * (k ** (t / duration) - 1)
+    else:
+        raise ValueError(f"unknown chirp method: {method}")
+    return constrain(center + amplitude * np.sin(phase), mode)
+
+
+def multisine(center, amplitude, freqs, duration, rate=DEFAULT_RATE, mode=POSITION_MODE):
+    """多頻正弦激勵: 各頻率等振幅, Schroeder 相位降低峰值因數, 峰值正規化為 amplitude
+
+    頻率宜取 1 / 週期 的整數倍, 重複播放時訊號連續。
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    t = np.arange(int(round(duration * rate))) / rate
+    k = np.arange(1, len(freqs) + 1)
+    phases = -np.pi * k * (k - 1) / len(freqs)
+    values = np.sin(2 * np.pi * freqs[:, None] * t + phases[:, None]).sum(axis=0)
+    return constrain(center + amplitude * values / np.max(np.abs(values)), mode)
+
+
+class TrajectoryStreamer:
+    """以固定頻率把預先計算好的設定點送給韌體
+
+    每個設定點依絕對時間排程, 不會累積誤差;
+    傳送佇列積壓超過 max_backlog 時跳過該點, 避免越送越落後。
+    """
+
+    def __init__(self, transmitter, max_backlog=4):
+        self.transmitter = transmitter
+        self.max_backlog = max_backlog
+        self.thread = None
+        self._stop = threading.Event()
+        self.sent = 0
+        self.skipped = 0
+        self.max_jitter = 0.0  # 秒
+
+    @property
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, values, mode, rate=DEFAULT_RATE, on_done=None):
+        self.stop()
+        self._stop.clear()
+        self.sent = 0
+        self.skipped = 0
+        self.max_jitter = 0.0
+        self.thread = threading.Thread(
+            target=self._run, args=(np.asarray(values), mode, rate, on_done), daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.is_running and threading.current_thread() is not self.thread:
+            self.thread.join()
+
+    def _run(self, values, mode, rate, on_done):
+        t0 = time.perf_counter()
+        for i, value in enumerate(values):
+            due = t0 + i / rate
+            remaining = due - time.perf_counter()
+            # 不忙等, 以免和傳送/接收執行緒搶 GIL
+            if self._stop.wait(max(remaining, 0)):
+                return
+            self.max_jitter = max(self.max_jitter, time.perf_counter() - due)
+
+            if self.transmitter.backlog() > self.max_backlog:
+                self.skipped += 1
+                continue
+            if mode == POSITION_MODE:
+                data = pack_control(0, value, POSITION_MODE)
+            else:
+                data = pack_control(value, 0, VELOCITY_MODE)
+            self.transmitter.submit(data, key=TARGET_KEY)
+            self.sent += 1
+        if on_done is not None:
+            on_done()
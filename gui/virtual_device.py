@@ -0,0 +1,163 @@
+import argparse
+import os
+import select
+import threading
+import time
+import tty
+
+import numpy as np
+
+from protocol import REPORT_SIZE
+from simulator import FirmwareSimulator, DOWN_SAMPLE
+
+# 921600 baud, 8N1 每個位元組 10 bits
+LINE_RATE = 921600 / 10 / REPORT_SIZE
+
+
+def inject_errors(data, bit_error_rate, drop_rate, rng):
+    """對一段位元組隨機翻轉位元與丟棄位元組, 回傳 (資料, 翻轉數, 丟棄數)"""
+    if not bit_error_rate and not drop_rate:
+        return data, 0, 0
+    buf = np.frombuffer(data, dtype=np.uint8).copy()
+    flips = 0
+    if bit_error_rate:
+        flips = rng.binomial(len(buf) * 8, bit_error_rate)
+        if flips:
+            bits = rng.integers(0, len(buf) * 8, flips)
+            np.bitwise_xor.at(buf, bits // 8, (1 << (bits % 8)).astype(np.uint8))
+    drops = 0
+    if drop_rate:
+        keep = rng.random(len(buf)) >= drop_rate
+        drops = len(buf) - int(np.count_nonzero(keep))
+        buf = buf[keep]
+    return buf.tobytes(), flips, drops
+
+
+class VirtualDevice:
+    """以虛擬終端 (pty) 模擬 Arduino 韌體, 供沒有接板子的機器測試/量測接收路徑
+
+    GUI 以 serial.Serial(device.port) 連線。收到的 control_t / pid_config_t 由
+    FirmwareSimulator 以與 handle_serial() 相同的方式解析, 並以 rate (Hz) 送出
+    status_report_t; rate 為 "line" 時以 921600 baud 的線速送出, 為 0 時不限速。
+    僅支援 POSIX (os.openpty)。
+    """
+
+    def __init__(
+        self,
+        rate=1000 / DOWN_SAMPLE,
+        bit_error_rate=0.0,
+        drop_rate=0.0,
+        simulator=None,
+        seed=None,
+    ):
+        self.rate = LINE_RATE if rate == "line" else float(rate)
+        self.bit_error_rate = bit_error_rate
+        self.drop_rate = drop_rate
+        self.simulator = simulator or FirmwareSimulator()
+        self.rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self.is_running = False
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+
+        # 統計
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.bit_flips = 0
+        self.dropped_bytes = 0
+        self.bytes_received = 0
+        self.last_write_time = 0.0
+
+    def start(self):
+        self.is_running = True
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.reader_thread = threading.Thread(target=self._reader_loop, daemon=True)
+        self.writer_thread.start()
+        self.reader_thread.start()
+        return self
+
+    def stop(self):
+        self.is_running = False
+        self.writer_thread.join()
+        self.reader_thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _frames(self, n):
+        with self._lock:
+            return self.simulator.frames(n * self.simulator.down_sample)
+
+    def _send(self, data):
+        data, flips, drops = inject_errors(data, self.bit_error_rate, self.drop_rate, self.rng)
+        view = memoryview(data)
+        while view and self.is_running:
+            # 對方沒讀時 pty 緩衝區會滿, 用 select 等待以便能停止
+            _, writable, _ = select.select([], [self.master], [], 0.1)
+            if writable:
+                try:
+                    view = view[os.write(self.master, view) :]
+                except BlockingIOError:
+                    pass
+        self.last_write_time = time.perf_counter()
+        self.bit_flips += flips
+        self.dropped_bytes += drops
+        self.bytes_sent += len(data)
+
+    def _writer_loop(self):
+        t0 = time.perf_counter()
+        while self.is_running:
+            if self.rate <= 0:
+                # 不限速: 大批次寫入, 由讀取端的速度決定吞吐量
+                n = 256
+            else:
+                n = int((time.perf_counter() - t0) * self.rate) - self.frames_sent
+                if n <= 0:
+                    time.sleep(min(0.001, 1 / self.rate))
+                    continue
+                n = min(n, 4096)
+            self._send(self._frames(n))
+            self.frames_sent += n
+
+    def _reader_loop(self):
+        while self.is_running:
+            readable, _, _ = select.select([self.master], [], [], 0.1)
+            if not readable:
+                continue
+            data = os.read(self.master, 4096)
+            self.bytes_received += len(data)
+            with self._lock:
+                self.simulator.write(data)
+
+    def stats(self):
+        return {
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "bit_flips": self.bit_flips,
+            "dropped_bytes": self.dropped_bytes,
+            "bytes_received": self.bytes_received,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="虛擬 PID 控制器 (pty)")
+    parser.add_argument("--rate", default=str(1000 / DOWN_SAMPLE), help='回報頻率 Hz, "line" 為線速, 0 不限速')
+    parser.add_argument("--ber", type=float, default=0.0, help="位元錯誤率")
+    parser.add_argument("--drop", type=float, default=0.0, help="位元組遺失率")
+    args = parser.parse_args()
+
+    rate = args.rate if args.rate == "line" else float(args.rate)
+    device = VirtualDevice(rate, args.ber, args.drop).start()
+    print(f"virtual device: {device.port} ({device.rate:.0f} Hz)")
+    try:
+        while True:
+            time.sleep(1)
+            print(device.stats())
+    except KeyboardInterrupt:
+        device.stop()
+
+
+if __name__ == "__main__":
+    main()
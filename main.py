@@ -1,10 +1,81 @@
-from PyQt5 import QtWidgets, QtGui, QtCore
+import argparse
+import os
 import sys
-Prog = QtWidgets.QApplication (sys.argv)
-# 視窗程式開始
-Main = QtWidgets.QWidget()
-#放入基底元件
-Main.show()
-sys.exit(Prog.exec_())
-#顯示元件
-# 視窗程式結束
\ No newline at end of file
+
+# gui/ 內的模組彼此以同層匯入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "gui"))
+import startup  # noqa: E402  啟動計時的 0 點
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PID 控制系統")
+    parser.add_argument(
+        "--backend",
+        choices=["qt", "tk", "dashboard", "headless"],
+        default="qt",
+        help="qt: pyqtgraph 高速繪圖, tk: Tk + matplotlib (gui_01_v4), dashboard: 多裝置監控, "
+        "headless: 無 GUI 長時間擷取",
+    )
+    parser.add_argument("--history", type=int, default=None, help="遙測歷史容量 (筆)")
+    parser.add_argument(
+        "--acquisition",
+        choices=["thread", "process", "asyncio"],
+        default="thread",
+        help="tk 後端的接收方式, process: 在獨立行程接收並以共享記憶體傳給 GUI, asyncio: 以協程整合 Tk 事件迴圈",
+    )
+    parser.add_argument("--profile-startup", action="store_true", help="tk 後端: 圖表載入完成後輸出各啟動階段耗時")
+    headless = parser.add_argument_group("headless 擷取")
+    headless.add_argument("--port", default="Simulator", help="序列埠, Simulator 為韌體模擬器")
+    headless.add_argument("--record", help="錄製檔 (.prec)")
+    headless.add_argument("--rotate", type=float, help="每隔幾秒換一個錄製檔 (檔名加上序號與時間)")
+    headless.add_argument("--script", help="設定點腳本, 每行「時間(s) pos|vel|pid 參數...」")
+    headless.add_argument("--loop", action="store_true", help="腳本結束後從頭重複")
+    headless.add_argument("--duration", type=float, help="執行秒數, 預設直到 Ctrl+C")
+    headless.add_argument("--stats-interval", type=float, default=5.0, help="統計輸出間隔 (秒)")
+    headless.add_argument("--batch", type=int, default=8, help="v2 每個 frame 的樣本數")
+    headless.add_argument("--encoding", choices=["float", "int16"], default="int16")
+    headless.add_argument("--down-sample", type=int, default=1, help="每幾個 1 ms 迴圈回報一次")
+    args = parser.parse_args()
+
+    if args.backend == "qt":
+        from PyQt5 import QtWidgets
+        import qt_backend
+
+        # 視窗程式開始
+        Prog = QtWidgets.QApplication(sys.argv)
+        Main = qt_backend.PIDControlQtGUI(args.history or qt_backend.HISTORY_SIZE)
+        Main.show()
+        sys.exit(Prog.exec_())
+        # 視窗程式結束
+    elif args.backend == "headless":
+        # 不匯入 Tk / matplotlib / Qt
+        import headless
+
+        headless.main(args)
+    elif args.backend == "dashboard":
+        from PyQt5 import QtWidgets
+        import dashboard
+
+        Prog = QtWidgets.QApplication(sys.argv)
+        Main = dashboard.MultiDeviceDashboard(args.history or dashboard.HISTORY_SIZE)
+        Main.show()
+        sys.exit(Prog.exec_())
+    else:
+        import tkinter as tk
+
+        startup.mark("tkinter")
+        # 模組層級只匯入 tkinter, matplotlib / numpy 在控制面板畫出後於背景載入
+        import gui_01_v4
+
+        startup.mark("gui module")
+        root = tk.Tk()
+        startup.mark("tk root")
+        app = gui_01_v4.PIDControlGUI(
+            root, args.history or gui_01_v4.HISTORY_SIZE, args.acquisition, args.profile_startup
+        )
+        root.protocol("WM_DELETE_WINDOW", app.on_closing)
+        app.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -18,8 +18,24 @@
 #define MAX_POS			(200.1f)	// mm
 
 #define REPORT_IDENT	{0xAA, 0xBB, 0xCC, 0xDD}
+#define FRAME_V2_IDENT	{0xAA, 0xBB, 0xCC, 0xD2}
+#define SESSION_IDENT	{0xAA, 0xBB, 0xCC, 0xD3}
+#define COMPACT_IDENT	{0xAA, 0xBB, 0xCC, 0xD4}
 #define CTRL_CFG_IDENT	(0xEE)
 #define PID_CFG_IDENT	(0xFF)
+#define PROTO_CFG_IDENT	(0xA0)
+
+#define PROTOCOL_V1		(1)		// 36 byte status_report_t
+#define PROTOCOL_V2		(2)		// frame_header_t + N * sample_t + crc16
+#define MAX_BATCH		(8)
+
+#define ENCODING_FLOAT	(0)		// sample_t
+#define ENCODING_INT16	(1)		// uint16 dt_us + int16 per masked field
+#define FIELD_COUNT		(8)
+#define FIELD_MASK_ALL	(0xFF)
+#define MAX_COMPACT_DOWN_SAMPLE	(60)	// dt_us must fit in uint16
+#define SESSION_INTERVAL	(1000)	// ms
+#define TX_SIZE			(512)	// power of 2
 
 #define VELOCITY_MODE	(0)
 #define POSITION_MODE	(1)
@@ -54,6 +70,73 @@ typedef struct {
 pid_config_t vel_cfg = {.ident = {0}, .kp = 10.0f, .ki = 0.1f, .kd = 0.0f, .type = 0};
 pid_config_t pos_cfg = {.ident = {0}, .kp = 20.0f, .ki = 0.1f, .kd = 10.0f, .type = 1};
 
+typedef struct {
+	uint8_t ident[4];
+	uint8_t version;
+	uint8_t batch;
+	uint8_t encoding;
+	uint8_t field_mask;	// bit k: k-th float of sample_t
+	uint8_t down_sample;	// 0: DOWN_SAMPLE
+	uint8_t reserved[3];
+}proto_cfg_t;	// 12 bytes
+
+typedef struct {
+	uint32_t time_us;
+	float vel;
+	float pos;
+	float target_vel;
+	float target_pos;
+	float output;
+	float p;
+	float i;
+	float d;
+}sample_t;
+
+typedef struct __attribute__((packed)) {
+	uint8_t ident[4];
+	uint32_t seq;	// first sample sequence number
+	uint16_t count;	// samples in this frame
+}frame_header_t;	// 10 bytes
+
+typedef struct __attribute__((packed)) {
+	uint8_t ident[4];
+	uint32_t seq;
+	uint16_t count;
+	uint32_t time_us;	// first sample, others add dt_us
+}compact_header_t;	// 14 bytes
+
+typedef struct __attribute__((packed)) {
+	uint8_t ident[4];
+	uint8_t encoding;
+	uint8_t field_mask;
+	uint8_t down_sample;
+	uint8_t reserved;
+	float scale[FIELD_COUNT];	// value = int16 * scale
+}session_t;	// 40 bytes + crc16
+
+// int16 fixed point scale per field (vel, pos, target_vel, target_pos, output, p, i, d)
+const float FIXED_SCALE[FIELD_COUNT] = {0.02f, 0.01f, 0.02f, 0.01f, 0.25f, 0.25f, 0.25f, 0.25f};
+const float FIXED_INV_SCALE[FIELD_COUNT] = {50.0f, 100.0f, 50.0f, 100.0f, 4.0f, 4.0f, 4.0f, 4.0f};
+
+#define FRAME_V2_SIZE	(sizeof(frame_header_t) + MAX_BATCH * sizeof(sample_t) + 2)
+
+uint8_t protocol = PROTOCOL_V1;
+uint8_t batch_size = 1;
+uint8_t encoding = ENCODING_FLOAT;
+uint8_t field_mask = FIELD_MASK_ALL;
+uint8_t report_down_sample = DOWN_SAMPLE;
+uint32_t sample_seq = 0;
+// frame being filled (crc updated per sample)
+uint8_t frame_buf[FRAME_V2_SIZE];
+uint16_t frame_len = 0;
+uint8_t frame_count = 0;
+uint16_t frame_crc = 0xFFFF;
+uint32_t frame_time = 0;
+// frames waiting to be sent, written without blocking the 1 ms loop
+uint8_t tx_ring[TX_SIZE];
+uint16_t tx_head = 0;
+uint16_t tx_tail = 0;
+
 volatile int8_t isr_encoder = 0;
 int32_t encoder = 0;
 float vel = 0;	// mm/s
@@ -112,6 +195,139 @@ float constrain_pos(float value) {
 }
 
 
+// CRC-16/CCITT-FALSE
+uint16_t crc16_update(uint16_t crc, uint8_t data) {
+	data ^= crc >> 8;
+	data ^= data >> 4;
+	return (crc << 8) ^ ((uint16_t)data << 12) ^ ((uint16_t)data << 5) ^ data;
+}
+
+uint16_t crc16_append(uint16_t crc, const uint8_t *data, uint16_t len) {
+	while(len--) {
+		crc = crc16_update(crc, *data++);
+	}
+	return crc;
+}
+
+// queue bytes for flush_tx(), all or nothing
+bool tx_push(const uint8_t *data, uint16_t len) {
+	if(TX_SIZE - (uint16_t)(tx_head - tx_tail) < len) {
+		return false;
+	}
+	while(len--) {
+		tx_ring[tx_head++ & (TX_SIZE - 1)] = *data++;
+	}
+	return true;
+}
+
+void flush_tx() {
+	uint16_t pending = tx_head - tx_tail;
+	if(pending == 0) {
+		return;
+	}
+	uint16_t start = tx_tail & (TX_SIZE - 1);
+	int n = min((int)pending, TX_SIZE - (int)start);
+	n = min(n, Serial.availableForWrite());
+	if(n > 0) {
+		Serial.write(tx_ring + start, n);
+		tx_tail += n;
+	}
+}
+
+void frame_begin(const void *header, uint16_t len) {
+	memcpy(frame_buf, header, len);
+	frame_len = len;
+	frame_crc = crc16_append(0xFFFF, frame_buf, len);
+}
+
+void frame_append(const void *data, uint16_t len) {
+	memcpy(frame_buf + frame_len, data, len);
+	frame_crc = crc16_append(frame_crc, frame_buf + frame_len, len);
+	frame_len += len;
+}
+
+void frame_end() {
+	memcpy(frame_buf + frame_len, &frame_crc, 2);
+	frame_len += 2;
+	// tx ring full: drop this frame (host sees a seq gap)
+	tx_push(frame_buf, frame_len);
+}
+
+void send_session() {
+	session_t session = {
+		.ident = SESSION_IDENT,
+		.encoding = encoding,
+		.field_mask = field_mask,
+		.down_sample = report_down_sample,
+		.reserved = 0,
+	};
+	memcpy(session.scale, FIXED_SCALE, sizeof(session.scale));
+	uint16_t crc = crc16_append(0xFFFF, (uint8_t*)&session, sizeof(session));
+	uint8_t buf[sizeof(session) + 2];
+	memcpy(buf, &session, sizeof(session));
+	memcpy(buf + sizeof(session), &crc, 2);
+	tx_push(buf, sizeof(buf));
+}
+
+void set_protocol(const proto_cfg_t *cfg) {
+	if(cfg->version != PROTOCOL_V1 && cfg->version != PROTOCOL_V2) {
+		return;
+	}
+	protocol = cfg->version;
+	batch_size = constrain(cfg->batch, 1, MAX_BATCH);
+	encoding = cfg->encoding == ENCODING_INT16 ? ENCODING_INT16 : ENCODING_FLOAT;
+	field_mask = cfg->field_mask ? cfg->field_mask : FIELD_MASK_ALL;
+	report_down_sample = cfg->down_sample ? cfg->down_sample : DOWN_SAMPLE;
+	if(encoding == ENCODING_INT16) {
+		report_down_sample = min((int)report_down_sample, MAX_COMPACT_DOWN_SAMPLE);
+	}
+	frame_count = 0;
+	if(protocol == PROTOCOL_V2) {
+		send_session();
+	}
+}
+
+int16_t to_fixed(float value, float inv_scale) {
+	value = constrain(value * inv_scale, -32767.0f, 32767.0f);
+	return lroundf(value);
+}
+
+void send_sample(const sample_t *sample) {
+	// start a new frame
+	if(frame_count == 0) {
+		if(encoding == ENCODING_INT16) {
+			compact_header_t header = {.ident = COMPACT_IDENT, .seq = sample_seq, .count = batch_size, .time_us = sample->time_us};
+			frame_begin(&header, sizeof(header));
+		}else {
+			frame_header_t header = {.ident = FRAME_V2_IDENT, .seq = sample_seq, .count = batch_size};
+			frame_begin(&header, sizeof(header));
+		}
+		frame_time = sample->time_us;
+	}
+	if(encoding == ENCODING_INT16) {
+		int16_t packed[1 + FIELD_COUNT];
+		uint8_t n = 0;
+		packed[n++] = (uint16_t)(sample->time_us - frame_time);
+		const float *values = &sample->vel;
+		for(uint8_t k = 0; k < FIELD_COUNT; k++) {
+			if(field_mask & (1 << k)) {
+				packed[n++] = to_fixed(values[k], FIXED_INV_SCALE[k]);
+			}
+		}
+		frame_append(packed, n * sizeof(int16_t));
+	}else {
+		frame_append(sample, sizeof(sample_t));
+	}
+	frame_time = sample->time_us;
+	sample_seq++;
+	if(++frame_count < batch_size) {
+		return;
+	}
+	frame_count = 0;
+	frame_end();
+}
+
+
 void handle_serial() {
 	static uint8_t serial_buffer[64] = {0};
 	static int serial_cursor = 0;
@@ -138,6 +354,9 @@ void handle_serial() {
 			}else if(n == PID_CFG_IDENT) {
 				pack_type = 1;
 				// Serial.println(F("pid pack type"));
+			// protocol pack
+			}else if(n == PROTO_CFG_IDENT) {
+				pack_type = 2;
 			// unknown type
 			}else {
 				serial_cursor = 0;
@@ -166,6 +385,11 @@ void handle_serial() {
 			}
 			serial_cursor = 0;
 			// Serial.println(F("pid pack ok"));
+		// is protocol pack
+		}else if(pack_type == 2 && serial_cursor == sizeof(proto_cfg_t)) {
+			proto_cfg_t *pack = (proto_cfg_t*)&serial_buffer;
+			set_protocol(pack);
+			serial_cursor = 0;
 		}
 	}
 }
@@ -240,7 +464,21 @@ void loop() {
 		drive_motor(vel_output);
 		/* report */
 		static int sample = 0;
-		if(++sample >= DOWN_SAMPLE) {
+		if(++sample >= report_down_sample && protocol == PROTOCOL_V2) {
+			sample = 0;
+			sample_t s = {
+				.time_us 	= last_update,
+				.vel 		= vel,
+				.pos 		= pos,
+				.target_vel = target_vel,
+				.target_pos = target_pos,
+				.output 	= vel_output,
+				.p 			= vel_p,
+				.i 			= vel_i,
+				.d			= 0,
+			};
+			send_sample(&s);
+		}else if(sample >= report_down_sample) {
 			sample = 0;
 			report = {
 				.vel 		= vel,
@@ -263,7 +501,14 @@ void loop() {
 	}else if(pos > 200 && target_vel > 0){
 		target_vel = 0;
 	}
+	/* session (host may connect or resync at any time) */
+	static uint32_t last_session = 0;
+	if(protocol == PROTOCOL_V2 && millis() - last_session >= SESSION_INTERVAL) {
+		last_session = millis();
+		send_session();
+	}
 	/* serial */
+	flush_tx();
 	handle_serial();
 	/* print */
 	// static uint32_t last_print = 0;